@@ -12,27 +12,217 @@ It provides a REST API endpoint that accepts different types of queries
 and processes them accordingly.
 """
 
+import asyncio
 import json
 import os
-import re
-import requests
+import select
 import threading
 import time
+from contextlib import closing
+from concurrent.futures import ThreadPoolExecutor
 from http.server import HTTPServer, BaseHTTPRequestHandler
-from typing import Dict, List, Any, Optional, Union
+from typing import Callable, Dict, List, Any, Optional, Tuple, Union
+
+from scripts.async_engine import AsyncEngine, DeadlineExceeded
+from scripts.llm_cache import MemoryCache, cache_from_config, make_cache_key
+from scripts.context_builder import context_builder_from_config
+from scripts.hybrid_search import reciprocal_rank_fusion, reranker_from_config
+from scripts.lexical_index import LexicalIndex
+from scripts.llm_client import pool_from_config
+from scripts.map_reduce import SummaryError, map_reduce_summarize, number_sections, split_numbered
+from scripts.metrics import CONTENT_TYPE, REGISTRY, stage, trace
+from scripts.query_router import RouteMatch, router_from_config
+from scripts.semantic_cache import semantic_cache_from_config
+from scripts.sessions import (Session, apply_compaction, current_session, session_store_from_config,
+                              summary_prompt, turns_to_fold, use_session)
+from scripts.single_flight import SingleFlight
+from scripts.vector_search import snapshot_documents, snapshot_version, vector_search_from_config
 
 # Configuration
 CONFIG = {
     "llm": {
         "base_url": "http://localhost:11434",
-        "model": "mistral"
+        "model": "mistral",
+        "connect_timeout": 3.05,
+        "read_timeout": 120,
+        # Retries for connection errors and 429/5xx overload responses
+        "max_retries": 2,
+        # Maximum requests in flight to each Ollama backend
+        "max_concurrency": 4,
+        # Ollama instances to balance generations across, as
+        # {"url": ..., "weight": 1.0, "models": [...]} entries ("models" lists
+        # the models an instance serves, default all); empty uses base_url
+        "backends": [],
+        # Seconds between backend health checks; 0 disables them
+        "health_check_interval": 10,
+        # Failed requests in a row that eject a backend, and the minimum
+        # seconds it stays ejected
+        "eject_after_failures": 3,
+        "eject_seconds": 30,
+        # Smaller model for prompts of at most small_model_max_chars sent
+        # by the listed handlers, or None to always use model
+        "small_model": None,
+        "small_model_handlers": ["summarize"],
+        "small_model_max_chars": 4000,
+        # Share one generation between identical calls made at the same time
+        "coalesce": True
+    },
+    "cache": {
+        "enabled": True,
+        # "memory" (LRU, lost on restart) or "sqlite" (persisted at sqlite_path)
+        "backend": "memory",
+        "max_entries": 1024,
+        "max_bytes": 64 * 1024 * 1024,
+        # Seconds before a cached response is regenerated; 0 keeps it forever
+        "ttl": 3600,
+        "sqlite_path": "llm_cache.sqlite3"
+    },
+    "semantic_cache": {
+        # Answer queries similar to an earlier one with its stored result
+        "enabled": True,
+        # Minimum cosine similarity between the two queries
+        "threshold": 0.92,
+        # "memory" (NumPy, per process) or "qdrant" (shared, at url)
+        "backend": "memory",
+        "max_entries": 1024,
+        "url": "http://localhost:6333",
+        "collection_name": "semantic_cache",
+        # Seconds before a cached answer is regenerated; 0 keeps it until
+        # the corpus changes
+        "ttl": 0,
+        # Seconds between checks of the ingested corpus version
+        "version_check_interval": 5.0
+    },
+    "sessions": {
+        # Conversations continued by passing "session_id" to /query
+        "enabled": True,
+        # Sessions kept, least recently used evicted first, and seconds an
+        # idle session is kept
+        "max_sessions": 1000,
+        "idle_timeout": 1800,
+        # Context tokens past which older turns are folded into the
+        # session summary, and the latest turns kept verbatim
+        "max_context_tokens": 2048,
+        "keep_turns": 2,
+        "chars_per_token": 4
+    },
+    "search": {
+        # "hybrid" runs lexical and vector search concurrently and fuses
+        # their rankings; "vector" searches Qdrant (or the local snapshot)
+        # and falls back to the lexical index when no vector index is
+        # reachable; "lexical" never leaves the process
+        "backend": "hybrid",
+        # Maximum documents returned by search_documents
+        "top_k": 5,
+        # Minimum cosine similarity for vector results
+        "score_threshold": 0.3,
+        # Seconds between checks for a re-ingested snapshot to rebuild the
+        # lexical index from
+        "lexical_reload_interval": 5.0,
+        "hybrid": {
+            # Results taken from each retriever before fusion
+            "candidates": 20,
+            # Reciprocal rank fusion constant and per-retriever weights
+            "rrf_k": 60,
+            "weights": {"lexical": 1.0, "vector": 1.0}
+        },
+        # Cross-encoder reranking of the fused candidates, scoring at most
+        # max_candidates per query within latency_budget seconds
+        "rerank": {
+            "enabled": False,
+            "model": "cross-encoder/ms-marco-MiniLM-L-6-v2",
+            "batch_size": 16,
+            "max_candidates": 20,
+            "latency_budget": 0.25
+        }
+    },
+    "context": {
+        # Search results considered for a search prompt, and the token
+        # budget they are packed into (highest scores first)
+        "candidates": 5,
+        "max_tokens": 1000,
+        # Chunks sharing at least this many characters with a selected
+        # chunk of the same source are merged into it
+        "min_overlap": 50,
+        "chars_per_token": 4
+    },
+    "summarize": {
+        # "map_reduce" summarizes every search result in context-sized
+        # batches; "single" concatenates the top two into one prompt
+        "mode": "map_reduce",
+        "max_documents": 20,
+        # Context window of the LLM and the part of it kept for the
+        # instructions and the generated summary
+        "context_tokens": 4096,
+        "reserve_tokens": 1024,
+        # Token counts are estimated from character counts
+        "chars_per_token": 4,
+        # Map summaries memoized per search result, by content and model
+        "memo_entries": 4096
+    },
+    "router": {
+        # Checked in order; the first route with a keyword in the query wins
+        # and the topic is the text after that keyword. handler is one of
+        # "general", "search" or "summarize"; system_prompt overrides the
+        # handler's default. Set routes_path to load the list from a JSON file.
+        "routes": [
+            {
+                "name": "search",
+                "handler": "search",
+                "keywords": ["find", "search", "look for", "documents about", "information on"],
+                "examples": ["find documents about neural networks", "what do we have on computer vision"]
+            },
+            {
+                "name": "summarize",
+                "handler": "summarize",
+                "keywords": ["summarize", "summary", "summarization", "brief overview"],
+                "examples": ["give me the gist of natural language processing", "tl;dr of machine learning"]
+            }
+        ],
+        # Route queries with no keyword by similarity to the route examples
+        "embedding": {
+            "enabled": False,
+            "threshold": 0.5
+        }
     },
     "vectordb": {
         "url": "http://localhost:6333",
-        "collection_name": "documents"
+        "collection_name": "documents",
+        "embedding_model": "sentence-transformers/all-MiniLM-L6-v2",
+        "embedding_cache_size": 1024,
+        # Seconds before retrying a failed embedding model load, doubled
+        # after each further failure
+        "embedding_retry_seconds": 30,
+        "timeout": 5.0,
+        # Qdrant search params; with a quantized collection, oversample
+        # candidates and rescore them with the original vectors
+        "search_params": {"quantization": {"rescore": True, "oversampling": 2.0}},
+        # Snapshot directory written by scripts/ingest_documents.py, searched
+        # with NumPy when Qdrant is unavailable
+        "snapshot_path": "data/vector_snapshot",
+        # Candidates per result rescored exactly in snapshots with PQ codes
+        "pq_rerank": 10
     },
     "server": {
-        "port": 8080
+        "port": 8080,
+        # Connections served concurrently; each keep-alive connection holds
+        # a worker until it is closed, so connections are closed as soon as
+        # another one is waiting for a worker
+        "max_workers": 8,
+        # Connections allowed to wait for a worker before new ones get a 503
+        "max_queue": 32,
+        # Seconds an idle keep-alive connection may hold a worker
+        "keep_alive_timeout": 5,
+        # Requests served on one connection before it is closed
+        "max_keep_alive_requests": 100,
+        # Queries per /query/batch request and LLM calls it runs at once
+        "max_batch_size": 1000,
+        "batch_parallelism": 4,
+        # Seconds a request may run before its LLM calls are cancelled;
+        # a request can ask for less with "timeout"
+        "request_timeout": 120,
+        # Threads for blocking pipeline stages (LLM calls, searches)
+        "pipeline_workers": 32
     }
 }
 
@@ -55,6 +245,138 @@ SAMPLE_DOCUMENTS = [
     }
 ]
 
+def load_document_index(snapshot_path: Optional[str]) -> Tuple[LexicalIndex, bool]:
+    """
+    A lexical index over the ingested chunks of the vector snapshot, so it
+    searches the same corpus as vector search, and True; or over the
+    sample documents, and False, when nothing was ingested.
+    """
+    documents = snapshot_documents(snapshot_path) if snapshot_path else None
+    index = LexicalIndex()
+    index.add_documents(documents if documents is not None else SAMPLE_DOCUMENTS)
+    return index, documents is not None
+
+# Lexical index, rebuilt by document_index() when the snapshot changes
+DOCUMENT_INDEX, DOCUMENT_INDEX_INGESTED = load_document_index(CONFIG['vectordb']['snapshot_path'])
+_document_index_version = snapshot_version(CONFIG['vectordb']['snapshot_path'])
+_document_index_checked = time.monotonic()
+_document_index_lock = threading.Lock()
+
+# Vector retrieval; the embedding model is loaded on the first search
+VECTOR_SEARCH = vector_search_from_config(CONFIG['vectordb'], CONFIG['search'])
+
+# Cross-encoder for hybrid search results, None when disabled
+RERANKER = reranker_from_config(CONFIG['search']['rerank'])
+
+# Maps queries to an intent and topic; shares the query embedder
+QUERY_ROUTER = router_from_config(CONFIG['router'], VECTOR_SEARCH.embedder)
+
+# Event loop the query pipeline runs on
+ENGINE = AsyncEngine(max_workers=CONFIG['server']['pipeline_workers'])
+
+# Shared LLM response cache, None when disabled
+LLM_CACHE = cache_from_config(CONFIG['cache'])
+
+# Identical LLM calls in flight, None when coalescing is disabled
+LLM_FLIGHTS = SingleFlight() if CONFIG['llm'].get('coalesce', True) else None
+
+def corpus_version() -> Optional[str]:
+    """Version of the ingested documents; changes when they are re-ingested."""
+    return snapshot_version(CONFIG['vectordb']['snapshot_path'])
+
+def document_index() -> LexicalIndex:
+    """
+    The lexical index, first rebuilt if the documents were re-ingested.
+    Searches keep using the old index while another thread rebuilds it.
+    """
+    global DOCUMENT_INDEX, DOCUMENT_INDEX_INGESTED, _document_index_version, _document_index_checked
+    if time.monotonic() - _document_index_checked < CONFIG['search']['lexical_reload_interval']:
+        return DOCUMENT_INDEX
+    if not _document_index_lock.acquire(blocking=False):
+        return DOCUMENT_INDEX
+    try:
+        _document_index_checked = time.monotonic()
+        version = corpus_version()
+        if version != _document_index_version:
+            DOCUMENT_INDEX, DOCUMENT_INDEX_INGESTED = load_document_index(CONFIG['vectordb']['snapshot_path'])
+            _document_index_version = version
+    finally:
+        _document_index_lock.release()
+    return DOCUMENT_INDEX
+
+# Answers to earlier queries by similarity, None when disabled
+SEMANTIC_CACHE = semantic_cache_from_config(CONFIG['semantic_cache'], VECTOR_SEARCH.embedder, corpus_version)
+
+# Conversations by session id, None when sessions are disabled
+SESSIONS = session_store_from_config(CONFIG['sessions'])
+
+# Packs search results into the prompt context
+CONTEXT_BUILDER = context_builder_from_config(CONFIG['context'])
+
+# Map-reduce batch summaries keyed by content, so summarizing the same
+# documents again only repeats the final merge
+SUMMARY_MEMO = MemoryCache(max_entries=CONFIG['summarize']['memo_entries'], ttl=0)
+
+def _cache_hit_ratio() -> Optional[float]:
+    if LLM_CACHE is None:
+        return None
+    lookups = LLM_CACHE.hits + LLM_CACHE.misses
+    return LLM_CACHE.hits / lookups if lookups else 0.0
+
+# Metrics served on /metrics
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    'http_request_duration_seconds', 'Time to handle an HTTP request.', ('path',))
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    'http_requests_in_flight', 'HTTP requests currently being handled.', ('path',))
+LLM_REQUESTS = REGISTRY.counter(
+    'llm_requests_total', 'LLM generations by outcome.', ('outcome',))
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    'llm_requests_in_flight', 'LLM generations currently running.')
+LLM_TOKENS = REGISTRY.counter(
+    'llm_tokens_total', 'Tokens processed by the LLM, as reported by Ollama.', ('kind',))
+LLM_TOKENS_PER_SECOND = REGISTRY.histogram(
+    'llm_generation_tokens_per_second', 'Generation speed from Ollama eval_count/eval_duration.',
+    buckets=(1, 2, 5, 10, 20, 35, 50, 75, 100, 150, 200))
+LLM_TIME_TO_FIRST_TOKEN = REGISTRY.histogram(
+    'llm_time_to_first_token_seconds', 'Time until the first streamed response fragment.')
+LLM_CACHE_LOOKUPS = REGISTRY.counter(
+    'llm_cache_lookups_total', 'LLM response cache lookups by result.', ('result',))
+REGISTRY.gauge('llm_cache_hit_ratio', 'Share of LLM response cache lookups that hit.',
+               function=_cache_hit_ratio)
+LLM_BACKEND_REQUESTS = REGISTRY.counter(
+    'llm_backend_requests_total', 'LLM requests per Ollama backend by outcome.', ('backend', 'outcome'))
+LLM_BACKEND_SECONDS = REGISTRY.histogram(
+    'llm_backend_request_duration_seconds', 'Duration of successful LLM requests per Ollama backend.', ('backend',))
+LLM_COALESCED = REGISTRY.counter(
+    'llm_coalesced_calls_total', 'LLM calls served by an identical generation already in flight.')
+SEMANTIC_CACHE_LOOKUPS = REGISTRY.counter(
+    'semantic_cache_lookups_total', 'Semantic answer cache lookups by result.', ('result',))
+SESSION_GENERATIONS = REGISTRY.counter(
+    'session_generations_total', 'Session turn generations by how the history was passed.', ('history',))
+SESSION_COMPACTIONS = REGISTRY.counter(
+    'session_compactions_total', 'Older session turns folded into the session summary.')
+REGISTRY.gauge('sessions_active', 'Conversation sessions in the session store.',
+               function=lambda: len(SESSIONS) if SESSIONS is not None else 0)
+
+def record_backend_request(backend: str, outcome: str, seconds: float):
+    """Count a request the LLM pool made to one backend."""
+    LLM_BACKEND_REQUESTS.inc(backend=backend, outcome=outcome)
+    if outcome == 'success':
+        LLM_BACKEND_SECONDS.observe(seconds, backend=backend)
+
+def record_generation_stats(result: Dict[str, Any]):
+    """Count tokens and generation speed from the stats of a finished Ollama generation."""
+    prompt_tokens = result.get('prompt_eval_count')
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, kind='prompt')
+    eval_count = result.get('eval_count')
+    if eval_count:
+        LLM_TOKENS.inc(eval_count, kind='completion')
+        # eval_duration is in nanoseconds
+        eval_duration = result.get('eval_duration')
+        if eval_duration:
+            LLM_TOKENS_PER_SECOND.observe(eval_count / (eval_duration / 1e9))
+
 class QueryType:
     GENERAL = "general"
     SEARCH = "search"
@@ -62,73 +384,267 @@ class QueryType:
 
 def detect_query_type(query: str) -> str:
     """Detect the type of query based on its content."""
-    query_lower = query.lower()
+    return QUERY_ROUTER.route(query).intent
+
+def llm_model_for(handler: str, prompt: str) -> Optional[str]:
+    """The small model if the config sends this handler's prompt to it, else None."""
+    llm_config = CONFIG['llm']
+    if llm_config.get('small_model') and handler in llm_config.get('small_model_handlers', []) \
+            and len(prompt) <= llm_config.get('small_model_max_chars', 0):
+        return llm_config['small_model']
+    return None
+
+def call_llm(prompt: str, system_prompt: Optional[str] = None,
+             on_token: Optional[Callable[[str], None]] = None,
+             use_cache: bool = True, cancel: Optional[threading.Event] = None,
+             model: Optional[str] = None, session: Optional[Session] = None,
+             keep_context: bool = True) -> str:
+    """
+    Call the LLM API with the given prompt.
+    When on_token is given the completion is streamed and each fragment is
+    passed to it as it arrives; the full text is still returned.
+    Successful completions are cached unless use_cache is False.
+    When cancel is given the completion is streamed too, and setting the
+    event closes the connection so Ollama stops generating.
+    Identical calls made while one is generating share its generation,
+    unless use_cache is False. model defaults to llm.model; generations
+    go to the least loaded backend of the LLM pool that serves it.
+    With a session, the prompt continues its conversation: after Ollama's
+    context tokens from the last turn, or after the history as text.
+    keep_context=False keeps the context tokens the generation returns out
+    of the session, for prompts carrying retrieved passages; the turn then
+    enters the history as its query and answer only.
+    """
+    client = pool_from_config(CONFIG['llm'], record_backend_request)
+    model = model or CONFIG['llm']['model']
+    stream = on_token is not None or cancel is not None
     
-    # Check for search-related keywords
-    if any(keyword in query_lower for keyword in ["find", "search", "look for", "documents about", "information on"]):
-        return QueryType.SEARCH
+    if session is not None:
+        # The answer depends on the conversation, so it is neither cached
+        # nor shared with other calls
+        prompt, context = session.prepare(prompt, model)
+        SESSION_GENERATIONS.inc(history='context' if context else 'text' if session.turns or session.summary else 'none')
+        on_done = None
+        if keep_context:
+            on_done = lambda result: session.set_pending_context(result.get('context'), model)
+        return generate_llm(client, model, prompt, system_prompt, stream, on_token, cancel, None, context, on_done)
     
-    # Check for summarization-related keywords
-    if any(keyword in query_lower for keyword in ["summarize", "summary", "summarization", "brief overview"]):
-        return QueryType.SUMMARIZE
+    cache_key = None
+    if LLM_CACHE is not None and use_cache:
+        cache_key = make_cache_key(model, prompt, system_prompt)
+        with stage('cache'):
+            cached = LLM_CACHE.get(cache_key)
+        LLM_CACHE_LOOKUPS.inc(result='miss' if cached is None else 'hit')
+        if cached is not None:
+            if on_token is not None:
+                on_token(cached)
+            return cached
     
-    # Default to general query
-    return QueryType.GENERAL
+    if LLM_FLIGHTS is None or not use_cache:
+        return generate_llm(client, model, prompt, system_prompt, stream, on_token, cancel, cache_key)
+    
+    def generate(emit: Callable[[str], None], flight_cancel) -> str:
+        return generate_llm(client, model, prompt, system_prompt, stream, emit, flight_cancel, cache_key)
+    
+    response, shared = LLM_FLIGHTS.run(cache_key or make_cache_key(model, prompt, system_prompt),
+                                       generate, on_token, cancel)
+    if shared:
+        LLM_COALESCED.inc()
+    return response
 
-def call_llm(prompt: str, system_prompt: Optional[str] = None) -> str:
-    """Call the LLM API with the given prompt."""
-    api_url = f"{CONFIG['llm']['base_url']}/api/generate"
+def generate_llm(client, model: str, prompt: str, system_prompt: Optional[str], stream: bool,
+                 on_token: Optional[Callable[[str], None]], cancel, cache_key: Optional[str],
+                 context: Optional[List[int]] = None,
+                 on_done: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+    """
+    Run one generation for call_llm and cache it under cache_key, if set.
+    cancel is anything with is_set(), checked between streamed messages.
+    context continues an earlier generation, and on_done receives Ollama's
+    final message of a generation that completed.
+    """
+    if not stream:
+        try:
+            with stage('llm'), LLM_IN_FLIGHT.track_inprogress():
+                result = client.generate(model, prompt, system=system_prompt, context=context)
+            response = result.get('response', '')
+        except Exception as e:
+            LLM_REQUESTS.inc(outcome='error')
+            print(f"Error calling LLM API: {e}")
+            error = f"Error: {str(e)}"
+            if on_token is not None:
+                on_token(error)
+            return error
+        record_generation_stats(result)
+        if on_done is not None:
+            on_done(result)
+        if on_token is not None:
+            # Coalesced streaming callers get the whole response at once
+            on_token(response)
+    else:
+        fragments = []
+        try:
+            with stage('llm'), LLM_IN_FLIGHT.track_inprogress():
+                start = time.perf_counter()
+                with closing(client.generate_stream(model, prompt, system=system_prompt, context=context)) as messages:
+                    for message in messages:
+                        if cancel is not None and cancel.is_set():
+                            LLM_REQUESTS.inc(outcome='cancelled')
+                            return ''.join(fragments)
+                        fragment = message.get('response', '')
+                        if fragment:
+                            if not fragments:
+                                LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - start)
+                            fragments.append(fragment)
+                            if on_token is not None:
+                                on_token(fragment)
+                        if message.get('done'):
+                            record_generation_stats(message)
+                            if on_done is not None:
+                                on_done(message)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client went away; stop generating
+            LLM_REQUESTS.inc(outcome='cancelled')
+            raise
+        except Exception as e:
+            LLM_REQUESTS.inc(outcome='error')
+            print(f"Error calling LLM API: {e}")
+            if not fragments:
+                error = f"Error: {str(e)}"
+                if on_token is not None:
+                    on_token(error)
+                return error
+            # Don't cache a truncated completion
+            return ''.join(fragments)
+        response = ''.join(fragments)
+    LLM_REQUESTS.inc(outcome='success')
     
-    payload = {
-        "model": CONFIG['llm']['model'],
-        "prompt": prompt,
-        "stream": False
-    }
+    if cache_key is not None:
+        LLM_CACHE.set(cache_key, response)
+    return response
+
+def search_documents(query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Search for documents related to the query.
+    Uses vector search over the ingested collection when configured, and
+    BM25 over the prebuilt lexical index otherwise or when no vector index
+    is reachable. The hybrid backend is searched by hybrid_search_batch_async.
+    """
+    if top_k is None:
+        top_k = CONFIG['search']['top_k']
     
-    if system_prompt:
-        payload["system"] = system_prompt
+    with stage('search'):
+        if CONFIG['search']['backend'] == 'vector':
+            try:
+                return VECTOR_SEARCH.search(query, top_k)
+            except Exception as e:
+                print(f"Vector search unavailable, using lexical index: {e}")
+        
+        return document_index().search(query, top_k)
+
+def search_documents_batch(queries: List[str], top_k: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Search for documents related to each query. Vector search embeds all
+    queries in one call and runs one batched index search.
+    """
+    if top_k is None:
+        top_k = CONFIG['search']['top_k']
     
+    with stage('search_batch'):
+        if CONFIG['search']['backend'] == 'vector':
+            try:
+                return VECTOR_SEARCH.search_batch(queries, top_k)
+            except Exception as e:
+                print(f"Vector search unavailable, using lexical index: {e}")
+        
+        return lexical_search_batch(queries, top_k)
+
+async def call_llm_async(prompt: str, system_prompt: Optional[str] = None,
+                         on_token: Optional[Callable[[str], None]] = None,
+                         use_cache: bool = True, model: Optional[str] = None,
+                         session: Optional[Session] = None, keep_context: bool = True) -> str:
+    """Awaitable call_llm; cancelling the awaiting task stops the generation."""
+    return await ENGINE.run_cancellable(call_llm, prompt, system_prompt, on_token, use_cache,
+                                        model=model, session=session, keep_context=keep_context)
+
+def retrieval_top_k(handler: str) -> Optional[int]:
+    """Number of documents to retrieve for a handler; None means search.top_k."""
+    if handler == QueryType.SEARCH:
+        return CONFIG['context']['candidates']
+    if handler == QueryType.SUMMARIZE and CONFIG['summarize']['mode'] == 'map_reduce':
+        return CONFIG['summarize']['max_documents']
+    return None
+
+def lexical_search_batch(queries: List[str], top_k: int) -> List[List[Dict[str, Any]]]:
+    index = document_index()
+    return [index.search(query, top_k) for query in queries]
+
+def vector_search_batch_or_none(queries: List[str], top_k: int) -> Optional[List[List[Dict[str, Any]]]]:
+    """Vector results for each query, or None when no vector index is reachable."""
     try:
-        response = requests.post(api_url, json=payload)
-        response.raise_for_status()
-        result = response.json()
-        return result.get('response', '')
+        return VECTOR_SEARCH.search_batch(queries, top_k)
     except Exception as e:
-        print(f"Error calling LLM API: {e}")
-        return f"Error: {str(e)}"
+        print(f"Vector search unavailable, using lexical results only: {e}")
+        return None
 
-def search_documents(query: str) -> List[Dict[str, Any]]:
+async def hybrid_search_batch_async(queries: List[str], top_k: Optional[int] = None) -> List[List[Dict[str, Any]]]:
     """
-    Search for documents related to the query.
-    In a real implementation, this would use the vector database.
-    Here we use a simple keyword matching for demonstration.
+    Search the lexical and vector indexes concurrently, fuse each query's
+    rankings with reciprocal rank fusion and rerank the fused candidates
+    when a reranker is configured. The rankings are only fused when the
+    lexical index holds the ingested chunks; otherwise lexical results are
+    only used when vector search is unavailable.
     """
-    results = []
-    query_terms = set(re.findall(r'\w+', query.lower()))
-    
-    for doc in SAMPLE_DOCUMENTS:
-        doc_terms = set(re.findall(r'\w+', doc['content'].lower()))
-        # Calculate a simple relevance score based on term overlap
-        overlap = len(query_terms.intersection(doc_terms))
-        if overlap > 0:
-            results.append({
-                "id": doc["id"],
-                "title": doc["title"],
-                "content": doc["content"],
-                "relevance": overlap / len(query_terms)
-            })
+    if top_k is None:
+        top_k = CONFIG['search']['top_k']
+    hybrid_config = CONFIG['search']['hybrid']
+    candidates = max(top_k, hybrid_config['candidates'])
+    
+    with stage('search'):
+        document_index()
+        if DOCUMENT_INDEX_INGESTED:
+            lexical, vector = await asyncio.gather(
+                ENGINE.run_blocking(lexical_search_batch, queries, candidates),
+                ENGINE.run_blocking(vector_search_batch_or_none, queries, candidates)
+            )
+        else:
+            # The lexical index only holds the sample documents, which
+            # fusing would add to every context
+            lexical, vector = None, await ENGINE.run_blocking(vector_search_batch_or_none, queries, candidates)
+            if vector is None:
+                lexical = await ENGINE.run_blocking(lexical_search_batch, queries, candidates)
+        rankings = [{} for _ in queries]
+        for name, results in (("lexical", lexical), ("vector", vector)):
+            if results is not None:
+                for ranking, query_results in zip(rankings, results):
+                    ranking[name] = query_results
+        fused = [reciprocal_rank_fusion(ranking, k=hybrid_config['rrf_k'], weights=hybrid_config.get('weights'))
+                 for ranking in rankings]
     
-    # Sort by relevance
-    results.sort(key=lambda x: x['relevance'], reverse=True)
-    return results
+    if RERANKER is None:
+        return [results[:top_k] for results in fused]
+    with stage('rerank'):
+        return await ENGINE.run_blocking(RERANKER.rerank_batch, queries, fused, top_k)
+
+async def search_documents_async(query: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    if CONFIG['search']['backend'] == 'hybrid':
+        return (await hybrid_search_batch_async([query], top_k))[0]
+    return await ENGINE.run_blocking(search_documents, query, top_k)
+
+async def search_documents_batch_async(queries: List[str], top_k: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+    if CONFIG['search']['backend'] == 'hybrid':
+        return await hybrid_search_batch_async(queries, top_k)
+    return await ENGINE.run_blocking(search_documents_batch, queries, top_k)
 
-def process_general_query(query: str) -> Dict[str, Any]:
+async def process_general_query_async(query: str, on_token: Optional[Callable[[str], None]] = None,
+                                      use_cache: bool = True, route: Optional[RouteMatch] = None) -> Dict[str, Any]:
     """Process a general query using the LLM."""
     system_prompt = "You are a helpful AI assistant. Provide accurate and concise information."
-    response = call_llm(query, system_prompt)
+    if route is not None and route.handler == QueryType.GENERAL:
+        system_prompt = route.system_prompt or system_prompt
+    response = await call_llm_async(query, system_prompt, on_token, use_cache, session=current_session())
     
     return {
-        "type": QueryType.GENERAL,
+        "type": route.intent if route is not None and route.handler == QueryType.GENERAL else QueryType.GENERAL,
         "query": query,
         "response": response,
         "metadata": {
@@ -136,68 +652,93 @@ def process_general_query(query: str) -> Dict[str, Any]:
         }
     }
 
-def process_search_query(query: str) -> Dict[str, Any]:
-    """Process a search query using document search and LLM."""
-    # Extract the search topic from the query
-    search_topic = re.sub(r'^.*?(find|search|look for|documents about|information on)\s+', '', query, flags=re.IGNORECASE).strip()
-    if search_topic.endswith('?'):
-        search_topic = search_topic[:-1]
+async def process_search_query_async(query: str, on_token: Optional[Callable[[str], None]] = None,
+                                     use_cache: bool = True,
+                                     search_results: Optional[List[Dict[str, Any]]] = None,
+                                     route: Optional[RouteMatch] = None) -> Dict[str, Any]:
+    """
+    Process a search query using document search and LLM.
+    Pass search_results to skip the search, e.g. when it was batched, and
+    route to reuse an earlier routing of the query.
+    """
+    if route is None:
+        route = QUERY_ROUTER.route(query)
     
     # Search for relevant documents
-    search_results = search_documents(search_topic)
+    if search_results is None:
+        search_results = await search_documents_async(route.topic, retrieval_top_k(QueryType.SEARCH))
     
     if not search_results:
         # Fall back to general query if no documents found
-        result = process_general_query(query)
+        result = await process_general_query_async(query, on_token, use_cache)
         result["metadata"]["processing_steps"].append("Document search (no results)")
         return result
     
-    # Prepare context from search results
-    context = "\n\n".join([f"Document: {doc['title']}\nContent: {doc['content']}" for doc in search_results[:2]])
-    
-    # Generate response with context
-    system_prompt = "You are a helpful AI assistant. Use the provided document context to answer the question. If the context doesn't contain relevant information, say so and provide a general response."
-    prompt = f"Context:\n{context}\n\nQuestion: {query}\n\nAnswer:"
-    response = call_llm(prompt, system_prompt)
+    # Prepare context from search results: the best results that fit the
+    # token budget, overlaps merged, in a stable order so the prompt prefix
+    # (system prompt, then context) can be reused from Ollama's cache
+    with stage('prompt'):
+        packed = CONTEXT_BUILDER.build(search_results)
+        
+        # Generate response with context
+        system_prompt = route.system_prompt or "You are a helpful AI assistant. Use the provided document context to answer the question. If the context doesn't contain relevant information, say so and provide a general response."
+        prompt = f"Context:\n{packed['context']}\n\nQuestion: {query}\n\nAnswer:"
+    # Retrieved passages are sent again each turn rather than kept in the session
+    response = await call_llm_async(prompt, system_prompt, on_token, use_cache, session=current_session(),
+                                    keep_context=False)
     
     return {
-        "type": QueryType.SEARCH,
+        "type": route.intent if route.handler == QueryType.SEARCH else QueryType.SEARCH,
         "query": query,
         "response": response,
         "metadata": {
             "processing_steps": ["Document search", "Context preparation", "LLM query with context"],
-            "search_results": [{"id": doc["id"], "title": doc["title"], "relevance": doc["relevance"]} for doc in search_results[:2]]
+            "search_results": [{"id": doc["id"], "title": doc["title"], "relevance": doc["relevance"]} for doc in packed["documents"]],
+            "context_tokens": packed["tokens"]
         }
     }
 
-def process_summarize_query(query: str) -> Dict[str, Any]:
-    """Process a summarization query."""
-    # Extract what needs to be summarized
-    match = re.search(r'summarize\s+(.*)', query, re.IGNORECASE)
-    if match:
-        topic = match.group(1).strip()
-    else:
-        topic = re.sub(r'^.*?(summarize|summary|summarization|brief overview)\s+', '', query, flags=re.IGNORECASE).strip()
+async def process_summarize_query_async(query: str, on_token: Optional[Callable[[str], None]] = None,
+                                        use_cache: bool = True,
+                                        search_results: Optional[List[Dict[str, Any]]] = None,
+                                        route: Optional[RouteMatch] = None) -> Dict[str, Any]:
+    """
+    Process a summarization query.
+    Pass search_results to skip the search, e.g. when it was batched, and
+    route to reuse an earlier routing of the query.
+    """
+    if route is None:
+        route = QUERY_ROUTER.route(query)
+    
+    summarize_config = CONFIG['summarize']
+    map_reduce = summarize_config['mode'] == 'map_reduce'
     
     # Search for relevant documents
-    search_results = search_documents(topic)
+    if search_results is None:
+        search_results = await search_documents_async(route.topic, retrieval_top_k(QueryType.SUMMARIZE))
     
     if not search_results:
         # Fall back to general query if no documents found
-        result = process_general_query(query)
+        result = await process_general_query_async(query, on_token, use_cache)
         result["metadata"]["processing_steps"].append("Document search (no results)")
         return result
     
-    # Prepare content to summarize
-    content_to_summarize = "\n\n".join([doc['content'] for doc in search_results[:2]])
+    if map_reduce:
+        return await map_reduce_summarize_query(query, search_results, on_token, use_cache, route)
     
-    # Generate summary
-    system_prompt = "You are a helpful AI assistant. Provide a concise summary of the given content."
-    prompt = f"Please summarize the following content:\n\n{content_to_summarize}"
-    summary = call_llm(prompt, system_prompt)
+    # Prepare content to summarize
+    with stage('prompt'):
+        content_to_summarize = "\n\n".join([doc['content'] for doc in search_results[:2]])
+        
+        # Generate summary
+        system_prompt = route.system_prompt or "You are a helpful AI assistant. Provide a concise summary of the given content."
+        prompt = f"Please summarize the following content:\n\n{content_to_summarize}"
+    summary = await call_llm_async(prompt, system_prompt, on_token, use_cache,
+                                   model=llm_model_for(QueryType.SUMMARIZE, prompt), session=current_session(),
+                                   keep_context=False)
     
     return {
-        "type": QueryType.SUMMARIZE,
+        "type": route.intent if route.handler == QueryType.SUMMARIZE else QueryType.SUMMARIZE,
         "query": query,
         "response": summary,
         "metadata": {
@@ -206,77 +747,694 @@ def process_summarize_query(query: str) -> Dict[str, Any]:
         }
     }
 
-def process_query(query: str) -> Dict[str, Any]:
-    """Process a query based on its detected type."""
-    query_type = detect_query_type(query)
+async def summarize_batch(texts: List[str], level: int, final: bool,
+                          on_token: Optional[Callable[[str], None]] = None,
+                          use_cache: bool = True, system_prompt: Optional[str] = None) -> str:
+    """Summarize one map-reduce batch: source texts at level 0, partial summaries above it."""
+    system_prompt = system_prompt or "You are a helpful AI assistant. Provide a concise summary of the given content."
+    with stage('prompt'):
+        content = "\n\n".join(texts)
+        if level == 0:
+            prompt = f"Please summarize the following content:\n\n{content}"
+        else:
+            prompt = f"Combine the following partial summaries into one concise summary:\n\n{content}"
+    # The final summary answers the query, so it continues the session
+    return await call_llm_async(prompt, system_prompt, on_token, use_cache,
+                                model=llm_model_for(QueryType.SUMMARIZE, prompt),
+                                session=current_session() if final else None, keep_context=False)
+
+# Map calls summarize each source text of their batch separately, so
+# summaries can be memoized per text
+SECTION_SUMMARY_PROMPT = ("Summarize each numbered section below on its own. Start the summary of each "
+                          "section on a new line with the section's number in brackets, like [1].")
+
+async def summarize_sections(texts: List[str], use_cache: bool = True,
+                             system_prompt: Optional[str] = None) -> Tuple[str, str]:
+    """Summarize the source texts of a map batch in one call; returns the response and the model used."""
+    system_prompt = system_prompt or "You are a helpful AI assistant. Provide a concise summary of the given content."
+    with stage('prompt'):
+        prompt = f"{SECTION_SUMMARY_PROMPT}\n\n{number_sections(texts)}"
+    model = llm_model_for(QueryType.SUMMARIZE, prompt) or CONFIG['llm']['model']
+    response = await call_llm_async(prompt, system_prompt, None, use_cache, model=model, keep_context=False)
+    return response, model
+
+def summary_models() -> List[str]:
+    """Models llm_model_for may pick for summaries"""
+    llm_config = CONFIG['llm']
+    models = [llm_config['model']]
+    if llm_config.get('small_model') and QueryType.SUMMARIZE in llm_config.get('small_model_handlers', []):
+        models.insert(0, llm_config['small_model'])
+    return models
+
+def summary_memo_key(text: str, model: str, system_prompt: Optional[str]) -> str:
+    return make_cache_key(model, text, system_prompt, {"prompt": SECTION_SUMMARY_PROMPT})
+
+async def map_reduce_summarize_query(query: str, search_results: List[Dict[str, Any]],
+                                     on_token: Optional[Callable[[str], None]] = None,
+                                     use_cache: bool = True, route: Optional[RouteMatch] = None) -> Dict[str, Any]:
+    """
+    Summarize every search result: batches sized to the model's context
+    are summarized concurrently and the partial summaries merged until one
+    remains. Only the final summary is streamed. The summary of each search
+    result is memoized by its content and the model that wrote it, and a
+    map batch only sends the results without one.
+    """
+    summarize_config = CONFIG['summarize']
+    system_prompt = route.system_prompt if route is not None else None
+    memoized = 0
+    
+    def memoized_summary(text):
+        for model in summary_models():
+            summary = SUMMARY_MEMO.get(summary_memo_key(text, model, system_prompt))
+            if summary is not None:
+                return summary
+        return None
+    
+    async def summarize(texts, level, final):
+        nonlocal memoized
+        if final:
+            return await summarize_batch(texts, level, final, on_token, use_cache, system_prompt)
+        if level > 0:
+            # Merges are cached like any other LLM call
+            summary = await summarize_batch(texts, level, final, None, use_cache, system_prompt)
+            if summary.startswith("Error:"):
+                # A merge would pass the error off as part of the summary
+                raise SummaryError(summary)
+            return summary
+        
+        summaries = [memoized_summary(text) if use_cache else None for text in texts]
+        missing = [i for i, summary in enumerate(summaries) if summary is None]
+        memoized += len(texts) - len(missing)
+        if missing:
+            response, model = await summarize_sections([texts[i] for i in missing], use_cache, system_prompt)
+            if response.startswith("Error:"):
+                raise SummaryError(response)
+            parts = split_numbered(response, len(missing))
+            if parts is None and len(missing) == 1:
+                parts = [response.strip()]
+            if parts is None:
+                # Not numbered as asked: the response summarizes the batch as a whole
+                summaries[missing[0]] = response
+            else:
+                for i, part in zip(missing, parts):
+                    summaries[i] = part
+                    SUMMARY_MEMO.set(summary_memo_key(texts[i], model, system_prompt), part)
+        return "\n\n".join(summary for summary in summaries if summary)
+    
+    # Room for the instructions and the generated summary
+    budget = summarize_config['context_tokens'] - summarize_config['reserve_tokens']
+    try:
+        summary, stats = await map_reduce_summarize(
+            [doc['content'] for doc in search_results], summarize, budget, summarize_config['chars_per_token'])
+    except SummaryError as e:
+        # Answer with the error, so it is neither cached nor kept in a session
+        summary, stats = str(e), {"failed": True}
+    
+    steps = ["Document search", "Content preparation", "Summarization"]
+    if stats.get("map_batches", 0) > 1:
+        steps = ["Document search", "Content preparation", "Batch summaries", "Summary merge"]
+    return {
+        "type": route.intent if route is not None and route.handler == QueryType.SUMMARIZE else QueryType.SUMMARIZE,
+        "query": query,
+        "response": summary,
+        "metadata": {
+            "processing_steps": steps,
+            "summarized_documents": [{"id": doc["id"], "title": doc["title"]} for doc in search_results],
+            "map_reduce": {**stats, "memoized_summaries": memoized}
+        }
+    }
+
+async def process_query_async(query: str, on_token: Optional[Callable[[str], None]] = None,
+                              use_cache: bool = True,
+                              search_results: Optional[List[Dict[str, Any]]] = None,
+                              route: Optional[RouteMatch] = None) -> Dict[str, Any]:
+    """
+    Process a query based on its detected type.
+    If on_token is given, response fragments are passed to it as the LLM
+    generates them. use_cache=False skips the LLM response and semantic
+    caches. search_results and route, if given, replace the document
+    search and the routing of the query.
+    """
+    if route is None:
+        with stage('detect'):
+            route = QUERY_ROUTER.route(query)
+    
+    # Answers within a session depend on the conversation, so they bypass the semantic cache
+    semantic_cache = SEMANTIC_CACHE if use_cache and SEMANTIC_CACHE is not None and SEMANTIC_CACHE.enabled \
+        and current_session() is None else None
+    if semantic_cache is not None:
+        with stage('semantic_cache'):
+            cached = await ENGINE.run_blocking(semantic_cache.get, query, route.intent)
+        SEMANTIC_CACHE_LOOKUPS.inc(result='miss' if cached is None else 'hit')
+        if cached is not None:
+            if on_token:
+                on_token(cached["response"])
+            return cached
     
-    if query_type == QueryType.SEARCH:
-        return process_search_query(query)
-    elif query_type == QueryType.SUMMARIZE:
-        return process_summarize_query(query)
+    if route.handler == QueryType.SEARCH:
+        result = await process_search_query_async(query, on_token, use_cache, search_results, route)
+    elif route.handler == QueryType.SUMMARIZE:
+        result = await process_summarize_query_async(query, on_token, use_cache, search_results, route)
     else:
-        return process_general_query(query)
+        result = await process_general_query_async(query, on_token, use_cache, route)
+    
+    if semantic_cache is not None:
+        result["metadata"]["cache_hit"] = False
+        # Failed generations are retried rather than served again
+        if not result["response"].startswith("Error:"):
+            await ENGINE.run_blocking(semantic_cache.put, query, route.intent, result)
+    return result
+
+async def process_session_query_async(query: str, session: Session,
+                                      on_token: Optional[Callable[[str], None]] = None,
+                                      use_cache: bool = True) -> Dict[str, Any]:
+    """
+    Process a query as the next turn of a session's conversation. Turns of
+    one session run one at a time. Once the session's context outgrows
+    sessions.max_context_tokens, its older turns are summarized in the
+    background, so no turn waits for that.
+    """
+    sessions_config = CONFIG['sessions']
+    async with session.lock:
+        with use_session(session):
+            result = await process_query_async(query, on_token, use_cache)
+        # A failed generation isn't part of the conversation
+        if not result["response"].startswith("Error:"):
+            session.record(query, result["response"])
+        result["metadata"]["session"] = session.info()
+        if not session.compacting and session.needs_compaction(sessions_config['max_context_tokens'],
+                                                               sessions_config['chars_per_token']):
+            session.compacting = True
+            ENGINE.spawn(compact_session_async(session))
+    return result
+
+async def compact_session_async(session: Session):
+    """Fold a session's older turns into its summary."""
+    try:
+        folded = turns_to_fold(session, CONFIG['sessions']['keep_turns'])
+        summary = session.summary
+        if folded:
+            prompt = summary_prompt(session.summary, folded)
+            system_prompt = "You are a helpful AI assistant. Summarize conversations accurately and concisely."
+            summary = await call_llm_async(prompt, system_prompt,
+                                           model=llm_model_for(QueryType.SUMMARIZE, prompt))
+            if summary.startswith("Error:"):
+                # Keep the turns; the next turn tries again
+                return
+        # Turns only get appended meanwhile, so the folded ones are still first
+        async with session.lock:
+            apply_compaction(session, folded, summary.strip())
+        SESSION_COMPACTIONS.inc()
+    finally:
+        session.compacting = False
+
+async def process_query_batch_async(queries: List[str], use_cache: bool = True, parallelism: Optional[int] = None,
+                                    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                                    timings: bool = False, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """
+    Process many queries at once. Query types are detected and the document
+    searches run up front, batched per handler; the queries are then
+    processed concurrently, at most parallelism at a time. Results are
+    returned in query order, and on_result(index, result) is called as each
+    one completes. A failed query yields {"query": ..., "error": ...}, as
+    does one still unfinished timeout seconds after the batch started.
+    With timings, each result's metadata gets its stage timings.
+    """
+    if parallelism is None:
+        parallelism = CONFIG['server']['batch_parallelism']
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout if timeout is not None else None
+    
+    # Detection and retrieval for the whole batch
+    with stage('detect'):
+        routes = [QUERY_ROUTER.route(query) for query in queries]
+    search_results = {}
+    for handler in (QueryType.SEARCH, QueryType.SUMMARIZE):
+        retrieval = [i for i, route in enumerate(routes) if route.handler == handler]
+        if retrieval:
+            batch_results = await search_documents_batch_async(
+                [routes[i].topic for i in retrieval], retrieval_top_k(handler))
+            search_results.update(zip(retrieval, batch_results))
+    
+    slots = asyncio.Semaphore(max(1, parallelism))
+    
+    async def run(i):
+        async with slots:
+            with trace() as query_trace:
+                remaining = max(0.0, deadline - loop.time()) if deadline is not None else None
+                try:
+                    result = await asyncio.wait_for(
+                        process_query_async(queries[i], None, use_cache, search_results.get(i), routes[i]), remaining)
+                    if timings:
+                        result['metadata']['timings'] = query_trace.timings()
+                except asyncio.TimeoutError:
+                    result = {"query": queries[i], "error": "Deadline exceeded"}
+                except Exception as e:
+                    result = {"query": queries[i], "error": f"Server error: {str(e)}"}
+        if on_result is not None:
+            await ENGINE.run_blocking(on_result, i, result)
+        return result
+    
+    tasks = [asyncio.ensure_future(run(i)) for i in range(len(queries))]
+    try:
+        return list(await asyncio.gather(*tasks))
+    except BaseException:
+        # on_result failed, e.g. the client went away, or the batch was
+        # cancelled; stop the queries still running instead of finishing
+        # LLM calls nobody will read
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+def process_general_query(query: str, on_token: Optional[Callable[[str], None]] = None,
+                          use_cache: bool = True, route: Optional[RouteMatch] = None) -> Dict[str, Any]:
+    """Synchronous wrapper for process_general_query_async."""
+    return ENGINE.run(process_general_query_async(query, on_token, use_cache, route))
+
+def process_search_query(query: str, on_token: Optional[Callable[[str], None]] = None,
+                         use_cache: bool = True,
+                         search_results: Optional[List[Dict[str, Any]]] = None,
+                         route: Optional[RouteMatch] = None) -> Dict[str, Any]:
+    """Synchronous wrapper for process_search_query_async."""
+    return ENGINE.run(process_search_query_async(query, on_token, use_cache, search_results, route))
+
+def process_summarize_query(query: str, on_token: Optional[Callable[[str], None]] = None,
+                            use_cache: bool = True,
+                            search_results: Optional[List[Dict[str, Any]]] = None,
+                            route: Optional[RouteMatch] = None) -> Dict[str, Any]:
+    """Synchronous wrapper for process_summarize_query_async."""
+    return ENGINE.run(process_summarize_query_async(query, on_token, use_cache, search_results, route))
+
+def process_query(query: str, on_token: Optional[Callable[[str], None]] = None,
+                  use_cache: bool = True,
+                  search_results: Optional[List[Dict[str, Any]]] = None,
+                  route: Optional[RouteMatch] = None,
+                  timeout: Optional[float] = None,
+                  session: Optional[Session] = None) -> Dict[str, Any]:
+    """
+    Synchronous wrapper for process_query_async, or for
+    process_session_query_async when session is given. After timeout
+    seconds outstanding LLM calls are cancelled and DeadlineExceeded is raised.
+    """
+    if session is not None:
+        return ENGINE.run(process_session_query_async(query, session, on_token, use_cache), timeout)
+    return ENGINE.run(process_query_async(query, on_token, use_cache, search_results, route), timeout)
+
+def process_query_batch(queries: List[str], use_cache: bool = True, parallelism: Optional[int] = None,
+                        on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+                        timings: bool = False, timeout: Optional[float] = None) -> List[Dict[str, Any]]:
+    """Synchronous wrapper for process_query_batch_async."""
+    return ENGINE.run(process_query_batch_async(queries, use_cache, parallelism, on_result, timings, timeout))
 
 class AdvancedAIHandler(BaseHTTPRequestHandler):
-    def _set_headers(self, status_code=200):
-        self.send_response(status_code)
-        self.send_header('Content-type', 'application/json')
+    # HTTP/1.1 keeps connections alive between requests; idle ones time out
+    protocol_version = 'HTTP/1.1'
+    timeout = CONFIG['server']['keep_alive_timeout']
+    # Seconds between checks for waiting connections while idle
+    idle_poll_interval = 0.05
+    
+    def handle(self):
+        """
+        Serve requests on the connection until it is closed, it has served
+        server.max_keep_alive_requests, or another connection is waiting
+        for a worker while this one is idle.
+        """
+        self.requests_served = 0
+        self.close_connection = True
+        self.handle_one_request()
+        while not self.close_connection and self._await_request():
+            self.handle_one_request()
+    
+    def _await_request(self):
+        """
+        Wait for the next request on the connection; False once it has
+        been idle for the keep-alive timeout or the worker is wanted by a
+        waiting connection. Pipelined requests already read into rfile's
+        buffer are not seen, so clients should wait for each response.
+        """
+        deadline = time.monotonic() + self.timeout if self.timeout else None
+        while not self.server.connections_waiting():
+            wait = self.idle_poll_interval
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    return False
+            readable, _, _ = select.select([self.connection], [], [], wait)
+            if readable:
+                return True
+        return False
+    
+    def send_response(self, code, message=None):
+        super().send_response(code, message)
+        self.requests_served += 1
+        # Hand the worker over after this response rather than keep it
+        # pinned by a connection that may send more
+        if (self.requests_served >= CONFIG['server']['max_keep_alive_requests']
+                or self.server.connections_waiting()):
+            self.send_header('Connection', 'close')
+
+    def _send_cors_headers(self):
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'GET, POST, OPTIONS')
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
+
+    def _set_headers(self, status_code=200, content_length=0):
+        self.send_response(status_code)
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Content-Length', str(content_length))
+        self._send_cors_headers()
         self.end_headers()
+
+    def _send_json(self, response, status_code=200):
+        body = json.dumps(response).encode('utf-8')
+        self._set_headers(status_code, len(body))
+        self.wfile.write(body)
+
+    def _start_stream(self):
+        """Send headers for a chunked NDJSON response."""
+        self.send_response(200)
+        self.send_header('Content-type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.send_header('Cache-Control', 'no-cache')
+        self._send_cors_headers()
+        self.end_headers()
+
+    def _send_event(self, event):
+        """Write one NDJSON event as an HTTP chunk."""
+        data = (json.dumps(event) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+
+    def _end_stream(self):
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _request_timeout(self, request_data):
+        """
+        The request's "timeout" in seconds, capped by server.request_timeout,
+        or None if it isn't a positive number.
+        """
+        limit = CONFIG['server']['request_timeout']
+        requested = request_data.get('timeout')
+        if requested is None:
+            return limit
+        if isinstance(requested, bool) or not isinstance(requested, (int, float)) or not requested > 0:
+            return None
+        return min(float(requested), limit)
+
+    def _stream_query(self, query, use_cache=True, timings=False, timeout=None, session=None):
+        """
+        Stream a query as NDJSON: one {"event": "token"} per response
+        fragment, then a final {"event": "done"} carrying the type, query
+        and metadata. Failures after the headers are sent, including a
+        missed deadline, become an {"event": "error"}.
+        """
+        self._start_stream()
+        write_lock = threading.Lock()
+        streaming = [True]
+        
+        def send_token(fragment):
+            # A cancelled generation may still deliver a fragment; drop it
+            with write_lock:
+                if streaming[0]:
+                    self._send_event({'event': 'token', 'response': fragment})
+        
+        try:
+            try:
+                with trace() as request_trace:
+                    result = process_query(query, on_token=send_token, use_cache=use_cache, timeout=timeout,
+                                           session=session)
+            finally:
+                with write_lock:
+                    streaming[0] = False
+            if timings:
+                result['metadata']['timings'] = request_trace.timings()
+            self._send_event({
+                'event': 'done',
+                'type': result['type'],
+                'query': result['query'],
+                'metadata': result['metadata']
+            })
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return
+        except DeadlineExceeded:
+            self._send_event({'event': 'error', 'error': 'Deadline exceeded'})
+        except Exception as e:
+            self._send_event({'event': 'error', 'error': f'Server error: {str(e)}'})
+        self._end_stream()
     
     def do_OPTIONS(self):
         self._set_headers()
     
     def do_GET(self):
         if self.path == '/health':
-            self._set_headers()
             response = {'status': 'healthy', 'version': '1.0.0'}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self._send_json(response)
+        elif self.path == '/stats':
+            response = {
+                'llm_backends': pool_from_config(CONFIG['llm'], record_backend_request).stats(),
+                'llm_cache': LLM_CACHE.stats() if LLM_CACHE is not None else None,
+                'llm_coalescing': LLM_FLIGHTS.stats() if LLM_FLIGHTS is not None else None,
+                'semantic_cache': SEMANTIC_CACHE.stats() if SEMANTIC_CACHE is not None else None,
+                'reranker': RERANKER.stats() if RERANKER is not None else None,
+                'sessions': SESSIONS.stats() if SESSIONS is not None else None
+            }
+            self._send_json(response)
+        elif self.path == '/metrics':
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
         else:
-            self._set_headers(404)
             response = {'error': 'Endpoint not found'}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+            self._send_json(response, 404)
     
     def do_POST(self):
-        if self.path == '/query':
-            content_length = int(self.headers['Content-Length'])
-            post_data = self.rfile.read(content_length)
-            
+        handlers = {
+            '/query': self._handle_query,
+            '/query/batch': self._handle_batch
+        }
+        handler = handlers.get(self.path)
+        if handler is None:
+            # The body was never read, so the connection can't be reused
+            self.close_connection = True
+            response = {'error': 'Endpoint not found'}
+            self._send_json(response, 404)
+            return
+        
+        content_length = int(self.headers['Content-Length'])
+        post_data = self.rfile.read(content_length)
+        
+        with HTTP_REQUEST_SECONDS.time(path=self.path), HTTP_IN_FLIGHT.track_inprogress(path=self.path):
             try:
                 request_data = json.loads(post_data.decode('utf-8'))
-                query = request_data.get('query', '')
-                
-                if not query:
-                    self._set_headers(400)
-                    response = {'error': 'Query parameter is required'}
-                    self.wfile.write(json.dumps(response).encode('utf-8'))
-                    return
-                
-                # Process the query
-                result = process_query(query)
-                
-                # Return the response
-                self._set_headers()
-                self.wfile.write(json.dumps(result).encode('utf-8'))
+                handler(request_data)
             except json.JSONDecodeError:
-                self._set_headers(400)
                 response = {'error': 'Invalid JSON'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
+                self._send_json(response, 400)
             except Exception as e:
-                self._set_headers(500)
                 response = {'error': f'Server error: {str(e)}'}
-                self.wfile.write(json.dumps(response).encode('utf-8'))
-        else:
-            self._set_headers(404)
-            response = {'error': 'Endpoint not found'}
-            self.wfile.write(json.dumps(response).encode('utf-8'))
+                self._send_json(response, 500)
+
+    def _handle_query(self, request_data):
+        query = request_data.get('query', '')
+        
+        if not query:
+            response = {'error': 'Query parameter is required'}
+            self._send_json(response, 400)
+            return
+        
+        # "cache": false forces a fresh generation
+        use_cache = request_data.get('cache', True) is not False
+        # "timings": true adds the per-stage breakdown (ms) to the metadata
+        timings = bool(request_data.get('timings'))
+        timeout = self._request_timeout(request_data)
+        if timeout is None:
+            response = {'error': 'timeout must be a positive number of seconds'}
+            self._send_json(response, 400)
+            return
+        
+        # "session": true starts a conversation and "session_id" continues
+        # it; the id is returned in metadata.session. Only ids the server
+        # issued and still holds are accepted.
+        session_id = request_data.get('session_id')
+        if session_id is not None and not isinstance(session_id, str):
+            response = {'error': 'session_id must be a string'}
+            self._send_json(response, 400)
+            return
+        session = None
+        if SESSIONS is not None and session_id:
+            session = SESSIONS.get(session_id)
+            if session is None:
+                response = {'error': 'Unknown or expired session_id; start a new session with "session": true'}
+                self._send_json(response, 404)
+                return
+        elif SESSIONS is not None and request_data.get('session'):
+            session = SESSIONS.create()
+        
+        if request_data.get('stream'):
+            self._stream_query(query, use_cache, timings, timeout, session)
+            return
+        
+        # Process the query
+        try:
+            with trace() as request_trace:
+                result = process_query(query, use_cache=use_cache, timeout=timeout, session=session)
+        except DeadlineExceeded:
+            response = {'error': 'Deadline exceeded'}
+            self._send_json(response, 504)
+            return
+        if timings:
+            result['metadata']['timings'] = request_trace.timings()
+        
+        # Return the response
+        self._send_json(result)
+
+    def _handle_batch(self, request_data):
+        """
+        Answer {"queries": [...]} with {"results": [...]} in query order, or
+        with "stream": true, one {"event": "result", "index": i, "result": ...}
+        NDJSON line per query as it completes and a final {"event": "done"}.
+        """
+        queries = request_data.get('queries')
+        if not isinstance(queries, list) or not queries or not all(isinstance(q, str) and q for q in queries):
+            response = {'error': 'queries must be a non-empty list of query strings'}
+            self._send_json(response, 400)
+            return
+        
+        max_batch_size = CONFIG['server']['max_batch_size']
+        if len(queries) > max_batch_size:
+            response = {'error': f'At most {max_batch_size} queries are allowed per batch'}
+            self._send_json(response, 400)
+            return
+        
+        use_cache = request_data.get('cache', True) is not False
+        timings = bool(request_data.get('timings'))
+        timeout = self._request_timeout(request_data)
+        if timeout is None:
+            response = {'error': 'timeout must be a positive number of seconds'}
+            self._send_json(response, 400)
+            return
+        try:
+            parallelism = int(request_data.get('parallelism', CONFIG['server']['batch_parallelism']))
+        except (TypeError, ValueError):
+            parallelism = 0
+        if parallelism < 1:
+            response = {'error': 'parallelism must be a positive integer'}
+            self._send_json(response, 400)
+            return
+        parallelism = min(parallelism, CONFIG['server']['batch_parallelism'])
+        
+        if not request_data.get('stream'):
+            results = process_query_batch(queries, use_cache, parallelism, timings=timings, timeout=timeout)
+            self._send_json({'results': results})
+            return
+        
+        self._start_stream()
+        write_lock = threading.Lock()
+        
+        def send_result(index, result):
+            with write_lock:
+                self._send_event({'event': 'result', 'index': index, 'result': result})
+        
+        try:
+            process_query_batch(queries, use_cache, parallelism, on_result=send_result,
+                                timings=timings, timeout=timeout)
+            self._send_event({'event': 'done', 'count': len(queries)})
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return
+        except Exception as e:
+            self._send_event({'event': 'error', 'error': f'Server error: {str(e)}'})
+        self._end_stream()
+
+class BoundedThreadPoolHTTPServer(HTTPServer):
+    """
+    HTTP server that hands each connection to a bounded worker pool.
+    Up to max_workers connections are served at once and up to max_queue
+    more wait for a free worker; anything beyond that is answered with a
+    503 straight from the listener so one slow LLM call can't stall it.
+    Handlers close keep-alive connections while others are waiting, so a
+    waiting connection gets a worker within one request.
+    """
+    request_queue_size = 128
+
+    def __init__(self, server_address, handler_class, max_workers=8, max_queue=32):
+        super().__init__(server_address, handler_class)
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ai-worker')
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.busy = 0
+        self.waiting = 0
+        self._count_lock = threading.Lock()
+
+    def connections_waiting(self):
+        """Connections accepted but not yet picked up by a worker"""
+        return self.waiting
+
+    def process_request(self, request, client_address):
+        with self._count_lock:
+            full = self.busy + self.waiting >= self.max_workers + self.max_queue
+            if not full:
+                self.waiting += 1
+        if full:
+            self.reject_request(request)
+            return
+        try:
+            self.executor.submit(self.process_request_worker, request, client_address)
+        except RuntimeError:
+            # Executor already shut down
+            with self._count_lock:
+                self.waiting -= 1
+            self.shutdown_request(request)
+
+    def process_request_worker(self, request, client_address):
+        with self._count_lock:
+            self.waiting -= 1
+            self.busy += 1
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            with self._count_lock:
+                self.busy -= 1
+
+    def reject_request(self, request):
+        """Answer with 503 without reading the request and close the connection."""
+        body = json.dumps({'error': 'Server busy, try again later'}).encode('utf-8')
+        head = (
+            'HTTP/1.1 503 Service Unavailable\r\n'
+            'Content-Type: application/json\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            'Retry-After: 1\r\n'
+            'Access-Control-Allow-Origin: *\r\n'
+            'Connection: close\r\n\r\n'
+        ).encode('latin-1')
+        try:
+            request.sendall(head + body)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.executor.shutdown(wait=False)
 
 def run_server(port=8080):
     server_address = ('', port)
-    httpd = HTTPServer(server_address, AdvancedAIHandler)
-    print(f'Starting Advanced AI Workflow server on port {port}...')
+    server_config = CONFIG['server']
+    httpd = BoundedThreadPoolHTTPServer(
+        server_address,
+        AdvancedAIHandler,
+        max_workers=server_config['max_workers'],
+        max_queue=server_config['max_queue']
+    )
+    print(f'Starting Advanced AI Workflow server on port {port} '
+          f'({server_config["max_workers"]} workers, {server_config["max_queue"]} queued)...')
     httpd.serve_forever()
 
 if __name__ == '__main__':
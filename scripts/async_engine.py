@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Asyncio execution engine for the query pipeline.
+
+One event loop runs in a background thread and executes pipeline stages
+as coroutines, so independent stages can be awaited concurrently. Blocking
+work (HTTP calls, model inference) runs on the engine's thread pool with
+the caller's context variables, which keeps request traces intact.
+Blocking calls started with run_cancellable receive a threading.Event
+that is set when the awaiting task is cancelled, e.g. because its
+deadline passed, so they can stop early. run() is the bridge for
+synchronous callers, and spawn() starts background work nobody waits for.
+"""
+
+import asyncio
+import concurrent.futures
+import contextvars
+import functools
+import threading
+from typing import Any, Awaitable, Callable, Optional
+
+class DeadlineExceeded(TimeoutError):
+    """The request's deadline passed before the pipeline finished"""
+
+class AsyncEngine:
+    """Event loop thread plus the executor its blocking stages run on"""
+
+    def __init__(self, max_workers: int = 32):
+        self.max_workers = max_workers
+        self._loop = None
+        self._executor = None
+        self._lock = threading.Lock()
+        # Spawned tasks, referenced until they finish so they aren't collected
+        self._background = set()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    self._executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix='pipeline')
+                    loop = asyncio.new_event_loop()
+                    loop.set_default_executor(self._executor)
+                    threading.Thread(target=loop.run_forever, name='pipeline-loop', daemon=True).start()
+                    self._loop = loop
+        return self._loop
+
+    def run(self, coro: Awaitable, timeout: Optional[float] = None) -> Any:
+        """
+        Run a coroutine on the engine loop from synchronous code and return
+        its result. After timeout seconds the coroutine is cancelled and
+        DeadlineExceeded is raised. The caller's context variables are
+        visible to the coroutine.
+        """
+        loop = self.loop
+        result = concurrent.futures.Future()
+
+        def start():
+            task = loop.create_task(asyncio.wait_for(coro, timeout) if timeout is not None else coro)
+
+            def done(task):
+                if task.cancelled():
+                    result.cancel()
+                elif task.exception() is not None:
+                    result.set_exception(task.exception())
+                else:
+                    result.set_result(task.result())
+            task.add_done_callback(done)
+
+        loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+        try:
+            return result.result()
+        except asyncio.TimeoutError:
+            raise DeadlineExceeded(f"Request did not finish within {timeout}s")
+
+    def spawn(self, coro: Awaitable):
+        """
+        Run a coroutine on the engine loop in the background, from any
+        thread. Its exception, if any, is printed.
+        """
+        loop = self.loop
+
+        def start():
+            task = loop.create_task(coro)
+            self._background.add(task)
+
+            def done(task):
+                self._background.discard(task)
+                if not task.cancelled() and task.exception() is not None:
+                    print(f"Background task failed: {task.exception()!r}")
+            task.add_done_callback(done)
+
+        loop.call_soon_threadsafe(start, context=contextvars.copy_context())
+
+    async def run_blocking(self, fn: Callable, *args, **kwargs) -> Any:
+        """Await fn(*args, **kwargs) run on the engine's thread pool."""
+        call = functools.partial(contextvars.copy_context().run, fn, *args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self._executor, call)
+
+    async def run_cancellable(self, fn: Callable, *args, **kwargs) -> Any:
+        """
+        Like run_blocking, but fn also gets a cancel keyword argument: a
+        threading.Event set if the awaiting task is cancelled. The task
+        stops waiting at once; fn should check the event and return early.
+        """
+        cancel = threading.Event()
+        try:
+            return await self.run_blocking(fn, *args, cancel=cancel, **kwargs)
+        except asyncio.CancelledError:
+            cancel.set()
+            raise
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmark for comparing document chunkers.
+
+Chunks the document set with the character and token chunkers and reports,
+for each, the chunk count, how many chunks exceed the embedding model's
+input window (their tails are truncated and wasted), chunking and
+embedding time, and retrieval quality. Retrieval quality is measured with
+sentences sampled from the documents as queries: a query is answered
+correctly when a chunk of its source document is among the top k results.
+"""
+
+import argparse
+import json
+import random
+import sys
+import time
+from typing import Dict, List, Any
+
+import numpy as np
+from sentence_transformers import SentenceTransformer
+
+from chunker import CharacterChunker, TokenChunker, split_sentences
+from common import load_config
+from ingest_documents import get_document_files
+from loaders import iter_sections
+
+def sample_queries(texts: Dict[str, str], count: int, seed: int = 0) -> List[Dict[str, str]]:
+    """Pick sentences of at least 8 words from random documents as queries"""
+    rng = random.Random(seed)
+    candidates = []
+    for source, text in texts.items():
+        for start, end, _ in split_sentences(text):
+            sentence = text[start:end].strip()
+            if len(sentence.split()) >= 8:
+                candidates.append({"query": sentence, "source": source})
+    return rng.sample(candidates, min(count, len(candidates)))
+
+def evaluate(name: str, chunker, texts: Dict[str, str], model: SentenceTransformer,
+             queries: List[Dict[str, str]], top_k: int) -> Dict[str, Any]:
+    start = time.perf_counter()
+    chunks = [(source, chunk) for source, text in texts.items() for chunk in chunker.split(text)]
+    chunk_seconds = time.perf_counter() - start
+
+    chunk_texts = [chunk for _, chunk in chunks]
+    token_counts = [len(ids) for ids in model.tokenizer(chunk_texts, add_special_tokens=True)['input_ids']]
+    window = model.max_seq_length
+    truncated = [count for count in token_counts if count > window]
+
+    start = time.perf_counter()
+    embeddings = model.encode(chunk_texts, batch_size=64, show_progress_bar=False,
+                              convert_to_numpy=True, normalize_embeddings=True)
+    embed_seconds = time.perf_counter() - start
+
+    query_embeddings = model.encode([q["query"] for q in queries], batch_size=64, show_progress_bar=False,
+                                    convert_to_numpy=True, normalize_embeddings=True)
+    sources = np.array([source for source, _ in chunks])
+    hits = 0
+    reciprocal_ranks = []
+    for query, query_embedding in zip(queries, query_embeddings):
+        ranking = np.argsort(-(embeddings @ query_embedding))
+        # Rank of the first chunk from the query's own document
+        rank = int(np.nonzero(sources[ranking] == query["source"])[0][0]) + 1
+        hits += rank <= top_k
+        reciprocal_ranks.append(1.0 / rank)
+
+    return {
+        "chunker": name,
+        "chunks": len(chunks),
+        "mean_tokens": float(np.mean(token_counts)) if token_counts else 0.0,
+        "truncated_chunks": len(truncated),
+        "truncated_tokens": int(sum(count - window for count in truncated)),
+        "chunk_seconds": chunk_seconds,
+        "embed_seconds": embed_seconds,
+        f"recall_at_{top_k}": hits / len(queries) if queries else 0.0,
+        "mrr": float(np.mean(reciprocal_ranks)) if reciprocal_ranks else 0.0
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the character and token chunkers.")
+    parser.add_argument('--documents', help="documents directory (default: data.documents_path from config)")
+    parser.add_argument('--model', help="embedding model (default: vectordb.embedding_model from config)")
+    parser.add_argument('--queries', type=int, default=100, help="number of sampled queries")
+    parser.add_argument('--top-k', type=int, default=5)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--overlap', type=int, default=200)
+    parser.add_argument('--overlap-tokens', type=int, default=32)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    config = {}
+    if not args.documents or not args.model:
+        config = load_config()
+        args.documents = args.documents or config['data']['documents_path']
+        args.model = args.model or config['vectordb']['embedding_model']
+    loaders_config = config.get('ingestion', {}).get('loaders', {})
+
+    # Read every format through the loaders ingestion uses
+    texts = {}
+    for file_path in get_document_files(args.documents):
+        try:
+            sections = [section["text"] for section in iter_sections(file_path, loaders_config)]
+        except Exception as e:
+            print(f"Skipping {file_path}: {e}")
+            continue
+        texts[str(file_path)] = "\n\n".join(sections)
+    if not texts:
+        print("No documents found to benchmark.")
+        return False
+
+    model = SentenceTransformer(args.model)
+    queries = sample_queries(texts, args.queries)
+    chunkers = {
+        "character": CharacterChunker(args.chunk_size, args.overlap),
+        "token": TokenChunker(model.tokenizer, max_tokens=model.max_seq_length, overlap_tokens=args.overlap_tokens)
+    }
+
+    results = [evaluate(name, chunker, texts, model, queries, args.top_k) for name, chunker in chunkers.items()]
+
+    print(f"{len(texts)} documents, {len(queries)} queries, embedding window {model.max_seq_length} tokens")
+    for result in results:
+        print(f"{result['chunker']:<10} chunks={result['chunks']:<6} "
+              f"truncated={result['truncated_chunks']} ({result['truncated_tokens']} tokens) "
+              f"chunk={result['chunk_seconds']:.2f}s embed={result['embed_seconds']:.2f}s "
+              f"recall@{args.top_k}={result[f'recall_at_{args.top_k}']:.3f} mrr={result['mrr']:.3f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Load-testing and latency benchmark for the advanced AI workflow server.
+
+By default the server is started in-process against stub Ollama and Qdrant
+backends (see stub_backends.py), so the numbers measure the serving path
+itself: request handling, query routing, retrieval, prompt assembly and
+the LLM client. A query mix is replayed at each concurrency level and the
+throughput, latency percentiles and, for streamed requests, time to first
+token are reported and optionally written as JSON. --max-p99-ms makes the
+run fail when the tail latency regresses past a limit, for use in CI.
+
+Examples:
+    python scripts/benchmark_server.py --concurrency 1,4,16 --requests 200
+    python scripts/benchmark_server.py --stream --output benchmark.json
+    python scripts/benchmark_server.py --url http://localhost:8080
+"""
+
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+import requests
+
+from stub_backends import HashingEmbedder, server_url, start_stub_ollama, start_stub_qdrant
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Mix of general, search and summarization queries used when no files are given
+DEFAULT_QUERIES = [
+    "What are the different types of machine learning and how do they work?",
+    "Find documents about natural language processing",
+    "Search for information on computer vision",
+    "Summarize neural networks",
+    "Explain the difference between supervised and unsupervised learning",
+    "Give me a brief overview of reinforcement learning"
+]
+
+def load_queries(paths: List[str]) -> List[str]:
+    """
+    Read queries from JSON files shaped like data/examples/sample_query.json
+    ({"query": ...}), from {"queries": [...]}, or from a list of either.
+    Directories contribute every *.json file in them.
+    """
+    files = []
+    for path in map(Path, paths):
+        files.extend(sorted(path.glob('*.json')) if path.is_dir() else [path])
+    queries = []
+    for file_path in files:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, str):
+                queries.append(item)
+            elif 'queries' in item:
+                queries.extend(item['queries'])
+            elif 'query' in item:
+                queries.append(item['query'])
+    return queries
+
+def percentile(sorted_values: List[float], fraction: float) -> Optional[float]:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[index]
+
+def summarize(values: List[float]) -> Dict[str, Optional[float]]:
+    """Latency summary in milliseconds"""
+    values = sorted(values)
+    summary = {name: percentile(values, fraction) for name, fraction in
+               (("p50", 0.50), ("p90", 0.90), ("p99", 0.99))}
+    summary["mean"] = sum(values) / len(values) if values else None
+    summary["max"] = values[-1] if values else None
+    return {name: round(value * 1000, 2) if value is not None else None for name, value in summary.items()}
+
+def send_query(session: requests.Session, url: str, query: str, stream: bool, cache: bool) -> Dict[str, Any]:
+    """Send one query and time it; ttft is the first token event of a streamed response"""
+    body = {"query": query, "stream": stream, "cache": cache}
+    start = time.perf_counter()
+    ttft = None
+    try:
+        response = session.post(f"{url}/query", json=body, stream=stream, timeout=300)
+        if response.status_code != 200:
+            response.close()
+            return {"ok": False, "status": response.status_code, "latency": time.perf_counter() - start}
+        if stream:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get('event') == 'token' and ttft is None:
+                    ttft = time.perf_counter() - start
+                elif event.get('event') == 'error':
+                    return {"ok": False, "status": 200, "latency": time.perf_counter() - start}
+        else:
+            response.json()
+    except requests.RequestException:
+        return {"ok": False, "status": None, "latency": time.perf_counter() - start}
+    return {"ok": True, "status": 200, "latency": time.perf_counter() - start, "ttft": ttft}
+
+def run_level(url: str, queries: List[str], concurrency: int, total: int,
+              stream: bool, cache: bool) -> Dict[str, Any]:
+    """Replay the query mix round-robin with concurrency clients until total requests are done"""
+    counter = iter(range(total))
+    counter_lock = threading.Lock()
+
+    def client():
+        samples = []
+        with requests.Session() as session:
+            while True:
+                with counter_lock:
+                    i = next(counter, None)
+                if i is None:
+                    return samples
+                samples.append(send_query(session, url, queries[i % len(queries)], stream, cache))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(client) for _ in range(concurrency)]
+        samples = [sample for future in futures for sample in future.result()]
+    elapsed = time.perf_counter() - start
+
+    succeeded = [sample for sample in samples if sample["ok"]]
+    errors = {}
+    for sample in samples:
+        if not sample["ok"]:
+            errors[str(sample["status"])] = errors.get(str(sample["status"]), 0) + 1
+    result = {
+        "concurrency": concurrency,
+        "requests": len(samples),
+        "errors": len(samples) - len(succeeded),
+        "error_statuses": errors,
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(len(succeeded) / elapsed, 2) if elapsed else None,
+        "latency_ms": summarize([sample["latency"] for sample in succeeded])
+    }
+    if stream:
+        result["ttft_ms"] = summarize([sample["ttft"] for sample in succeeded if sample["ttft"] is not None])
+    return result
+
+def start_local_server(args) -> HTTPServer:
+    """Start the workflow server in-process with its backends pointed at the stubs"""
+    sys.path.insert(0, str(REPO_ROOT))
+    import advanced_ai_workflow as workflow
+    from scripts.lexical_index import LexicalIndex
+    from scripts.vector_search import payload_to_result, vector_search_from_config
+
+    ollama = start_stub_ollama(latency=args.latency, token_rate=args.token_rate,
+                               response_tokens=args.response_tokens)
+    workflow.CONFIG['llm']['base_url'] = server_url(ollama)
+    workflow.CONFIG['search']['backend'] = args.search
+    embedder = HashingEmbedder()
+    if args.search in ('vector', 'hybrid'):
+        qdrant = start_stub_qdrant(documents=args.documents, embedder=embedder)
+        workflow.CONFIG['vectordb']['url'] = server_url(qdrant)
+        workflow.VECTOR_SEARCH = vector_search_from_config(workflow.CONFIG['vectordb'], workflow.CONFIG['search'])
+        # Index the stub collection lexically too, as ingestion would
+        index = LexicalIndex()
+        index.add_documents(payload_to_result(i, 0.0, payload) for i, payload in enumerate(qdrant.payloads))
+        workflow.DOCUMENT_INDEX, workflow.DOCUMENT_INDEX_INGESTED = index, True
+    # Search, routing and the semantic cache share one query embedder, as
+    # in the server
+    if not args.real_embeddings:
+        workflow.VECTOR_SEARCH.embedder = embedder
+    workflow.QUERY_ROUTER = workflow.router_from_config(workflow.CONFIG['router'], workflow.VECTOR_SEARCH.embedder)
+    workflow.SEMANTIC_CACHE = workflow.semantic_cache_from_config(
+        workflow.CONFIG['semantic_cache'], workflow.VECTOR_SEARCH.embedder, workflow.corpus_version)
+
+    class QuietHandler(workflow.AdvancedAIHandler):
+        def log_message(self, format, *args):
+            pass
+
+    server_config = workflow.CONFIG['server']
+    server = workflow.BoundedThreadPoolHTTPServer(
+        ('127.0.0.1', 0),
+        QuietHandler,
+        max_workers=server_config['max_workers'],
+        max_queue=server_config['max_queue']
+    )
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark throughput and latency of the workflow server.")
+    parser.add_argument('--url', help="benchmark a running server instead of starting one against stubs")
+    parser.add_argument('--queries', nargs='*', default=[],
+                        help="JSON query files or directories (default: a built-in mix plus data/examples)")
+    parser.add_argument('--concurrency', default='1,4,16', help="comma-separated concurrency levels")
+    parser.add_argument('--requests', type=int, default=100, help="requests per concurrency level")
+    parser.add_argument('--warmup', type=int, default=5, help="untimed requests before the first level")
+    parser.add_argument('--stream', action='store_true', help="stream responses and measure time to first token")
+    parser.add_argument('--cache', action='store_true', help="allow LLM response cache hits")
+    parser.add_argument('--search', choices=['lexical', 'vector', 'hybrid'], default='vector',
+                        help="retrieval backend of the in-process server")
+    parser.add_argument('--real-embeddings', action='store_true',
+                        help="embed queries with the configured model instead of the hashing stub")
+    parser.add_argument('--latency', type=float, default=0.05, help="stub Ollama seconds to first token")
+    parser.add_argument('--token-rate', type=float, default=50.0, help="stub Ollama tokens per second")
+    parser.add_argument('--response-tokens', type=int, default=32, help="stub Ollama tokens per response")
+    parser.add_argument('--documents', type=int, default=1000, help="stub Qdrant collection size")
+    parser.add_argument('--max-p99-ms', type=float, help="fail if any level's p99 latency exceeds this")
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    queries = load_queries(args.queries) if args.queries else \
+        DEFAULT_QUERIES + load_queries([str(REPO_ROOT / 'data' / 'examples')])
+    if not queries:
+        print("No queries found to benchmark.")
+        return False
+    levels = [int(level) for level in args.concurrency.split(',') if level.strip()]
+
+    url = args.url.rstrip('/') if args.url else server_url(start_local_server(args))
+    target = url if args.url else "in-process server with stub backends"
+
+    with requests.Session() as session:
+        for i in range(args.warmup):
+            send_query(session, url, queries[i % len(queries)], args.stream, args.cache)
+
+    print(f"Benchmarking {target}: {len(queries)} queries, {args.requests} requests per level"
+          f"{', streaming' if args.stream else ''}")
+    results = []
+    for concurrency in levels:
+        result = run_level(url, queries, concurrency, args.requests, args.stream, args.cache)
+        results.append(result)
+        latency = result["latency_ms"]
+        line = (f"concurrency={concurrency:<4} req/s={result['requests_per_second']:<8} "
+                f"p50={latency['p50']}ms p90={latency['p90']}ms p99={latency['p99']}ms "
+                f"errors={result['errors']}")
+        if args.stream:
+            line += f" ttft_p50={result['ttft_ms']['p50']}ms ttft_p99={result['ttft_ms']['p99']}ms"
+        print(line)
+
+    if args.output:
+        report = {
+            "target": target,
+            "settings": {key: value for key, value in vars(args).items() if key not in ('output', 'queries')},
+            "queries": len(queries),
+            "results": results
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.max_p99_ms is not None:
+        slow = [result for result in results
+                if result["errors"] or (result["latency_ms"]["p99"] or 0) > args.max_p99_ms]
+        if slow:
+            print(f"p99 latency above {args.max_p99_ms}ms or errors at concurrency "
+                  f"{', '.join(str(result['concurrency']) for result in slow)}")
+            return False
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Document chunkers used by ingest_documents.py.
+
+CharacterChunker is the original fixed-size character window. TokenChunker
+packs whole sentences into chunks sized by the embedding model's own
+tokenizer, breaks at paragraph boundaries where it can, and overlaps
+chunks by a number of tokens. Chunks then match the model's input window
+instead of being truncated or split mid-word.
+"""
+
+import math
+import re
+from typing import Dict, List, Any, Tuple
+
+# Sentence ends, or a blank line ending a paragraph. One pass of this
+# compiled pattern finds every boundary in the text.
+BOUNDARY_PATTERN = re.compile(r'(?<=[.!?])["\')\]]*\s+|\n[ \t]*\n\s*')
+
+class CharacterChunker:
+    """Fixed-size character windows with character overlap"""
+
+    def __init__(self, chunk_size: int = 1000, overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+
+    def split(self, text: str) -> List[str]:
+        chunks = []
+        for i in range(0, len(text), self.chunk_size - self.overlap):
+            chunk_text = text[i:i + self.chunk_size]
+            if chunk_text.strip():
+                chunks.append(chunk_text)
+        return chunks
+
+def split_sentences(text: str) -> List[Tuple[int, int, bool]]:
+    """
+    Split text into (start, end, starts_paragraph) sentence spans.
+    Whitespace between sentences is excluded from the spans.
+    """
+    spans = []
+    start = 0
+    starts_paragraph = True
+    for match in BOUNDARY_PATTERN.finditer(text):
+        end = match.start()
+        # Keep closing quotes and brackets with the sentence they end
+        while end < match.end() and not text[end].isspace():
+            end += 1
+        if text[start:end].strip():
+            spans.append((start, end, starts_paragraph))
+        starts_paragraph = text[end:match.end()].count('\n') >= 2
+        start = match.end()
+    if text[start:].strip():
+        spans.append((start, len(text.rstrip()), starts_paragraph))
+    return spans
+
+class TokenChunker:
+    """
+    Packs sentences into chunks of at most max_tokens tokens as counted by
+    the embedding model's tokenizer. Consecutive chunks share up to
+    overlap_tokens tokens of whole trailing sentences. A chunk that is at
+    least min_fill full is closed at a paragraph boundary rather than
+    starting the next paragraph in it.
+    """
+
+    def __init__(self, tokenizer, max_tokens: int = 256, overlap_tokens: int = 32, min_fill: float = 0.5):
+        self.tokenizer = tokenizer
+        # Leave room for the [CLS]/[SEP] tokens the model adds
+        self.max_tokens = max_tokens - 2
+        self.overlap_tokens = overlap_tokens
+        self.min_fill = min_fill
+
+    def count_tokens(self, texts: List[str]) -> List[int]:
+        """Token counts for many texts in a single batched tokenizer call"""
+        if not texts:
+            return []
+        encoded = self.tokenizer(texts, add_special_tokens=False)['input_ids']
+        return [len(ids) for ids in encoded]
+
+    def _split_long(self, text: str, start: int, end: int, tokens: int) -> List[Tuple[int, int, int]]:
+        """Cut a sentence longer than the budget into roughly equal word runs"""
+        pieces = math.ceil(tokens / self.max_tokens)
+        words = [match.span() for match in re.finditer(r'\S+', text[start:end])]
+        per_piece = math.ceil(len(words) / pieces)
+        spans = []
+        for i in range(0, len(words), per_piece):
+            run = words[i:i + per_piece]
+            spans.append((start + run[0][0], start + run[-1][1]))
+        counts = self.count_tokens([text[s:e] for s, e in spans])
+        return [(s, e, count) for (s, e), count in zip(spans, counts)]
+
+    def split(self, text: str) -> List[str]:
+        sentences = split_sentences(text)
+        counts = self.count_tokens([text[start:end] for start, end, _ in sentences])
+
+        # (start, end, tokens, starts_paragraph) with no unit over budget
+        units = []
+        for (start, end, starts_paragraph), tokens in zip(sentences, counts):
+            if tokens <= self.max_tokens:
+                units.append((start, end, tokens, starts_paragraph))
+            else:
+                for i, (s, e, t) in enumerate(self._split_long(text, start, end, tokens)):
+                    units.append((s, e, t, starts_paragraph and i == 0))
+
+        chunks = []
+        current = []
+        current_tokens = 0
+        for unit in units:
+            _, _, tokens, starts_paragraph = unit
+            full = current_tokens + tokens > self.max_tokens
+            paragraph_break = starts_paragraph and current_tokens >= self.min_fill * self.max_tokens
+            if current and (full or paragraph_break):
+                chunks.append(text[current[0][0]:current[-1][1]])
+                current, current_tokens = self._overlap(current, tokens)
+            current.append(unit)
+            current_tokens += tokens
+        if current:
+            chunks.append(text[current[0][0]:current[-1][1]])
+        return chunks
+
+    def _overlap(self, previous: List[Tuple], next_tokens: int) -> Tuple[List[Tuple], int]:
+        """Trailing sentences of the previous chunk to repeat at the start of the next"""
+        carried = []
+        carried_tokens = 0
+        budget = min(self.overlap_tokens, self.max_tokens - next_tokens)
+        for unit in reversed(previous):
+            if carried_tokens + unit[2] > budget:
+                break
+            carried.insert(0, unit)
+            carried_tokens += unit[2]
+        return carried, carried_tokens
+
+def load_tokenizer(model_name: str):
+    """Load only the tokenizer of a sentence-transformers model"""
+    from transformers import AutoTokenizer
+    return AutoTokenizer.from_pretrained(model_name)
+
+def chunker_from_config(ingestion_config: Dict[str, Any], model_name: str, tokenizer=None):
+    """
+    Build the chunker selected by ingestion.chunker: "character" (default)
+    or "token". The tokenizer is loaded from model_name unless given.
+    """
+    kind = ingestion_config.get('chunker', 'character')
+    if kind == 'character':
+        return CharacterChunker(
+            chunk_size=ingestion_config.get('chunk_size', 1000),
+            overlap=ingestion_config.get('overlap', 200)
+        )
+    if kind == 'token':
+        return TokenChunker(
+            tokenizer if tokenizer is not None else load_tokenizer(model_name),
+            max_tokens=ingestion_config.get('max_tokens', 256),
+            overlap_tokens=ingestion_config.get('overlap_tokens', 32)
+        )
+    raise ValueError(f"Unknown chunker: {kind}")
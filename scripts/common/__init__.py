@@ -0,0 +1,8 @@
+"""
+Helpers shared by the command-line scripts: the cached config loader,
+the warm embedding daemon used by ingestion and Qdrant collection setup.
+"""
+
+from .config import load_config
+from .embedding_daemon import load_embedder
+from .qdrant import create_collection
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Config loading shared by the scripts.
+
+The config is read once per process from the file named by the
+AI_WORKFLOW_CONFIG environment variable or, if that isn't set, from the
+first of /app/config.json (the container path) and the repository's
+config.json that exists.
+"""
+
+import functools
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Any, Optional
+
+CONFIG_ENV = 'AI_WORKFLOW_CONFIG'
+
+DEFAULT_CONFIG_PATHS = (
+    '/app/config.json',
+    str(Path(__file__).resolve().parents[2] / 'config.json')
+)
+
+def config_paths() -> List[str]:
+    """Paths searched for the config, in order"""
+    path = os.environ.get(CONFIG_ENV)
+    return [path] if path else list(DEFAULT_CONFIG_PATHS)
+
+def find_config() -> Optional[str]:
+    """The config file that load_config reads, or None if there is none"""
+    for path in config_paths():
+        if os.path.isfile(path):
+            return path
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _read_config(path: str) -> Dict[str, Any]:
+    with open(path, 'r') as f:
+        return json.load(f)
+
+def load_config(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Load configuration from config.json, or from path if given. The parsed
+    config is cached and shared, so callers must not modify it. Exits if
+    no config can be read.
+    """
+    path = path or find_config()
+    if path is None:
+        print(f"Error loading config: no config file at {', '.join(config_paths())}")
+        sys.exit(1)
+    try:
+        return _read_config(path)
+    except Exception as e:
+        print(f"Error loading config: {e}")
+        sys.exit(1)
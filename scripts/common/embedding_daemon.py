@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+"""
+Warm embedding worker shared by ingestion runs.
+
+Importing torch and loading a SentenceTransformer takes seconds, which
+every ingest used to pay again. The daemon keeps models loaded in a
+background process and encodes texts for clients over a Unix socket.
+load_embedder() connects to it, starting it when it isn't running, and
+falls back to loading the model in-process if the daemon can't be used.
+The daemon exits after idle_timeout seconds without requests.
+
+The socket lives in a directory only its user can enter, by default in
+$XDG_RUNTIME_DIR or else /tmp/ai-workflow-<uid>, and clients only use a
+daemon run by their own user.
+
+Each message is a 4-byte big-endian length followed by that many bytes
+of JSON. A request is {"model", "texts", "batch_size"}; the reply is
+{"shape": [n, d]}, followed by the n x d float32 embeddings as raw
+bytes, or {"error": message}.
+
+Example:
+    python scripts/common/embedding_daemon.py --socket /run/user/1000/embeddings.sock
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Optional, Union
+
+import numpy as np
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime_dir and os.path.isdir(runtime_dir):
+        return os.path.join(runtime_dir, 'ai-workflow-embeddings.sock')
+    return f"/tmp/ai-workflow-{os.getuid()}/embeddings.sock"
+
+DEFAULT_SOCKET_PATH = default_socket_path()
+DEFAULT_IDLE_TIMEOUT = 1800
+
+_HEADER = struct.Struct('>I')
+
+def make_socket_dir(socket_path: str):
+    """Create the socket's directory, if missing, accessible to this user only"""
+    os.makedirs(os.path.dirname(os.path.abspath(socket_path)), mode=0o700, exist_ok=True)
+
+def check_peer(sock: socket.socket, socket_path: str):
+    """
+    Raise PermissionError unless the daemon on sock runs as this user. Where
+    the peer's credentials aren't available, the socket's directory must be
+    owned by this user and closed to everyone else instead.
+    """
+    if hasattr(socket, 'SO_PEERCRED'):
+        credentials = sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize('3i'))
+        _, uid, _ = struct.unpack('3i', credentials)
+        if uid != os.getuid():
+            raise PermissionError(f"Embedding daemon on {socket_path} runs as uid {uid}, not {os.getuid()}")
+        return
+    info = os.stat(os.path.dirname(os.path.abspath(socket_path)))
+    if info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise PermissionError(f"Directory of {socket_path} must be private to uid {os.getuid()}")
+
+def send_message(sock: socket.socket, data: Dict[str, Any]):
+    body = json.dumps(data).encode('utf-8')
+    sock.sendall(_HEADER.pack(len(body)) + body)
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if not count:
+            raise ConnectionError("Connection closed mid-message")
+        received += count
+    return bytes(buffer)
+
+def recv_message(sock: socket.socket) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(recv_exact(sock, _HEADER.size))
+    return json.loads(recv_exact(sock, size))
+
+class EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """Serves encode requests on one connection until the client closes it"""
+
+    def handle(self):
+        while True:
+            try:
+                request = recv_message(self.request)
+            except (ConnectionError, struct.error):
+                return
+            with self.server.active():
+                try:
+                    embeddings = self.server.encode(request['model'], request['texts'],
+                                                    request.get('batch_size', 32))
+                except Exception as e:
+                    send_message(self.request, {"error": str(e)})
+                    continue
+                send_message(self.request, {"shape": list(embeddings.shape)})
+                self.request.sendall(embeddings.tobytes())
+
+class EmbeddingDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server holding loaded models, one encode at a time per model"""
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT):
+        make_socket_dir(socket_path)
+        if os.path.exists(socket_path):
+            # Left behind by a daemon that didn't shut down cleanly
+            os.unlink(socket_path)
+        super().__init__(socket_path, EmbeddingRequestHandler)
+        os.chmod(socket_path, 0o600)
+        self.socket_path = socket_path
+        self.idle_timeout = idle_timeout
+        self.models = {}
+        self._model_locks = {}
+        self._lock = threading.Lock()
+        self._active = 0
+        self._last_request = time.monotonic()
+
+    @contextmanager
+    def active(self) -> Iterator[None]:
+        """Count the enclosed request as in progress"""
+        with self._lock:
+            self._active += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._last_request = time.monotonic()
+
+    def _model(self, model_name: str):
+        with self._lock:
+            lock = self._model_locks.setdefault(model_name, threading.Lock())
+        with lock:
+            if model_name not in self.models:
+                from sentence_transformers import SentenceTransformer
+                start = time.perf_counter()
+                self.models[model_name] = SentenceTransformer(model_name)
+                print(f"Loaded {model_name} in {time.perf_counter() - start:.1f}s", flush=True)
+            return self.models[model_name], lock
+
+    def encode(self, model_name: str, texts: List[str], batch_size: int) -> np.ndarray:
+        model, lock = self._model(model_name)
+        if not texts:
+            return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+        with lock:
+            embeddings = model.encode(texts, batch_size=batch_size, show_progress_bar=False, convert_to_numpy=True)
+        return np.ascontiguousarray(embeddings, dtype=np.float32)
+
+    def serve_until_idle(self):
+        """Serve requests until none arrived for idle_timeout seconds"""
+        def watch():
+            while True:
+                time.sleep(min(self.idle_timeout, 30))
+                with self._lock:
+                    idle = not self._active and time.monotonic() - self._last_request >= self.idle_timeout
+                if idle:
+                    self.shutdown()
+                    return
+        threading.Thread(target=watch, daemon=True).start()
+        try:
+            self.serve_forever()
+        finally:
+            self.server_close()
+            if os.path.exists(self.socket_path):
+                os.unlink(self.socket_path)
+
+class RemoteEmbedder:
+    """
+    Stand-in for a SentenceTransformer whose encode() runs in the daemon.
+    One connection is kept open and shared under a lock.
+    """
+
+    def __init__(self, socket_path: str, model_name: str, timeout: Optional[float] = 600):
+        self.socket_path = socket_path
+        self.model_name = model_name
+        self.timeout = timeout
+        # The chunker loads its own tokenizer when it needs one
+        self.tokenizer = None
+        self._sock = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> socket.socket:
+        if self._sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+                check_peer(sock, self.socket_path)
+            except OSError:
+                sock.close()
+                raise
+            self._sock = sock
+        return self._sock
+
+    def _request(self, texts: List[str], batch_size: int) -> np.ndarray:
+        sock = self._connect()
+        send_message(sock, {"model": self.model_name, "texts": texts, "batch_size": batch_size})
+        reply = recv_message(sock)
+        if 'error' in reply:
+            raise RuntimeError(f"Embedding daemon: {reply['error']}")
+        rows, dimension = reply['shape']
+        data = recv_exact(sock, rows * dimension * 4)
+        return np.frombuffer(data, dtype=np.float32).reshape(rows, dimension)
+
+    def encode(self, texts: Union[str, List[str]], batch_size: int = 32, show_progress_bar: bool = False,
+               convert_to_numpy: bool = True) -> np.ndarray:
+        single = isinstance(texts, str)
+        with self._lock:
+            try:
+                embeddings = self._request([texts] if single else list(texts), batch_size)
+            except ConnectionError:
+                # The daemon may have restarted since the last request
+                self.close()
+                embeddings = self._request([texts] if single else list(texts), batch_size)
+        return embeddings[0] if single else embeddings
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+def start_daemon(socket_path: str, idle_timeout: float = DEFAULT_IDLE_TIMEOUT) -> subprocess.Popen:
+    """Start the daemon in its own session, logging next to its socket"""
+    make_socket_dir(socket_path)
+    with open(f"{socket_path}.log", 'ab') as log:
+        return subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--socket', socket_path, '--idle-timeout', str(idle_timeout)],
+            stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+
+def connect_embedder(socket_path: str, model_name: str, start: bool = True,
+                     idle_timeout: float = DEFAULT_IDLE_TIMEOUT, start_timeout: float = 30.0) -> RemoteEmbedder:
+    """
+    A RemoteEmbedder for model_name with the model loaded, starting the
+    daemon if no daemon listens on socket_path and start is set.
+    """
+    embedder = RemoteEmbedder(socket_path, model_name)
+    try:
+        embedder._connect()
+    except PermissionError:
+        # Someone else's daemon; don't replace its socket with ours
+        raise
+    except OSError:
+        if not start:
+            raise
+        process = start_daemon(socket_path, idle_timeout)
+        deadline = time.monotonic() + start_timeout
+        while True:
+            try:
+                embedder._connect()
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError(f"Embedding daemon did not start; see {socket_path}.log")
+                time.sleep(0.1)
+    # Load the model now, so a failure shows up before any work is done
+    embedder.encode([])
+    return embedder
+
+def load_embedder(model_name: str, daemon_config: Optional[Dict[str, Any]] = None):
+    """
+    An object with SentenceTransformer's encode() for model_name: the warm
+    daemon when daemon_config (ingestion.embedding_daemon) enables it,
+    otherwise the model loaded in this process.
+    """
+    daemon_config = daemon_config or {}
+    if daemon_config.get('enabled'):
+        try:
+            return connect_embedder(
+                daemon_config.get('socket_path', DEFAULT_SOCKET_PATH),
+                model_name,
+                idle_timeout=daemon_config.get('idle_timeout', DEFAULT_IDLE_TIMEOUT),
+                start_timeout=daemon_config.get('start_timeout', 30.0)
+            )
+        except Exception as e:
+            print(f"Embedding daemon unavailable, loading the model in-process: {e}")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(model_name)
+
+def main():
+    parser = argparse.ArgumentParser(description="Keep embedding models loaded and serve them over a Unix socket.")
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help="Unix socket path")
+    parser.add_argument('--idle-timeout', type=float, default=DEFAULT_IDLE_TIMEOUT,
+                        help="seconds without requests before the daemon exits")
+    args = parser.parse_args()
+
+    # Another daemon may have started first
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(args.socket)
+        print(f"An embedding daemon is already listening on {args.socket}")
+        return True
+    except OSError:
+        pass
+    finally:
+        probe.close()
+
+    server = EmbeddingDaemon(args.socket, idle_timeout=args.idle_timeout)
+    print(f"Embedding daemon listening on {args.socket}", flush=True)
+    server.serve_until_idle()
+    return True
+
+if __name__ == "__main__":
+    success = main()
+    sys.exit(0 if success else 1)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Qdrant collection setup shared by setup_vectordb.py and ingestion.
+
+With a "quantization" entry in the vectordb config, the collection keeps
+int8 copies of its vectors, a quarter of the size, which searches score
+first; the original vectors, kept on disk when "on_disk" is set, are only
+read to rescore the best candidates.
+"""
+
+from typing import Dict, Any
+
+def create_collection(client, vectordb_config: Dict[str, Any]):
+    """Create the cosine collection described by the "vectordb" config section"""
+    from qdrant_client.http import models
+
+    quantization = vectordb_config.get('quantization')
+    quantization_config = None
+    if quantization:
+        if quantization.get('type', 'int8') != 'int8':
+            raise ValueError(f"Unsupported quantization type {quantization['type']}")
+        quantization_config = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8,
+                quantile=quantization.get('quantile'),
+                always_ram=quantization.get('always_ram', True)
+            )
+        )
+    client.create_collection(
+        collection_name=vectordb_config['collection_name'],
+        vectors_config=models.VectorParams(
+            size=vectordb_config['dimension'],
+            distance=models.Distance.COSINE,
+            on_disk=vectordb_config.get('on_disk')
+        ),
+        quantization_config=quantization_config
+    )
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Builds the document context of RAG prompts within a token budget.
+
+Search results are taken in score order and packed until the budget is
+spent. Chunks that repeat text already selected are dropped, and chunks
+that overlap a selected one (the ingester overlaps neighbouring chunks)
+are merged into it so the shared text appears once. The packed blocks are
+then ordered by source rather than score, so the same documents always
+produce the same context text and the prompt prefix stays stable, which
+lets Ollama reuse its prompt cache across turns.
+"""
+
+from typing import Callable, Dict, List, Any, Optional
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    """Token count estimated from the character count"""
+    return int(len(text) / chars_per_token) + 1
+
+def find_overlap(left: str, right: str, min_overlap: int = 50, max_overlap: int = 1000) -> int:
+    """Length of the longest suffix of left that is a prefix of right, if at least min_overlap"""
+    if len(left) < min_overlap or len(right) < min_overlap:
+        return 0
+    probe = right[:min_overlap]
+    # Earlier positions give longer overlaps, so the first full match wins
+    position = left.find(probe, max(0, len(left) - max_overlap))
+    while position != -1:
+        if right.startswith(left[position:]):
+            return len(left) - position
+        position = left.find(probe, position + 1)
+    return 0
+
+def truncate_to_tokens(text: str, max_tokens: int, count_tokens: Callable[[str], int]) -> str:
+    """Cut text at a word break so that it fits in max_tokens"""
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text.rfind(' ', 0, low)
+    return text[:cut if cut > low // 2 else low].rstrip()
+
+def source_of(doc: Dict[str, Any]) -> str:
+    return doc.get("source") or doc.get("title") or str(doc.get("id"))
+
+class ContextBlock:
+    """Contiguous text of one source, made of one or more merged chunks"""
+
+    def __init__(self, doc: Dict[str, Any]):
+        self.source = source_of(doc)
+        self.title = doc.get("title") or self.source
+        self.text = doc["content"]
+        self.docs = [doc]
+        self.tokens = 0
+
+    @property
+    def sort_key(self):
+        return (self.source, min(str(doc.get("id")) for doc in self.docs))
+
+def merge_text(text: str, content: str, min_overlap: int) -> Optional[str]:
+    """text extended by content if content repeats or overlaps either end of it, else None"""
+    if content in text:
+        return text
+    overlap = find_overlap(text, content, min_overlap)
+    if overlap:
+        return text + content[overlap:]
+    overlap = find_overlap(content, text, min_overlap)
+    if overlap:
+        return content + text[overlap:]
+    return None
+
+class ContextBuilder:
+    """
+    Packs search results into at most max_tokens of context. count_tokens
+    defaults to a character-based estimate; pass a tokenizer-backed
+    counter for exact budgets.
+    """
+
+    def __init__(self, max_tokens: int = 1500, min_overlap: int = 50,
+                 count_tokens: Optional[Callable[[str], int]] = None, chars_per_token: float = 4.0):
+        self.max_tokens = max_tokens
+        self.min_overlap = min_overlap
+        self.count_tokens = count_tokens or (lambda text: estimate_tokens(text, chars_per_token))
+
+    @staticmethod
+    def format_block(title: str, text: str) -> str:
+        return f"Document: {title}\nContent: {text}"
+
+    def _block_tokens(self, title: str, text: str) -> int:
+        # Includes the blank line separating blocks
+        return self.count_tokens(self.format_block(title, text) + "\n\n")
+
+    def _find_merge(self, blocks: List[ContextBlock], doc: Dict[str, Any]):
+        source = source_of(doc)
+        for block in blocks:
+            if block.source == source:
+                text = merge_text(block.text, doc["content"], self.min_overlap)
+                if text is not None:
+                    return block, text
+        return None, None
+
+    def build(self, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Returns {"context": text, "documents": results used, in score
+        order, "tokens": context tokens}.
+        """
+        blocks = []
+        used = []
+        total = 0
+        ranked = sorted(results, key=lambda doc: doc.get("score", doc.get("relevance", 0)), reverse=True)
+        for doc in ranked:
+            if not doc.get("content"):
+                continue
+            block, text = self._find_merge(blocks, doc)
+            if block is not None:
+                tokens = self._block_tokens(block.title, text)
+                if total - block.tokens + tokens > self.max_tokens:
+                    continue
+                total += tokens - block.tokens
+                block.text, block.tokens = text, tokens
+                block.docs.append(doc)
+                used.append(doc)
+                continue
+
+            block = ContextBlock(doc)
+            block.tokens = self._block_tokens(block.title, block.text)
+            if total + block.tokens > self.max_tokens:
+                if blocks:
+                    continue
+                # Always include the best result, cut to the budget
+                header_tokens = self._block_tokens(block.title, "")
+                block.text = truncate_to_tokens(block.text, self.max_tokens - header_tokens, self.count_tokens)
+                block.tokens = self._block_tokens(block.title, block.text)
+            blocks.append(block)
+            used.append(doc)
+            total += block.tokens
+
+        blocks.sort(key=lambda block: block.sort_key)
+        return {
+            "context": "\n\n".join(self.format_block(block.title, block.text) for block in blocks),
+            "documents": used,
+            "tokens": total
+        }
+
+def context_builder_from_config(context_config: Dict[str, Any]) -> ContextBuilder:
+    return ContextBuilder(
+        max_tokens=context_config.get('max_tokens', 1500),
+        min_overlap=context_config.get('min_overlap', 50),
+        chars_per_token=context_config.get('chars_per_token', 4)
+    )
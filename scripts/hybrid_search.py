@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+Hybrid retrieval: fusing lexical and vector search results, and optionally
+reranking the fused candidates with a cross-encoder.
+
+BM25 finds exact terms (names, error codes, identifiers) that embeddings
+blur, and vector search finds paraphrases that share no terms with the
+query. Reciprocal rank fusion combines their rankings without comparing
+their incomparable scores: a document scores sum(weight / (k + rank)) over
+the result lists it appears in, so documents ranked well by both come first.
+
+A cross-encoder reads the query and a document together and ranks far more
+accurately than either retriever, at the cost of a model call per pair.
+The reranker scores the best fused candidates in batches and stops once
+its latency budget would be exceeded; candidates left unscored keep their
+fused order after the scored ones.
+"""
+
+import math
+import threading
+import time
+from typing import Dict, List, Any, Optional
+
+def reciprocal_rank_fusion(result_lists: Dict[str, List[Dict[str, Any]]], k: float = 60,
+                           weights: Optional[Dict[str, float]] = None,
+                           top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Fuse result lists keyed by retriever name into one ranking, best first.
+    Results with the same "id" are merged. Each fused result is a copy with
+    "score" set to its fusion score, "relevance" to the best relevance it
+    was given and "retrievers" to the retrievers that found it.
+    """
+    weights = weights or {}
+    fused: Dict[str, Dict[str, Any]] = {}
+    for retriever, results in result_lists.items():
+        weight = weights.get(retriever, 1.0)
+        for rank, doc in enumerate(results, 1):
+            key = str(doc["id"])
+            entry = fused.get(key)
+            if entry is None:
+                entry = fused[key] = dict(doc, score=0.0, retrievers=[])
+            entry["score"] += weight / (k + rank)
+            entry["relevance"] = max(entry.get("relevance", 0), doc.get("relevance", 0))
+            entry["retrievers"].append(retriever)
+    ranked = sorted(fused.values(), key=lambda doc: doc["score"], reverse=True)
+    return ranked[:top_k] if top_k is not None else ranked
+
+class CrossEncoderReranker:
+    """
+    Reranks candidates with a sentence-transformers CrossEncoder, loaded on
+    first use. At most max_candidates per query are scored, batch_size
+    pairs per model call, within latency_budget seconds per rerank call
+    (0 for no limit).
+    """
+
+    def __init__(self, model_name: str, batch_size: int = 16, max_candidates: int = 20,
+                 latency_budget: float = 0.25, max_chars: int = 2000):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_candidates = max_candidates
+        self.latency_budget = latency_budget
+        # Documents are cut to this many characters; the model truncates to
+        # its own maximum length anyway
+        self.max_chars = max_chars
+        self.enabled = True
+        self.reranked = 0
+        self.budget_exceeded = 0
+        self._model = None
+        self._model_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    from sentence_transformers import CrossEncoder
+                    self._model = CrossEncoder(self.model_name)
+        return self._model
+
+    def rerank(self, query: str, candidates: List[Dict[str, Any]],
+               top_k: Optional[int] = None) -> List[Dict[str, Any]]:
+        return self.rerank_batch([query], [candidates], top_k)[0]
+
+    def rerank_batch(self, queries: List[str], candidate_lists: List[List[Dict[str, Any]]],
+                     top_k: Optional[int] = None) -> List[List[Dict[str, Any]]]:
+        """
+        Rerank each query's candidates, sharing model calls and the latency
+        budget across queries. Scored results get "rerank_score", and
+        "score" becomes the sigmoid of it so it orders the new ranking.
+        """
+        if not self.enabled:
+            return [candidates[:top_k] if top_k is not None else candidates for candidates in candidate_lists]
+        try:
+            model = self.model
+        except Exception as e:
+            # Keep serving fused results rather than failing searches
+            print(f"Reranker unavailable, using fused results: {e}")
+            self.enabled = False
+            return [candidates[:top_k] if top_k is not None else candidates for candidates in candidate_lists]
+
+        # Interleave queries so a budget cut leaves every query some scored results
+        pairs = []
+        for rank in range(self.max_candidates):
+            for i, candidates in enumerate(candidate_lists):
+                if rank < len(candidates) and candidates[rank].get("content"):
+                    pairs.append((i, rank))
+
+        scores = {}
+        start = time.perf_counter()
+        batch_seconds = 0.0
+        for offset in range(0, len(pairs), self.batch_size):
+            if self.latency_budget and offset:
+                elapsed = time.perf_counter() - start
+                # Skip a batch that would be expected to overrun the budget
+                if elapsed + batch_seconds > self.latency_budget:
+                    self.budget_exceeded += 1
+                    break
+            batch = pairs[offset:offset + self.batch_size]
+            batch_start = time.perf_counter()
+            predictions = model.predict(
+                [(queries[i], candidate_lists[i][rank]["content"][:self.max_chars]) for i, rank in batch],
+                batch_size=self.batch_size, show_progress_bar=False
+            )
+            batch_seconds = time.perf_counter() - batch_start
+            scores.update(zip(batch, (float(score) for score in predictions)))
+        self.reranked += len(scores)
+
+        reranked = []
+        for i, candidates in enumerate(candidate_lists):
+            scored = []
+            unscored = []
+            for rank, doc in enumerate(candidates):
+                score = scores.get((i, rank))
+                if score is None:
+                    unscored.append(dict(doc, score=0.0))
+                else:
+                    scored.append(dict(doc, rerank_score=score, score=1.0 / (1.0 + math.exp(-max(score, -50.0)))))
+            scored.sort(key=lambda doc: doc["rerank_score"], reverse=True)
+            results = scored + unscored
+            reranked.append(results[:top_k] if top_k is not None else results)
+        return reranked
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "model": self.model_name,
+            "pairs_scored": self.reranked,
+            "budget_exceeded": self.budget_exceeded
+        }
+
+def reranker_from_config(rerank_config: Dict[str, Any]) -> Optional[CrossEncoderReranker]:
+    """Build the reranker described by the "rerank" config section, or None when it is disabled."""
+    if not rerank_config.get('enabled'):
+        return None
+    return CrossEncoderReranker(
+        rerank_config['model'],
+        batch_size=rerank_config.get('batch_size', 16),
+        max_candidates=rerank_config.get('max_candidates', 20),
+        latency_budget=rerank_config.get('latency_budget', 0.25),
+        max_chars=rerank_config.get('max_chars', 2000)
+    )
@@ -1,171 +1,457 @@
 #!/usr/bin/env python3
 """
 Script for processing and embedding documents into the vector database.
+
+sentence-transformers, qdrant-client and tqdm are imported where they are
+first needed, so --help and runs with nothing to ingest start quickly.
+With ingestion.embedding_daemon enabled, embeddings come from a daemon
+that keeps the model loaded between runs (see common/embedding_daemon.py).
 """
 
-import json
+import argparse
 import os
+import queue
 import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterable, Iterator, Optional, Set
 
 import numpy as np
-from tqdm import tqdm
-from sentence_transformers import SentenceTransformer
-from qdrant_client import QdrantClient
-from qdrant_client.http import models
 
-def load_config():
-    """Load configuration from config.json"""
-    try:
-        with open('/app/config.json', 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        sys.exit(1)
+from chunker import CharacterChunker, chunker_from_config
+from common import create_collection, load_config, load_embedder
+from loaders import iter_sections, supported_extensions
+from ingest_manifest import DeltaTracker, IngestManifest, chunk_hash, chunk_point_id
+from vector_search import SnapshotWriter, iter_snapshot
 
 def get_document_files(documents_path: str) -> List[Path]:
-    """Get all document files from the specified directory"""
+    """Get all document files with a registered loader from the specified directory"""
     documents_dir = Path(documents_path)
     if not documents_dir.exists():
         print(f"Documents directory {documents_path} does not exist.")
         return []
     
-    # Get all text files
-    return list(documents_dir.glob("**/*.txt"))
+    extensions = set(supported_extensions())
+    return sorted(path for path in documents_dir.glob("**/*")
+                  if path.is_file() and path.suffix.lower() in extensions)
+
+# Chunker and loader options used by chunk_document; set per process by init_chunker
+_chunker = CharacterChunker()
+_loaders_config: Dict[str, Any] = {}
+
+def init_chunker(ingestion_config: Dict[str, Any], model_name: str, tokenizer=None):
+    """Select the chunker for this process (also the process pool initializer)"""
+    global _chunker, _loaders_config
+    _chunker = chunker_from_config(ingestion_config, model_name, tokenizer)
+    _loaders_config = ingestion_config.get('loaders', {})
 
-def chunk_document(file_path: Path, chunk_size: int = 1000, overlap: int = 200) -> List[Dict[str, Any]]:
-    """Split document into chunks with metadata"""
+def iter_document_chunks(file_path: Path) -> Iterator[Dict[str, Any]]:
+    """
+    Split a document into chunks with metadata, one loader section at a
+    time, so only a section of the file is held in memory
+    """
+    chunk_index = 0
+    for section in iter_sections(file_path, _loaders_config):
+        for chunk_text in _chunker.split(section["text"]):
+            content_hash = chunk_hash(chunk_text)
+            yield {
+                "id": chunk_point_id(str(file_path), content_hash),
+                "text": chunk_text,
+                "metadata": {
+                    **section["metadata"],
+                    "source": str(file_path),
+                    "filename": file_path.name,
+                    "chunk_index": chunk_index,
+                    "chunk_hash": content_hash
+                }
+            }
+            chunk_index += 1
+
+def chunk_document(file_path: Path) -> Optional[List[Dict[str, Any]]]:
+    """Split document into chunks with metadata; None if the file couldn't be read"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            text = f.read()
-        
-        # Simple chunking by character count
-        chunks = []
-        for i in range(0, len(text), chunk_size - overlap):
-            chunk_text = text[i:i + chunk_size]
-            if len(chunk_text.strip()) > 0:
-                chunks.append({
-                    "text": chunk_text,
-                    "metadata": {
-                        "source": str(file_path),
-                        "filename": file_path.name,
-                        "chunk_index": len(chunks)
-                    }
-                })
-        
-        return chunks
+        return list(iter_document_chunks(file_path))
     except Exception as e:
         print(f"Error processing file {file_path}: {e}")
-        return []
+        return None
 
-def embed_chunks(chunks: List[Dict[str, Any]], model_name: str) -> List[Dict[str, Any]]:
-    """Generate embeddings for document chunks"""
-    try:
-        model = SentenceTransformer(model_name)
-        
-        # Extract texts for embedding
-        texts = [chunk["text"] for chunk in chunks]
-        
-        # Generate embeddings
-        print(f"Generating embeddings for {len(texts)} chunks...")
-        embeddings = model.encode(texts, show_progress_bar=True)
-        
-        # Add embeddings to chunks
-        for i, embedding in enumerate(embeddings):
-            chunks[i]["embedding"] = embedding.tolist()
-        
-        return chunks
-    except Exception as e:
-        print(f"Error generating embeddings: {e}")
-        return []
+def iter_chunks(document_files: Iterable[Path], tracker: DeltaTracker) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the chunks that aren't already ingested, streaming each file so
+    only one section of one document is held in memory. A file that fails
+    midway is read again next run (see DeltaTracker.delta).
+    """
+    for file_path in document_files:
+        try:
+            yield from tracker.delta(file_path, iter_document_chunks(file_path))
+        except Exception as e:
+            print(f"Error processing file {file_path}: {e}")
+
+def batched(items: Iterable[Any], batch_size: int) -> Iterator[List[Any]]:
+    """Group an iterable into lists of at most batch_size items"""
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, batch_size))
+        if not batch:
+            return
+        yield batch
+
+def embed_chunks(chunks: List[Dict[str, Any]], model) -> np.ndarray:
+    """Generate float32 embeddings for a batch of document chunks"""
+    texts = [chunk["text"] for chunk in chunks]
+    embeddings = model.encode(texts, batch_size=len(texts), show_progress_bar=False, convert_to_numpy=True)
+    return np.asarray(embeddings, dtype=np.float32)
+
+def get_qdrant_client(vectordb_config: Dict[str, Any]):
+    """Connect to Qdrant and create the collection if it doesn't exist"""
+    from qdrant_client import QdrantClient
+    
+    client = QdrantClient(url=vectordb_config.get('url', vectordb_config.get('host')))
+    
+    # Check if collection exists
+    collections = client.get_collections().collections
+    collection_names = [collection.name for collection in collections]
+    
+    if vectordb_config['collection_name'] not in collection_names:
+        # Create collection if it doesn't exist
+        create_collection(client, vectordb_config)
+        print(f"Created collection {vectordb_config['collection_name']}.")
+    
+    return client
+
+def chunk_payload(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload stored alongside a chunk's vector"""
+    # Metadata goes first so no field of it can replace the chunk text
+    return {
+        **chunk["metadata"],
+        "text": chunk["text"]
+    }
+
+def snapshot_payload(chunk: Dict[str, Any]) -> Dict[str, Any]:
+    """Snapshot rows also carry the point ID so later runs can replace them"""
+    return {
+        **chunk_payload(chunk),
+        "id": chunk["id"]
+    }
+
+def upload_to_qdrant(client, collection_name: str, chunks: List[Dict[str, Any]],
+                     embeddings: np.ndarray, wait: bool = True):
+    """Upload one batch of embedded chunks under their stable point IDs"""
+    from qdrant_client.http import models
+    points = [
+        models.PointStruct(
+            id=chunk["id"],
+            # Vectors stay float32 arrays until they are serialized here
+            vector=embeddings[i].tolist(),
+            payload=chunk_payload(chunk)
+        )
+        for i, chunk in enumerate(chunks)
+    ]
+    client.upsert(collection_name=collection_name, points=points, wait=wait)
+
+def ingest_sequential(document_files: List[Path], tracker: DeltaTracker, model,
+                      client, collection_name: str, snapshot: Optional[SnapshotWriter],
+                      batch_size: int, progress) -> int:
+    """Chunk, embed and upload one batch at a time; returns the number of chunks"""
+    total_chunks = 0
+    for batch in batched(iter_chunks(document_files, tracker), batch_size):
+        embeddings = embed_chunks(batch, model)
+        upload_to_qdrant(client, collection_name, batch, embeddings)
+        if snapshot is not None:
+            snapshot.append(embeddings, [snapshot_payload(chunk) for chunk in batch])
+        total_chunks += len(batch)
+        progress.update(len(batch))
+    return total_chunks
+
+class StageStats:
+    """Chunks processed and busy seconds for one pipeline stage"""
+
+    def __init__(self, name: str, workers: int = 1):
+        self.name = name
+        self.workers = workers
+        self.chunks = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, chunks: int, seconds: float):
+        with self._lock:
+            self.chunks += chunks
+            self.busy_seconds += seconds
+
+    def report(self, wall_seconds: float) -> str:
+        # Throughput if every worker of the stage were busy all the time;
+        # the stage with the highest utilization is the bottleneck
+        rate = self.chunks * self.workers / self.busy_seconds if self.busy_seconds else 0.0
+        utilization = self.busy_seconds / (self.workers * wall_seconds) if wall_seconds else 0.0
+        return (f"{self.name:<7} {self.chunks} chunks, {rate:.1f} chunks/sec capacity "
+                f"({self.workers} workers), {utilization:.0%} busy")
+
+def timed_chunk_document(file_path: Path):
+    """chunk_document plus its run time, for use in worker processes"""
+    start = time.perf_counter()
+    chunks = chunk_document(file_path)
+    return chunks, time.perf_counter() - start
+
+# Marks the end of a pipeline queue
+_STOP = object()
+
+def _put(q: queue.Queue, item: Any, failed: threading.Event):
+    """Block until item is queued, giving up if another stage failed"""
+    while not failed.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return
+        except queue.Full:
+            continue
+
+def _get(q: queue.Queue, failed: threading.Event) -> Any:
+    """Block until an item is available, returning _STOP if another stage failed"""
+    while not failed.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            continue
+    return _STOP
+
+def ingest_pipelined(document_files: List[Path], tracker: DeltaTracker, pool: ProcessPoolExecutor,
+                     model, client, collection_name: str, snapshot: Optional[SnapshotWriter],
+                     batch_size: int, chunk_workers: int, upload_workers: int, queue_size: int,
+                     progress) -> int:
+    """
+    Overlap the stages: files are chunked in the process pool, batches are
+    embedded on a dedicated thread and upserted by several upload threads
+    without waiting for Qdrant to apply them. Bounded queues between stages
+    keep memory flat. Returns the number of chunks and prints per-stage
+    throughput.
+    """
+    embed_queue = queue.Queue(maxsize=queue_size)
+    upload_queue = queue.Queue(maxsize=queue_size)
+    failed = threading.Event()
+    errors = []
+    chunk_stats = StageStats("chunk", chunk_workers)
+    embed_stats = StageStats("embed")
+    upload_stats = StageStats("upload", upload_workers)
+
+    def embed_worker():
+        try:
+            while True:
+                batch = _get(embed_queue, failed)
+                if batch is _STOP:
+                    break
+                start = time.perf_counter()
+                embeddings = embed_chunks(batch, model)
+                embed_stats.record(len(batch), time.perf_counter() - start)
+                if snapshot is not None:
+                    snapshot.append(embeddings, [snapshot_payload(chunk) for chunk in batch])
+                _put(upload_queue, (batch, embeddings), failed)
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+        finally:
+            for _ in range(upload_workers):
+                _put(upload_queue, _STOP, failed)
+
+    def upload_worker():
+        try:
+            while True:
+                item = _get(upload_queue, failed)
+                if item is _STOP:
+                    break
+                batch, embeddings = item
+                start = time.perf_counter()
+                upload_to_qdrant(client, collection_name, batch, embeddings, wait=False)
+                upload_stats.record(len(batch), time.perf_counter() - start)
+                progress.update(len(batch))
+        except Exception as e:
+            errors.append(e)
+            failed.set()
+
+    threads = [threading.Thread(target=embed_worker, name="embed")]
+    threads += [threading.Thread(target=upload_worker, name=f"upload-{i}") for i in range(upload_workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
 
-def upload_to_qdrant(chunks: List[Dict[str, Any]], config: Dict[str, Any]):
-    """Upload chunks to Qdrant vector database"""
     try:
-        vectordb_config = config['vectordb']
-        client = QdrantClient(url=vectordb_config['host'])
-        
-        # Check if collection exists
-        collections = client.get_collections().collections
-        collection_names = [collection.name for collection in collections]
-        
-        if vectordb_config['collection_name'] not in collection_names:
-            # Create collection if it doesn't exist
-            client.create_collection(
-                collection_name=vectordb_config['collection_name'],
-                vectors_config=models.VectorParams(
-                    size=vectordb_config['dimension'],
-                    distance=models.Distance.COSINE
-                )
-            )
-            print(f"Created collection {vectordb_config['collection_name']}.")
-        
-        # Prepare points for upload
-        points = []
-        for i, chunk in enumerate(chunks):
-            points.append(
-                models.PointStruct(
-                    id=i + 1,  # Start IDs from 1
-                    vector=chunk["embedding"],
-                    payload={
-                        "text": chunk["text"],
-                        **chunk["metadata"]
-                    }
-                )
-            )
-        
-        # Upload points in batches
-        batch_size = 100
-        for i in range(0, len(points), batch_size):
-            batch = points[i:i + batch_size]
-            client.upsert(
-                collection_name=vectordb_config['collection_name'],
-                points=batch
-            )
-            print(f"Uploaded batch {i//batch_size + 1}/{(len(points)-1)//batch_size + 1}")
-        
-        print(f"Successfully uploaded {len(points)} document chunks to Qdrant.")
-        return True
+        # Keep a bounded window of files in the process pool; results are
+        # consumed in file order so the manifest matches a sequential run
+        files = iter(document_files)
+        pending = deque()
+        for file_path in islice(files, chunk_workers * 2):
+            pending.append((file_path, pool.submit(timed_chunk_document, file_path)))
+
+        buffer = []
+        while pending and not failed.is_set():
+            file_path, future = pending.popleft()
+            chunks, seconds = future.result()
+            next_file = next(files, None)
+            if next_file is not None:
+                pending.append((next_file, pool.submit(timed_chunk_document, next_file)))
+            if chunks is None:
+                continue
+            chunk_stats.record(len(chunks), seconds)
+            buffer.extend(tracker.delta(file_path, chunks))
+            while len(buffer) >= batch_size:
+                _put(embed_queue, buffer[:batch_size], failed)
+                buffer = buffer[batch_size:]
+        if buffer:
+            _put(embed_queue, buffer, failed)
     except Exception as e:
-        print(f"Error uploading to Qdrant: {e}")
-        return False
+        errors.append(e)
+        failed.set()
+    finally:
+        _put(embed_queue, _STOP, failed)
+        for thread in threads:
+            thread.join()
+
+    if errors:
+        raise errors[0]
+
+    wall_seconds = time.perf_counter() - started
+    print(f"Pipeline finished in {wall_seconds:.1f}s:")
+    for stats in (chunk_stats, embed_stats, upload_stats):
+        print(f"  {stats.report(wall_seconds)}")
+    return upload_stats.chunks
 
-def ingest_documents():
-    """Main function to ingest documents into the vector database"""
+def delete_points(client, collection_name: str, point_ids: Iterable[str], batch_size: int = 1000):
+    """Delete points by ID, waiting for each batch to be applied"""
+    from qdrant_client.http import models
+    for batch in batched(sorted(point_ids), batch_size):
+        client.delete(
+            collection_name=collection_name,
+            points_selector=models.PointIdsList(points=batch),
+            wait=True
+        )
+
+def carry_over_snapshot(snapshot_path: str, snapshot: SnapshotWriter, dropped_ids: Set[str]):
+    """Copy rows of the previous snapshot into the new one, except dropped_ids"""
+    for vectors, payloads in iter_snapshot(snapshot_path):
+        keep = [i for i, payload in enumerate(payloads) if payload.get("id") and payload["id"] not in dropped_ids]
+        if keep:
+            snapshot.append(vectors[keep], [payloads[i] for i in keep])
+
+def ingest_documents(full: bool = False):
+    """
+    Main function to ingest documents into the vector database.
+    Documents flow through read -> chunk -> embed -> upsert in fixed-size
+    batches, so peak memory doesn't grow with the corpus. With
+    ingestion.pipelined set the stages run concurrently.
+    
+    Ingestion is incremental: files whose mtime and size match the manifest
+    are not read, only chunks whose content changed are embedded, and points
+    of removed files or chunks are deleted. full=True re-embeds everything.
+    """
     config = load_config()
     documents_path = config['data']['documents_path']
+    vectordb_config = config['vectordb']
+    collection_name = vectordb_config['collection_name']
+    ingestion_config = config.get('ingestion', {})
+    batch_size = ingestion_config.get('batch_size', 128)
+    pipelined = ingestion_config.get('pipelined', False)
+    chunk_workers = ingestion_config.get('chunk_workers', os.cpu_count() or 1)
+    manifest_path = ingestion_config.get('manifest_path', os.path.join(documents_path, '.ingest_manifest.json'))
+    
+    manifest = IngestManifest.load(manifest_path)
+    tracker = DeltaTracker(manifest, force=full)
     
     # Get document files
     document_files = get_document_files(documents_path)
-    if not document_files:
+    if not document_files and not manifest.files:
         print("No documents found to ingest.")
         return False
     
-    print(f"Found {len(document_files)} documents to process.")
+    changed_files = [f for f in document_files if full or not manifest.is_unchanged(f)]
+    removed_sources = tracker.remove_missing({str(f) for f in document_files})
+    print(f"Found {len(document_files)} documents: {len(changed_files)} new or changed, "
+          f"{len(removed_sources)} removed since the last ingest.")
     
-    # Process each document
-    all_chunks = []
-    for file_path in tqdm(document_files, desc="Processing documents"):
-        chunks = chunk_document(file_path)
-        all_chunks.extend(chunks)
+    if not changed_files and not removed_sources:
+        print("Nothing changed since the last ingest.")
+        return True
+    
+    pool = None
+    if pipelined and changed_files:
+        # Start the chunking processes before the model and worker threads
+        # exist, so forked children don't inherit either
+        pool = ProcessPoolExecutor(
+            max_workers=chunk_workers,
+            initializer=init_chunker,
+            initargs=(ingestion_config, vectordb_config['embedding_model'])
+        )
+        pool.submit(os.getpid).result()
     
-    if not all_chunks:
-        print("No document chunks were generated.")
+    try:
+        model = load_embedder(vectordb_config['embedding_model'],
+                              ingestion_config.get('embedding_daemon')) if changed_files else None
+        if model is not None and not pipelined:
+            init_chunker(ingestion_config, vectordb_config['embedding_model'], tokenizer=model.tokenizer)
+        client = get_qdrant_client(vectordb_config)
+    except Exception as e:
+        print(f"Error initializing ingestion: {e}")
+        if pool is not None:
+            pool.shutdown()
         return False
     
-    print(f"Generated {len(all_chunks)} chunks from {len(document_files)} documents.")
+    # Write a local snapshot for NumPy search when Qdrant is unavailable
+    snapshot_path = vectordb_config.get('snapshot_path')
+    snapshot = SnapshotWriter(
+        snapshot_path,
+        dtype=vectordb_config.get('snapshot_dtype', 'float32'),
+        pq_subspaces=vectordb_config.get('snapshot_pq_subspaces', 0)
+    ) if snapshot_path else None
     
-    # Generate embeddings
-    embedded_chunks = embed_chunks(all_chunks, config['vectordb']['embedding_model'])
-    if not embedded_chunks:
-        print("Failed to generate embeddings.")
+    from tqdm import tqdm
+    
+    total_chunks = 0
+    completed = False
+    try:
+        with tqdm(desc="Ingesting chunks", unit="chunk") as progress:
+            if pipelined and changed_files:
+                total_chunks = ingest_pipelined(
+                    changed_files, tracker, pool, model, client, collection_name, snapshot,
+                    batch_size, chunk_workers,
+                    upload_workers=ingestion_config.get('upload_workers', 4),
+                    queue_size=ingestion_config.get('queue_size', 4),
+                    progress=progress
+                )
+            elif changed_files:
+                total_chunks = ingest_sequential(
+                    changed_files, tracker, model, client, collection_name, snapshot,
+                    batch_size, progress
+                )
+        
+        # Deleting with wait=True also ensures earlier wait=False upserts are applied
+        if tracker.stale_ids:
+            delete_points(client, collection_name, tracker.stale_ids)
+        
+        if snapshot is not None and not full:
+            carry_over_snapshot(snapshot_path, snapshot, tracker.stale_ids | tracker.new_ids)
+        completed = True
+    except Exception as e:
+        print(f"Error ingesting documents: {e}")
         return False
+    finally:
+        if snapshot is not None:
+            snapshot.close(commit=completed)
+        if pool is not None:
+            pool.shutdown()
+    
+    tracker.current.save()
     
-    # Upload to Qdrant
-    success = upload_to_qdrant(embedded_chunks, config)
-    return success
+    if snapshot is not None:
+        print(f"Wrote vector snapshot to {snapshot_path}.")
+    print(f"Uploaded {total_chunks} new document chunks, skipped {tracker.unchanged_chunks} unchanged "
+          f"and deleted {len(tracker.stale_ids)} stale chunks in Qdrant.")
+    return True
 
 if __name__ == "__main__":
-    success = ingest_documents()
+    parser = argparse.ArgumentParser(description="Ingest documents into the vector database.")
+    parser.add_argument('--full', action='store_true',
+                        help="re-embed every document instead of only new or changed chunks")
+    args = parser.parse_args()
+    success = ingest_documents(full=args.full)
     sys.exit(0 if success else 1)
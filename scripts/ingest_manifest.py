@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Manifest of what has already been ingested, for incremental re-ingestion.
+
+For every source file the manifest records its mtime, size and the hash
+and point ID of each chunk. Point IDs are derived from the source path and
+chunk hash, so the same chunk always maps to the same Qdrant point no
+matter which files are added or removed around it.
+"""
+
+import hashlib
+import json
+import os
+import uuid
+from pathlib import Path
+from typing import Dict, List, Any, Iterable, Iterator, Set
+
+# Namespace for deterministic chunk point IDs
+POINT_ID_NAMESPACE = uuid.UUID('6f1c1d2e-8a4b-5c3d-9e7f-0a1b2c3d4e5f')
+
+def chunk_hash(text: str) -> str:
+    """Content hash of a chunk's text"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+def chunk_point_id(source: str, content_hash: str) -> str:
+    """Stable Qdrant point ID for a chunk of a source file"""
+    return str(uuid.uuid5(POINT_ID_NAMESPACE, f"{source}#{content_hash}"))
+
+class IngestManifest:
+    """Per-file ingestion state, persisted as JSON"""
+
+    def __init__(self, path: str, files: Dict[str, Dict[str, Any]] = None):
+        self.path = path
+        self.files = files or {}
+
+    @classmethod
+    def load(cls, path: str) -> 'IngestManifest':
+        """Load the manifest at path, or start an empty one if it doesn't exist"""
+        if not os.path.exists(path):
+            return cls(path)
+        with open(path, 'r') as f:
+            return cls(path, json.load(f).get('files', {}))
+
+    def save(self):
+        """Write the manifest atomically so an interrupted run can't corrupt it"""
+        Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({"version": 1, "files": self.files}, f)
+        os.replace(temp_path, self.path)
+
+    def is_unchanged(self, file_path: Path) -> bool:
+        """True if the file's mtime and size match the last ingest"""
+        entry = self.files.get(str(file_path))
+        if entry is None:
+            return False
+        stat = file_path.stat()
+        return entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size
+
+    def chunk_ids(self, source: str) -> Set[str]:
+        entry = self.files.get(source)
+        return {chunk['id'] for chunk in entry['chunks']} if entry else set()
+
+    def sources(self) -> Set[str]:
+        return set(self.files)
+
+    def set_file(self, file_path: Path, chunk_entries: List[Dict[str, str]]):
+        """Record the current state of a file and its chunks' {"id", "hash"} entries"""
+        stat = file_path.stat()
+        self.files[str(file_path)] = {
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "chunks": chunk_entries
+        }
+
+    def set_failed_file(self, source: str, chunk_entries: List[Dict[str, str]]):
+        """Record the chunks of a file that failed midway; it is read again next run"""
+        self.files[source] = {"mtime": None, "size": None, "chunks": chunk_entries}
+
+    def remove_file(self, source: str):
+        self.files.pop(source, None)
+
+class DeltaTracker:
+    """
+    Compares freshly chunked files against the previous manifest.
+    delta() yields only the chunks that need embedding and collects the
+    point IDs that no longer exist; the updated manifest is built as files
+    are processed and only saved once the run has succeeded.
+    """
+
+    def __init__(self, previous: IngestManifest, force: bool = False):
+        self.previous = previous
+        self.current = IngestManifest(previous.path, dict(previous.files))
+        self.force = force
+        self.stale_ids: Set[str] = set()
+        self.new_ids: Set[str] = set()
+        self.unchanged_chunks = 0
+
+    def delta(self, file_path: Path, chunks: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield the chunks of a file that need embedding. The file's manifest
+        entry and stale points are only recorded once all of its chunks have
+        been consumed. A file that fails midway keeps its old chunks in its
+        entry, plus the ones already yielded for upload, and is read again
+        next run, which then deletes those it no longer has.
+        """
+        source = str(file_path)
+        known_ids = self.previous.chunk_ids(source)
+        entries = []
+        current_ids = set()
+        yielded = []
+        try:
+            for chunk in chunks:
+                entry = {"id": chunk["id"], "hash": chunk["metadata"]["chunk_hash"]}
+                entries.append(entry)
+                current_ids.add(chunk["id"])
+                # Identical chunks within a file share a point ID; embed them once
+                if chunk["id"] in self.new_ids or (chunk["id"] in known_ids and not self.force):
+                    self.unchanged_chunks += 1
+                    continue
+                self.new_ids.add(chunk["id"])
+                if chunk["id"] not in known_ids:
+                    yielded.append(entry)
+                yield chunk
+        except Exception:
+            previous_entries = self.previous.files.get(source, {}).get('chunks', [])
+            self.current.set_failed_file(source, previous_entries + yielded)
+            raise
+        self.stale_ids |= known_ids - current_ids
+        self.current.set_file(file_path, entries)
+
+    def remove_missing(self, present_sources: Set[str]) -> List[str]:
+        """Forget files that no longer exist and mark their points stale"""
+        removed = sorted(self.previous.sources() - present_sources)
+        for source in removed:
+            self.stale_ids |= self.previous.chunk_ids(source)
+            self.current.remove_file(source)
+        return removed
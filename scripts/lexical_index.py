@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+In-process lexical search index.
+
+Documents are tokenized once when added and stored as postings lists
+(term -> [(document number, term frequency)]). Queries only touch the
+postings of their own terms, are scored with BM25 and the top results are
+selected with a heap, so query cost depends on the matching postings
+rather than on corpus size times document length.
+"""
+
+import heapq
+import math
+import re
+import threading
+from collections import Counter
+from typing import Dict, List, Any, Iterable, Optional, Tuple
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+# Query terms too common to say anything about relevance; a document
+# matching only these is not a hit
+STOPWORDS = frozenset("""
+a about above after again all am an and any are as at be because been before being between both
+but by can could did do does doing down during each few for from further had has have having he
+her here hers him his how i if in into is it its itself just me more most my no nor not of off on
+once only or other our ours out over own same she should so some such than that the their theirs
+them then there these they this those through to too under until up very was we were what when
+where which while who whom why will with would you your yours
+""".split())
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase word tokens, matching the tokenization used for queries."""
+    return TOKEN_PATTERN.findall(text.lower())
+
+class LexicalIndex:
+    """BM25 inverted index over documents with "id", "title" and "content"."""
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, stopwords: Iterable[str] = STOPWORDS):
+        self.k1 = k1
+        self.b = b
+        self.stopwords = frozenset(stopwords)
+        self.documents: List[Dict[str, Any]] = []
+        self.doc_lengths: List[int] = []
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def add_documents(self, documents: Iterable[Dict[str, Any]]):
+        """Tokenize and index documents; each document is scanned exactly once."""
+        with self._lock:
+            for doc in documents:
+                doc_number = len(self.documents)
+                terms = tokenize(doc['content'])
+                self.documents.append(doc)
+                self.doc_lengths.append(len(terms))
+                self.total_length += len(terms)
+                for term, frequency in Counter(terms).items():
+                    self.postings.setdefault(term, []).append((doc_number, frequency))
+
+    def _idf(self, term: str) -> float:
+        document_frequency = len(self.postings.get(term, ()))
+        n = len(self.documents)
+        return math.log(1 + (n - document_frequency + 0.5) / (document_frequency + 0.5))
+
+    def search(self, query: str, top_k: Optional[int] = 10) -> List[Dict[str, Any]]:
+        """
+        Return up to top_k documents matching any query term other than a
+        stopword, best first. "score" is the raw BM25 score and "relevance"
+        is that score divided by the best score the query terms could
+        reach, so it lies in [0, 1].
+        """
+        query_terms = set(tokenize(query)) - self.stopwords
+        if not query_terms or not self.documents:
+            return []
+
+        average_length = self.total_length / len(self.documents)
+        scores: Dict[int, float] = {}
+        max_score = 0.0
+        for term in query_terms:
+            idf = self._idf(term)
+            max_score += idf * (self.k1 + 1)
+            for doc_number, frequency in self.postings.get(term, ()):
+                length_norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_number] / average_length)
+                scores[doc_number] = scores.get(doc_number, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + length_norm)
+
+        if top_k is None:
+            top_k = len(scores)
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+
+        results = []
+        for doc_number, score in best:
+            doc = self.documents[doc_number]
+            results.append({
+                "id": doc["id"],
+                "title": doc["title"],
+                "content": doc["content"],
+                "source": doc.get("source"),
+                "score": score,
+                "relevance": score / max_score if max_score else 0.0
+            })
+        return results
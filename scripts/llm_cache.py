@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Response cache for LLM generations.
+
+Completions are keyed on everything that determines the output: model,
+options, system prompt and prompt. Two backends are provided: an in-memory
+LRU with TTL and size limits, and a SQLite store that survives restarts.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+def make_cache_key(model: str, prompt: str, system: Optional[str] = None,
+                   options: Optional[Dict[str, Any]] = None) -> str:
+    """Build a stable cache key for a generation request."""
+    material = json.dumps(
+        {"model": model, "options": options or {}, "system": system or "", "prompt": prompt},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """Base class tracking hit/miss counters; backends implement _get/_set."""
+
+    def __init__(self, ttl: float = 3600):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            value = self._get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+
+    def set(self, key: str, value: str):
+        with self._lock:
+            self._set(key, value)
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: str):
+        raise NotImplementedError
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": self.backend,
+                "entries": len(self),
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+class MemoryCache(ResponseCache):
+    """In-memory LRU bounded by entry count and total response size."""
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 64 * 1024 * 1024, ttl: float = 3600):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        # key -> (value, created, size)
+        self._entries = OrderedDict()
+
+    def _get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        value, created, _ = entry
+        if self._expired(created):
+            self._remove(key)
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def _set(self, key: str, value: str):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = (value, time.time(), size)
+        self.size_bytes += size
+        while len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    def _remove(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self.size_bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["size_bytes"] = self.size_bytes
+        return stats
+
+class SQLiteCache(ResponseCache):
+    """On-disk cache evicting the least recently used rows past max_entries."""
+    backend = "sqlite"
+
+    def __init__(self, path: str, max_entries: int = 100000, ttl: float = 7 * 24 * 3600):
+        super().__init__(ttl)
+        self.max_entries = max_entries
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache (accessed)")
+
+    def _get(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if self._expired(created):
+            self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+            return None
+        self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, value, now, now)
+        )
+        excess = len(self) - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+def cache_from_config(cache_config: Dict[str, Any]) -> Optional[ResponseCache]:
+    """Build the cache described by the "cache" config section, or None if disabled."""
+    if not cache_config.get('enabled', True):
+        return None
+    backend = cache_config.get('backend', 'memory')
+    if backend == 'memory':
+        return MemoryCache(
+            max_entries=cache_config.get('max_entries', 1024),
+            max_bytes=cache_config.get('max_bytes', 64 * 1024 * 1024),
+            ttl=cache_config.get('ttl', 3600)
+        )
+    if backend == 'sqlite':
+        return SQLiteCache(
+            cache_config.get('sqlite_path', 'llm_cache.sqlite3'),
+            max_entries=cache_config.get('max_entries', 100000),
+            ttl=cache_config.get('ttl', 7 * 24 * 3600)
+        )
+    raise ValueError(f"Unknown cache backend: {backend}")
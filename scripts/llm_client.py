@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Shared HTTP client for talking to Ollama.
+
+Every caller that hits the LLM API should go through get_client() so that
+connections are pooled and kept alive, timeouts are always set, transient
+failures are retried with jittered backoff, and no single backend receives
+more than max_concurrency requests at a time.
+
+LLMPool spreads generations over several Ollama backends: each goes to the
+healthy backend with the fewest outstanding requests for its weight, and
+backends that keep failing are ejected until a health check passes.
+"""
+
+import json
+import random
+import threading
+import time
+from typing import Callable, Dict, List, Any, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Status codes worth retrying: the backend is overloaded or restarting
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+DEFAULT_SETTINGS = {
+    "connect_timeout": 3.05,
+    "read_timeout": 120,
+    "max_retries": 2,
+    "backoff_base": 0.5,
+    "backoff_max": 8.0,
+    "max_concurrency": 4
+}
+
+class LLMClient:
+    """Pooled, keep-alive client for a single Ollama backend."""
+
+    def __init__(self, base_url: str, connect_timeout: float = 3.05, read_timeout: float = 120,
+                 max_retries: int = 2, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 max_concurrency: int = 4):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        # One connection per concurrent request is all the pool ever needs
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff delay for the given retry attempt."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _send(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Send a request to the backend, retrying connection errors and
+        overload responses. Read timeouts are not retried since the backend
+        may still be generating. The caller must hold a concurrency slot.
+        """
+        url = f"{self.base_url}{path}"
+        kwargs.setdefault('timeout', self.timeout)
+
+        attempt = 0
+        while True:
+            try:
+                response = self.session.request(method, url, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                    response.raise_for_status()
+                    return response
+                response.close()
+            except (requests.ConnectionError, requests.ConnectTimeout):
+                if attempt >= self.max_retries:
+                    raise
+            time.sleep(self._backoff(attempt))
+            attempt += 1
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send a request to the backend within its concurrency cap."""
+        with self._slots:
+            return self._send(method, path, **kwargs)
+
+    @staticmethod
+    def _generate_payload(model: str, prompt: str, system: Optional[str],
+                          options: Optional[Dict[str, Any]], stream: bool,
+                          context: Optional[List[int]] = None) -> Dict[str, Any]:
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "stream": stream
+        }
+        if system:
+            payload["system"] = system
+        if options:
+            payload["options"] = options
+        if context:
+            payload["context"] = context
+        return payload
+
+    def generate(self, model: str, prompt: str, system: Optional[str] = None,
+                 options: Optional[Dict[str, Any]] = None, context: Optional[List[int]] = None) -> Dict[str, Any]:
+        """
+        Run a non-streaming /api/generate call and return the decoded result.
+        context continues from the "context" tokens a previous result returned.
+        """
+        payload = self._generate_payload(model, prompt, system, options, stream=False, context=context)
+        response = self.request('POST', '/api/generate', json=payload)
+        return response.json()
+
+    def generate_stream(self, model: str, prompt: str, system: Optional[str] = None,
+                        options: Optional[Dict[str, Any]] = None,
+                        context: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Run a streaming /api/generate call, yielding each decoded NDJSON
+        message as Ollama sends it. The final message has "done" set and
+        carries the generation stats and context tokens. The concurrency
+        slot is held until the generator is exhausted or closed.
+        """
+        payload = self._generate_payload(model, prompt, system, options, stream=True, context=context)
+        with self._slots:
+            response = self._send('POST', '/api/generate', json=payload, stream=True)
+            try:
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if 'error' in message:
+                        raise RuntimeError(message['error'])
+                    yield message
+                    if message.get('done'):
+                        break
+            finally:
+                response.close()
+
+    def close(self):
+        self.session.close()
+
+def is_backend_failure(error: Exception) -> bool:
+    """True for errors that count against a backend's health: it is down, overloaded or broken."""
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+def can_fail_over(error: Exception) -> bool:
+    """True if a request that failed with error never started generating and may go elsewhere."""
+    # A read timeout may mean the backend is still generating
+    return is_backend_failure(error) and not isinstance(error, requests.ReadTimeout)
+
+class Backend:
+    """One Ollama instance of a pool with its load, health and stats."""
+
+    def __init__(self, client: LLMClient, weight: float = 1.0, models: Optional[List[str]] = None):
+        self.client = client
+        self.weight = weight
+        # Models the backend serves; None means all of them
+        self.models = set(models) if models else None
+        self.outstanding = 0
+        self.healthy = True
+        self.ejected_at = None
+        self.consecutive_failures = 0
+        self.requests = 0
+        self.errors = 0
+        # Moving average of successful request durations, in seconds
+        self.latency = None
+
+    @property
+    def url(self) -> str:
+        return self.client.base_url
+
+    def serves(self, model: str) -> bool:
+        return self.models is None or model in self.models
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "url": self.url,
+            "weight": self.weight,
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "mean_latency_ms": round(self.latency * 1000, 2) if self.latency is not None else None
+        }
+
+class LLMPool:
+    """
+    Balances generations over backends by least outstanding requests,
+    relative to each backend's weight, among the healthy backends serving
+    the model. A backend is ejected after eject_after_failures failed
+    requests in a row or a failed health check, and re-admitted by the
+    first health check that passes eject_seconds or more later. A request
+    that fails before generating anything is retried on another backend.
+    listener(backend_url, outcome, seconds) is called after every request.
+    Has the generate and generate_stream methods of LLMClient.
+    """
+
+    # Weight of the newest sample in the latency moving average
+    LATENCY_SMOOTHING = 0.2
+
+    def __init__(self, backends: List[Backend], health_check_interval: float = 10.0,
+                 eject_after_failures: int = 3, eject_seconds: float = 30.0,
+                 listener: Optional[Callable[[str, str, float], None]] = None):
+        if not backends:
+            raise ValueError("An LLM pool needs at least one backend")
+        self.backends = backends
+        self.health_check_interval = health_check_interval
+        self.eject_after_failures = eject_after_failures
+        self.eject_seconds = eject_seconds
+        self.listener = listener
+        self._lock = threading.Lock()
+        self._health_thread = None
+
+    def _eject(self, backend: Backend, reason: str):
+        backend.healthy = False
+        backend.ejected_at = time.monotonic()
+        print(f"Ejecting LLM backend {backend.url}: {reason}")
+
+    def _readmit(self, backend: Backend):
+        backend.healthy = True
+        backend.consecutive_failures = 0
+        print(f"Re-admitting LLM backend {backend.url}")
+
+    def _eject_expired(self, backend: Backend) -> bool:
+        return time.monotonic() - backend.ejected_at >= self.eject_seconds
+
+    def _choose(self, model: str, exclude: List[Backend]) -> Optional[Backend]:
+        """Reserve the backend for the next request, or None if every candidate was tried."""
+        self._start_health_checks()
+        with self._lock:
+            candidates = [backend for backend in self.backends if backend.serves(model) and backend not in exclude]
+            if not candidates:
+                return None
+            if not self.health_check_interval:
+                # Without health checks, ejections simply expire
+                for backend in candidates:
+                    if not backend.healthy and self._eject_expired(backend):
+                        self._readmit(backend)
+            # With every backend ejected, keep trying them rather than failing outright
+            healthy = [backend for backend in candidates if backend.healthy] or candidates
+            backend = min(healthy, key=lambda backend: ((backend.outstanding + 1) / backend.weight, random.random()))
+            backend.outstanding += 1
+            return backend
+
+    def _has_candidate(self, model: str, exclude: List[Backend]) -> bool:
+        return any(backend.serves(model) and backend not in exclude for backend in self.backends)
+
+    def _finish(self, backend: Backend, outcome: str, seconds: float, error: Optional[Exception] = None):
+        with self._lock:
+            backend.outstanding -= 1
+            backend.requests += 1
+            if outcome == 'success':
+                backend.consecutive_failures = 0
+                backend.latency = seconds if backend.latency is None else \
+                    backend.latency + self.LATENCY_SMOOTHING * (seconds - backend.latency)
+            elif outcome == 'error':
+                backend.errors += 1
+                if is_backend_failure(error):
+                    backend.consecutive_failures += 1
+                    if backend.healthy and backend.consecutive_failures >= self.eject_after_failures:
+                        self._eject(backend, f"{backend.consecutive_failures} failures in a row, last: {error}")
+        if self.listener is not None:
+            self.listener(backend.url, outcome, seconds)
+
+    def _no_backend(self, model: str) -> RuntimeError:
+        return RuntimeError(f"No LLM backend serves model {model}")
+
+    def generate(self, model: str, prompt: str, system: Optional[str] = None,
+                 options: Optional[Dict[str, Any]] = None, context: Optional[List[int]] = None) -> Dict[str, Any]:
+        """Run a non-streaming generation on the least loaded backend."""
+        tried = []
+        while True:
+            backend = self._choose(model, tried)
+            if backend is None:
+                raise self._no_backend(model)
+            start = time.perf_counter()
+            try:
+                result = backend.client.generate(model, prompt, system, options, context)
+            except Exception as e:
+                self._finish(backend, 'error', time.perf_counter() - start, e)
+                tried.append(backend)
+                if can_fail_over(e) and self._has_candidate(model, tried):
+                    continue
+                raise
+            self._finish(backend, 'success', time.perf_counter() - start)
+            return result
+
+    def generate_stream(self, model: str, prompt: str, system: Optional[str] = None,
+                        options: Optional[Dict[str, Any]] = None,
+                        context: Optional[List[int]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Run a streaming generation on the least loaded backend. The backend
+        counts the request as outstanding until the stream ends or is closed.
+        """
+        tried = []
+        while True:
+            backend = self._choose(model, tried)
+            if backend is None:
+                raise self._no_backend(model)
+            start = time.perf_counter()
+            outcome, error = 'cancelled', None
+            started = False
+            try:
+                for message in backend.client.generate_stream(model, prompt, system, options, context):
+                    started = True
+                    yield message
+                outcome = 'success'
+                return
+            except Exception as e:
+                outcome, error = 'error', e
+                tried.append(backend)
+                if started or not can_fail_over(e) or not self._has_candidate(model, tried):
+                    raise
+            finally:
+                self._finish(backend, outcome, time.perf_counter() - start, error)
+
+    def check(self, backend: Backend, timeout: float = 5.0) -> bool:
+        """Health check: the backend answers its model list."""
+        try:
+            response = backend.client.session.get(f"{backend.url}/api/tags", timeout=timeout)
+            return response.status_code == 200
+        except requests.RequestException:
+            return False
+
+    def check_all(self):
+        """Check every backend once, ejecting failing ones and re-admitting recovered ones."""
+        for backend in self.backends:
+            healthy = self.check(backend)
+            with self._lock:
+                if healthy and not backend.healthy and self._eject_expired(backend):
+                    self._readmit(backend)
+                elif not healthy and backend.healthy:
+                    self._eject(backend, "health check failed")
+
+    def _start_health_checks(self):
+        if self._health_thread is not None or not self.health_check_interval:
+            return
+        with self._lock:
+            if self._health_thread is None:
+                def run():
+                    while True:
+                        time.sleep(self.health_check_interval)
+                        self.check_all()
+                self._health_thread = threading.Thread(target=run, name='llm-health-check', daemon=True)
+                self._health_thread.start()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [backend.stats() for backend in self.backends]
+
+_clients: Dict[str, LLMClient] = {}
+_clients_lock = threading.Lock()
+
+def get_client(base_url: str, **settings) -> LLMClient:
+    """
+    Return the shared client for base_url, creating it on first use.
+    Settings only apply when the client is created.
+    """
+    key = base_url.rstrip('/')
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            merged = {**DEFAULT_SETTINGS, **{k: v for k, v in settings.items() if v is not None}}
+            client = LLMClient(key, **merged)
+            _clients[key] = client
+        return client
+
+def client_from_config(llm_config: Dict[str, Any]) -> LLMClient:
+    """Return the shared client described by the "llm" section of the config."""
+    base_url = llm_config.get('base_url', llm_config.get('host', 'http://localhost:11434'))
+    return get_client(base_url, **{key: llm_config.get(key) for key in DEFAULT_SETTINGS})
+
+_pools: Dict[str, LLMPool] = {}
+_pools_lock = threading.Lock()
+
+def pool_from_config(llm_config: Dict[str, Any],
+                     listener: Optional[Callable[[str, str, float], None]] = None) -> LLMPool:
+    """
+    Return the shared pool over the backends of the "llm" config section:
+    llm.backends, a list of {"url", "weight", "models"} entries that may
+    also override client settings, or else llm.base_url alone. Settings
+    only apply when the pool is created.
+    """
+    endpoints = llm_config.get('backends') or \
+        [{"url": llm_config.get('base_url', llm_config.get('host', 'http://localhost:11434'))}]
+    key = json.dumps(endpoints, sort_keys=True)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            backends = []
+            for endpoint in endpoints:
+                settings = {name: endpoint.get(name, llm_config.get(name)) for name in DEFAULT_SETTINGS}
+                backends.append(Backend(
+                    get_client(endpoint['url'], **settings),
+                    weight=endpoint.get('weight', 1.0),
+                    models=endpoint.get('models')
+                ))
+            pool = LLMPool(
+                backends,
+                health_check_interval=llm_config.get('health_check_interval', 10.0),
+                eject_after_failures=llm_config.get('eject_after_failures', 3),
+                eject_seconds=llm_config.get('eject_seconds', 30.0),
+                listener=listener
+            )
+            _pools[key] = pool
+        return pool
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+"""
+Document loaders keyed by file extension.
+
+Each loader yields the text of a file as a sequence of sections, each a
+dict with "text" and "metadata", so a large file is never held in memory
+at once. Plain text and Markdown are read through a memory map in blocks
+cut at paragraph boundaries, JSONL is read line by line with selected
+fields mapped to chunk metadata, HTML is fed to the parser incrementally
+and PDFs are read page by page.
+"""
+
+import json
+import mmap
+import os
+import re
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Callable, Dict, List, Any, Iterator
+
+Section = Dict[str, Any]
+
+# Extension -> loader(file_path, options) yielding sections
+LOADERS: Dict[str, Callable[[Path, Dict[str, Any]], Iterator[Section]]] = {}
+
+# Bytes (characters for HTML) read per block from large files
+DEFAULT_BLOCK_SIZE = 1 << 20
+
+# Payload keys ingestion sets itself; record fields with these names are
+# stored as record_<name> instead
+RESERVED_FIELDS = ('id', 'text', 'source')
+
+def register_loader(*extensions: str):
+    """Register the decorated function as the loader for the given extensions"""
+    def decorator(loader):
+        for extension in extensions:
+            LOADERS[extension.lower()] = loader
+        return loader
+    return decorator
+
+def supported_extensions() -> List[str]:
+    return sorted(LOADERS)
+
+def iter_sections(file_path: Path, loaders_config: Dict[str, Any] = None) -> Iterator[Section]:
+    """Yield the sections of a file using the loader registered for its extension"""
+    extension = file_path.suffix.lower()
+    loader = LOADERS.get(extension)
+    if loader is None:
+        raise ValueError(f"No loader registered for {extension} files")
+    options = (loaders_config or {}).get(extension.lstrip('.'), {})
+    return loader(file_path, options)
+
+@register_loader('.txt', '.md', '.markdown', '.log', '.rst')
+def load_text(file_path: Path, options: Dict[str, Any]) -> Iterator[Section]:
+    """
+    Read a text file through a memory map in blocks of about block_size
+    bytes, cutting each block after a blank line (or at least a newline)
+    so paragraphs and sentences stay whole.
+    """
+    block_size = options.get('block_size', DEFAULT_BLOCK_SIZE)
+    size = os.path.getsize(file_path)
+    if size == 0:
+        return
+    with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+        start = 0
+        while start < size:
+            end = min(start + block_size, size)
+            if end < size:
+                cut = mapped.rfind(b'\n\n', start, end)
+                if cut <= start:
+                    cut = mapped.rfind(b'\n', start, end)
+                if cut > start:
+                    end = cut + 1
+                else:
+                    # No newline at all: don't split a multi-byte character
+                    while end > start and (mapped[end] & 0xC0) == 0x80:
+                        end -= 1
+            yield {"text": mapped[start:end].decode('utf-8', errors='replace'), "metadata": {}}
+            start = end
+
+@register_loader('.jsonl', '.ndjson')
+def load_jsonl(file_path: Path, options: Dict[str, Any]) -> Iterator[Section]:
+    """
+    One section per JSON line. text_field names the text to embed;
+    metadata_fields lists fields copied into chunk metadata (default: every
+    other scalar field). Fields named like a reserved payload key, such as
+    id, are copied as record_id etc. Lines without text are skipped.
+    """
+    text_field = options.get('text_field', 'text')
+    metadata_fields = options.get('metadata_fields')
+    with open(file_path, 'r', encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            text = record.get(text_field)
+            if not isinstance(text, str) or not text.strip():
+                continue
+            fields = metadata_fields if metadata_fields is not None else [key for key in record if key != text_field]
+            metadata = {
+                f"record_{field}" if field in RESERVED_FIELDS else field: record[field] for field in fields
+                if field in record and isinstance(record[field], (str, int, float, bool))
+            }
+            metadata["line"] = line_number
+            yield {"text": text, "metadata": metadata}
+
+BLANK_LINES_PATTERN = re.compile(r'[ \t]*\n\s*\n\s*')
+
+class _TextExtractor(HTMLParser):
+    """Collects visible text, turning block-level elements into paragraph breaks"""
+    BLOCK_TAGS = {'p', 'div', 'section', 'article', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+                  'pre', 'blockquote', 'table', 'ul', 'ol', 'header', 'footer'}
+    SKIP_TAGS = {'script', 'style', 'noscript', 'template'}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n\n')
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in self.BLOCK_TAGS:
+            self.parts.append('\n\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def take(self) -> str:
+        text = BLANK_LINES_PATTERN.sub('\n\n', ''.join(self.parts))
+        self.parts = []
+        return text
+
+@register_loader('.html', '.htm')
+def load_html(file_path: Path, options: Dict[str, Any]) -> Iterator[Section]:
+    """Feed HTML to the parser in blocks and yield its text at paragraph breaks"""
+    block_size = options.get('block_size', DEFAULT_BLOCK_SIZE)
+    parser = _TextExtractor()
+    pending = ''
+    with open(file_path, 'r', encoding='utf-8', errors='replace') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            parser.feed(block)
+            pending += parser.take()
+            cut = pending.rfind('\n\n')
+            if cut > 0 and len(pending) >= block_size:
+                yield {"text": pending[:cut], "metadata": {}}
+                pending = pending[cut:]
+    parser.close()
+    pending += parser.take()
+    if pending.strip():
+        yield {"text": pending, "metadata": {}}
+
+@register_loader('.pdf')
+def load_pdf(file_path: Path, options: Dict[str, Any]) -> Iterator[Section]:
+    """One section per page; requires the optional pypdf package"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("pypdf is required to load PDF files (pip install pypdf)")
+    reader = PdfReader(str(file_path))
+    for page_number, page in enumerate(reader.pages, start=1):
+        text = page.extract_text() or ''
+        if text.strip():
+            yield {"text": text, "metadata": {"page": page_number}}
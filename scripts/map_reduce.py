@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Map-reduce summarization over more text than fits in one prompt.
+
+Texts are packed into batches that fit the model's context budget and
+each batch is summarized concurrently (map). The partial summaries are
+then packed and summarized again, level by level, until they fit in one
+final prompt (reduce). Token counts are estimated from character counts,
+since the generating model's tokenizer isn't available locally.
+number_sections and split_numbered let one map call return a summary per
+text, so callers can memoize summaries per text rather than per batch.
+"""
+
+import asyncio
+import re
+from typing import Awaitable, Callable, Dict, List, Any, Optional, Tuple
+
+# summarize(texts, level, final): level 0 summarizes source texts, higher
+# levels merge summaries; final marks the call that produces the answer
+Summarizer = Callable[[List[str], int, bool], Awaitable[str]]
+
+class SummaryError(Exception):
+    """Raised by a summarizer whose summary failed, to stop the reduction"""
+
+# "[n]" opening a line of a numbered response
+SECTION_NUMBER_PATTERN = re.compile(r'^[ \t]*\[(\d+)\][ \t]*', re.MULTILINE)
+
+def number_sections(texts: List[str]) -> str:
+    """Join texts as sections headed [1], [2], ..."""
+    return "\n\n".join(f"[{i}] {text}" for i, text in enumerate(texts, start=1))
+
+def split_numbered(response: str, count: int) -> Optional[List[str]]:
+    """
+    The parts of a response answering count numbered sections, in order,
+    or None unless it has exactly one non-empty part per section.
+    """
+    matches = list(SECTION_NUMBER_PATTERN.finditer(response))
+    if [int(match.group(1)) for match in matches] != list(range(1, count + 1)):
+        return None
+    ends = [match.start() for match in matches[1:]] + [len(response)]
+    parts = [response[match.end():end].strip() for match, end in zip(matches, ends)]
+    return parts if all(parts) else None
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    return int(len(text) / chars_per_token) + 1
+
+def split_text(text: str, max_chars: int) -> List[str]:
+    """Cut text longer than max_chars at paragraph, line or word breaks"""
+    pieces = []
+    while len(text) > max_chars:
+        cut = max(text.rfind('\n\n', 0, max_chars), text.rfind('\n', 0, max_chars), text.rfind(' ', 0, max_chars))
+        if cut <= max_chars // 2:
+            cut = max_chars
+        pieces.append(text[:cut])
+        text = text[cut:].lstrip()
+    if text.strip():
+        pieces.append(text)
+    return pieces
+
+def pack_batches(texts: List[str], budget_tokens: int, chars_per_token: float = 4.0) -> List[List[str]]:
+    """Greedily group texts, in order, into batches of at most budget_tokens"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for text in texts:
+        tokens = estimate_tokens(text, chars_per_token)
+        if current and current_tokens + tokens > budget_tokens:
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+async def map_reduce_summarize(texts: List[str], summarize: Summarizer, budget_tokens: int,
+                               chars_per_token: float = 4.0, max_levels: int = 4) -> Tuple[str, Dict[str, Any]]:
+    """
+    Summarize texts with as few levels as their size allows. Returns the
+    summary and stats: the number of map batches and reduce levels. If
+    summaries remain after max_levels levels, all of them are merged in the
+    final call, each cut to its share of the budget. A SummaryError from
+    summarize cancels the other summaries of its level and is raised.
+    """
+    max_chars = int(budget_tokens * chars_per_token)
+    pieces = [piece for text in texts for piece in split_text(text, max_chars)]
+    if not pieces:
+        raise ValueError("Nothing to summarize")
+    batches = pack_batches(pieces, budget_tokens, chars_per_token)
+    stats = {"map_batches": len(batches), "reduce_levels": 0}
+
+    level = 0
+    while len(batches) > 1 and level < max_levels:
+        tasks = [asyncio.ensure_future(summarize(batch, level, False)) for batch in batches]
+        try:
+            summaries = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        level += 1
+        batches = pack_batches(list(summaries), budget_tokens, chars_per_token)
+    if len(batches) > 1:
+        summaries = [summary for batch in batches for summary in batch]
+        share = max(1, max_chars // len(summaries))
+        batches = [[summary[:share] for summary in summaries]]
+    stats["reduce_levels"] = level
+    return await summarize(batches[0], level, True), stats
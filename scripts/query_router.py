@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Query router: maps a query to an intent and the topic it is about.
+
+All route keywords are compiled into one case-insensitive alternation
+with a named group per route, so a single scan of the query finds the
+intent and the keyword that marks it, and the topic is the rest of the
+query after that keyword. Routes are data: each names the handler that
+serves it ("general", "search" or "summarize") and optionally its own
+system prompt, so new intents can be added from config. Queries no
+keyword matches can be routed by embedding similarity to example
+queries.
+"""
+
+import json
+import re
+from typing import Dict, List, Any, Optional
+
+import numpy as np
+
+HANDLERS = ("general", "search", "summarize")
+
+# Routes used when the config doesn't define any, in priority order
+DEFAULT_ROUTES = [
+    {
+        "name": "search",
+        "handler": "search",
+        "keywords": ["find", "search", "look for", "documents about", "information on"]
+    },
+    {
+        "name": "summarize",
+        "handler": "summarize",
+        "keywords": ["summarize", "summary", "summarization", "brief overview"]
+    }
+]
+
+# Characters trimmed from either end of an extracted topic
+TOPIC_STRIP = ' \t\r\n:,-?'
+
+class Route:
+    """An intent, the keywords that select it and how it is served"""
+
+    def __init__(self, name: str, keywords: List[str], handler: str = "general",
+                 system_prompt: Optional[str] = None, examples: Optional[List[str]] = None):
+        if handler not in HANDLERS:
+            raise ValueError(f"Route {name}: unknown handler {handler}")
+        self.name = name
+        self.keywords = keywords
+        self.handler = handler
+        self.system_prompt = system_prompt
+        self.examples = examples or []
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Route':
+        return cls(
+            data["name"],
+            data.get("keywords", []),
+            handler=data.get("handler", "general"),
+            system_prompt=data.get("system_prompt"),
+            examples=data.get("examples")
+        )
+
+class RouteMatch:
+    """Result of routing a query: the route (None for general) and its topic"""
+
+    def __init__(self, route: Optional[Route], topic: str, span: Optional[tuple] = None,
+                 method: str = "default", score: Optional[float] = None):
+        self.route = route
+        self.topic = topic
+        # (start, end) of the keyword that selected the route
+        self.span = span
+        # "keyword", "embedding" or "default"
+        self.method = method
+        self.score = score
+
+    @property
+    def intent(self) -> str:
+        return self.route.name if self.route is not None else "general"
+
+    @property
+    def handler(self) -> str:
+        return self.route.handler if self.route is not None else "general"
+
+    @property
+    def system_prompt(self) -> Optional[str]:
+        return self.route.system_prompt if self.route is not None else None
+
+class EmbeddingRouter:
+    """
+    Routes by cosine similarity between the query and the centroid of each
+    route's example queries. The embedder needs embed(text) and
+    embed_batch(texts) returning unit vectors; centroids are computed on
+    first use.
+    """
+
+    def __init__(self, embedder, routes: List[Route], threshold: float = 0.5):
+        self.embedder = embedder
+        self.routes = [route for route in routes if route.examples]
+        self.threshold = threshold
+        self._centroids = None
+
+    def _load_centroids(self) -> np.ndarray:
+        if self._centroids is None:
+            centroids = []
+            for route in self.routes:
+                centroid = np.asarray(self.embedder.embed_batch(route.examples), dtype=np.float32).mean(axis=0)
+                centroids.append(centroid / max(np.linalg.norm(centroid), 1e-12))
+            self._centroids = np.stack(centroids)
+        return self._centroids
+
+    def route(self, query: str) -> Optional[RouteMatch]:
+        if not self.routes:
+            return None
+        scores = self._load_centroids() @ np.asarray(self.embedder.embed(query), dtype=np.float32)
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            return None
+        return RouteMatch(self.routes[best], query.strip(TOPIC_STRIP), method="embedding", score=float(scores[best]))
+
+class QueryRouter:
+    """
+    Keyword router over a prioritized route table. When several routes
+    match, the one listed first wins; the topic follows that route's
+    leftmost keyword. A query no keyword matches goes to the embedding
+    router, if any. If that fails, the query takes the default route; an
+    ImportError disables embedding routing for good.
+    """
+
+    def __init__(self, routes: List[Route], embedding_router: Optional[EmbeddingRouter] = None):
+        self.routes = routes
+        self.embedding_router = embedding_router
+        groups = []
+        for i, route in enumerate(routes):
+            if route.keywords:
+                # Longest first so a keyword isn't shadowed by its own prefix
+                keywords = sorted(route.keywords, key=len, reverse=True)
+                groups.append(f"(?P<r{i}>{'|'.join(re.escape(keyword) for keyword in keywords)})")
+        # Keywords match whole words; the pattern never matches if there are none
+        self.pattern = re.compile(r'\b(?:' + '|'.join(groups) + r')\b' if groups else r'(?!)', re.IGNORECASE)
+
+    def route(self, query: str) -> RouteMatch:
+        best_index = None
+        best_match = None
+        for match in self.pattern.finditer(query):
+            index = int(match.lastgroup[1:])
+            if best_index is None or index < best_index:
+                best_index, best_match = index, match
+                if index == 0:
+                    break
+        if best_match is not None:
+            topic = query[best_match.end():].strip(TOPIC_STRIP)
+            return RouteMatch(self.routes[best_index], topic or query.strip(TOPIC_STRIP),
+                              span=best_match.span(), method="keyword")
+
+        if self.embedding_router is not None:
+            try:
+                match = self.embedding_router.route(query)
+                if match is not None:
+                    return match
+            except ImportError as e:
+                # The embedding model can't be used in this process at all
+                print(f"Embedding router unavailable, disabling it: {e}")
+                self.embedding_router = None
+            except Exception as e:
+                # Failed model loads are retried by the embedder itself
+                print(f"Embedding routing failed, using the default route: {e}")
+        return RouteMatch(None, query.strip(TOPIC_STRIP))
+
+def load_routes(router_config: Dict[str, Any]) -> List[Route]:
+    """
+    Routes from router.routes_path (a JSON list) if set, else from
+    router.routes, else the defaults.
+    """
+    routes_path = router_config.get('routes_path')
+    if routes_path:
+        with open(routes_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    else:
+        data = router_config.get('routes') or DEFAULT_ROUTES
+    return [Route.from_dict(route) for route in data]
+
+def router_from_config(router_config: Dict[str, Any], embedder=None) -> QueryRouter:
+    """
+    Build the router described by the "router" config section. The
+    embedding router is used when router.embedding.enabled is set and an
+    embedder is given.
+    """
+    routes = load_routes(router_config)
+    embedding_config = router_config.get('embedding', {})
+    embedding_router = None
+    if embedding_config.get('enabled') and embedder is not None:
+        embedding_router = EmbeddingRouter(embedder, routes, threshold=embedding_config.get('threshold', 0.5))
+    return QueryRouter(routes, embedding_router)
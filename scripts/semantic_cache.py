@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+"""
+Semantic answer cache: answers a query that means the same as one already
+answered with the stored result, skipping retrieval and generation.
+
+Queries are embedded and compared by cosine similarity with the queries
+answered before. The most similar one with the same intent is a hit if it
+scores at least the threshold. Entries are kept in a NumPy matrix in
+memory, or in a Qdrant collection shared by several server processes.
+Each entry records the version of the ingested corpus it was answered
+against, and only entries of the current version can hit: re-ingesting
+documents invalidates every cached answer.
+"""
+
+import copy
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Any, Optional, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+class NumpyCacheIndex:
+    """
+    In-memory index of at most max_entries entries. When it is full, the
+    oldest entry is overwritten.
+    """
+
+    def __init__(self, max_entries: int = 1024):
+        self.max_entries = max_entries
+        # Allocated on the first add, once the dimension is known
+        self._vectors = None
+        # "intent\ncorpus_version" of each entry, compared to filter scores
+        self._keys = np.empty(max_entries, dtype=object)
+        self._entries = []
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def search(self, vector: np.ndarray, intent: str, version: str,
+               threshold: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        with self._lock:
+            count = len(self._entries)
+            if not count:
+                return None
+            scores = self._vectors[:count] @ vector
+            scores[self._keys[:count] != f"{intent}\n{version}"] = -np.inf
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                return None
+            return float(scores[best]), self._entries[best]
+
+    def add(self, vector: np.ndarray, entry: Dict[str, Any]):
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            if len(self._entries) < self.max_entries:
+                position = len(self._entries)
+                self._entries.append(entry)
+            else:
+                position = self._next
+                self._next = (self._next + 1) % self.max_entries
+                self._entries[position] = entry
+            self._vectors[position] = vector
+            self._keys[position] = f"{entry['intent']}\n{entry['corpus_version']}"
+
+    def clear(self):
+        with self._lock:
+            self._entries = []
+            self._next = 0
+
+class QdrantCacheIndex:
+    """
+    Entries stored as points of a Qdrant collection, created on the first
+    add. Entries are not evicted; clear() drops the collection.
+    """
+
+    def __init__(self, url: str, collection_name: str, timeout: float = 5.0, pool_size: int = 8):
+        self.collection_url = f"{url.rstrip('/')}/collections/{collection_name}"
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._created = False
+        self._lock = threading.Lock()
+
+    def _ensure_collection(self, dimension: int):
+        if self._created:
+            return
+        with self._lock:
+            if self._created:
+                return
+            response = self.session.get(self.collection_url, timeout=self.timeout)
+            if response.status_code == 404:
+                body = {"vectors": {"size": dimension, "distance": "Cosine"}}
+                response = self.session.put(self.collection_url, json=body, timeout=self.timeout)
+            response.raise_for_status()
+            self._created = True
+
+    def search(self, vector: np.ndarray, intent: str, version: str,
+               threshold: float) -> Optional[Tuple[float, Dict[str, Any]]]:
+        body = {
+            "vector": vector.tolist(),
+            "limit": 1,
+            "with_payload": True,
+            "score_threshold": threshold,
+            "filter": {"must": [
+                {"key": "intent", "match": {"value": intent}},
+                {"key": "corpus_version", "match": {"value": version}}
+            ]}
+        }
+        response = self.session.post(f"{self.collection_url}/points/search", json=body, timeout=self.timeout)
+        if response.status_code == 404:
+            # Nothing was cached yet
+            return None
+        response.raise_for_status()
+        points = response.json()["result"]
+        if not points:
+            return None
+        return points[0]["score"], points[0]["payload"]
+
+    def add(self, vector: np.ndarray, entry: Dict[str, Any]):
+        self._ensure_collection(len(vector))
+        body = {"points": [{"id": str(uuid.uuid4()), "vector": vector.tolist(), "payload": entry}]}
+        response = self.session.put(f"{self.collection_url}/points", json=body, timeout=self.timeout)
+        response.raise_for_status()
+
+    def clear(self):
+        with self._lock:
+            response = self.session.delete(self.collection_url, timeout=self.timeout)
+            if response.status_code != 404:
+                response.raise_for_status()
+            self._created = False
+
+class SemanticCache:
+    """
+    Looks up and stores query results by query embedding. The embedder
+    needs embed(text) returning a unit vector. corpus_version() returns the
+    version of the ingested documents; it is called at most every
+    check_interval seconds, and the index is cleared when it changes.
+    Entries older than ttl seconds don't hit; 0 keeps them forever.
+    """
+
+    def __init__(self, embedder, index, threshold: float = 0.92, ttl: float = 0,
+                 corpus_version: Optional[Callable[[], Any]] = None, check_interval: float = 5.0):
+        self.embedder = embedder
+        self.index = index
+        self.threshold = threshold
+        self.ttl = ttl
+        self.corpus_version = corpus_version
+        self.check_interval = check_interval
+        self.enabled = True
+        self.hits = 0
+        self.misses = 0
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current_version(self) -> str:
+        with self._lock:
+            now = time.monotonic()
+            if self._version is not None and now - self._checked < self.check_interval:
+                return self._version
+            version = str(self.corpus_version()) if self.corpus_version is not None else ""
+            self._checked = now
+            changed = self._version is not None and version != self._version
+            self._version = version
+        if changed:
+            print(f"Corpus version changed to {version}, clearing the semantic cache")
+            self.index.clear()
+        return version
+
+    def _embed(self, query: str) -> Optional[np.ndarray]:
+        if not self.enabled:
+            return None
+        try:
+            return np.asarray(self.embedder.embed(query), dtype=np.float32)
+        except Exception as e:
+            # Serve every query uncached rather than failing them
+            print(f"Semantic cache embedder unavailable, disabling the cache: {e}")
+            self.enabled = False
+            return None
+
+    def get(self, query: str, intent: str) -> Optional[Dict[str, Any]]:
+        """
+        A copy of the result cached for the most similar query, with
+        cache_hit, cache_similarity and cached_query added to its
+        metadata, or None.
+        """
+        vector = self._embed(query)
+        if vector is None:
+            return None
+        try:
+            match = self.index.search(vector, intent, self.current_version(), self.threshold)
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            match = None
+        if match is not None and self.ttl and time.time() - match[1]["created"] > self.ttl:
+            match = None
+        if match is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        similarity, entry = match
+        result = copy.deepcopy(entry["result"])
+        result["query"] = query
+        result.setdefault("metadata", {}).update({
+            "cache_hit": True,
+            "cache_similarity": round(similarity, 4),
+            "cached_query": entry["query"]
+        })
+        return result
+
+    def put(self, query: str, intent: str, result: Dict[str, Any]):
+        vector = self._embed(query)
+        if vector is None:
+            return
+        try:
+            entry = {
+                "query": query,
+                "intent": intent,
+                "corpus_version": self.current_version(),
+                "created": time.time(),
+                "result": copy.deepcopy(result)
+            }
+            self.index.add(vector, entry)
+        except Exception as e:
+            print(f"Semantic cache store failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+            "corpus_version": self._version
+        }
+
+def semantic_cache_from_config(cache_config: Dict[str, Any], embedder,
+                               corpus_version: Optional[Callable[[], Any]] = None) -> Optional[SemanticCache]:
+    """
+    Build the cache described by the "semantic_cache" config section, or
+    None when it is disabled. backend is "memory" or "qdrant" (at url,
+    in collection_name).
+    """
+    if not cache_config.get('enabled') or embedder is None:
+        return None
+    if cache_config.get('backend', 'memory') == 'qdrant':
+        index = QdrantCacheIndex(cache_config['url'], cache_config.get('collection_name', 'semantic_cache'),
+                                 timeout=cache_config.get('timeout', 5.0))
+    else:
+        index = NumpyCacheIndex(max_entries=cache_config.get('max_entries', 1024))
+    return SemanticCache(
+        embedder,
+        index,
+        threshold=cache_config.get('threshold', 0.92),
+        ttl=cache_config.get('ttl', 0),
+        corpus_version=corpus_version,
+        check_interval=cache_config.get('version_check_interval', 5.0)
+    )
@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Conversation sessions for the query server.
+
+A session remembers a conversation so follow-up questions are answered
+in its light, without paying for the whole history on every turn:
+
+- After each answer, Ollama returns the context tokens of the exchange.
+  The next turn passes them back, so the model only processes the new
+  prompt instead of the conversation so far.
+- When there are no usable context tokens, for example for the first
+  turn after a compaction, the history is sent as a text prefix. The
+  prefix only changes at compactions, so Ollama can reuse its cached
+  prefix from one turn to the next.
+- Turns answered from retrieved passages don't keep the context tokens
+  they return, which would hold the passages; they enter the history as
+  their query and answer, and each turn retrieves afresh.
+- Once the context grows past max_context_tokens, the oldest turns are
+  folded into a running summary, keeping the last keep_turns verbatim.
+  Each compaction only summarizes the previous summary and the turns
+  being folded, so the cost of a turn stays flat as the conversation
+  grows.
+
+The store keeps at most max_sessions sessions, evicting the least
+recently used, and forgets sessions idle for idle_timeout seconds.
+Session ids are random tokens issued by the store; an id it didn't issue,
+or has since forgotten, finds no session.
+"""
+
+import asyncio
+import contextvars
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+_current_session: contextvars.ContextVar = contextvars.ContextVar('session', default=None)
+
+def estimate_tokens(text: str, chars_per_token: float = 4.0) -> int:
+    return int(len(text) / chars_per_token) + 1
+
+class Turn:
+    """One question and its answer"""
+
+    def __init__(self, query: str, response: str):
+        self.query = query
+        self.response = response
+
+    def format(self) -> str:
+        return f"User: {self.query}\nAssistant: {self.response}"
+
+class Session:
+    """
+    The state of one conversation: a summary of its older turns, its
+    recent turns, and the Ollama context tokens covering them, if any.
+    Turns of a session run one at a time under its lock.
+    """
+
+    def __init__(self, session_id: str):
+        self.id = session_id
+        self.summary = ""
+        self.turns: List[Turn] = []
+        # Ollama context after the last turn, the model it belongs to, and
+        # whether it covers every recorded turn
+        self.context: Optional[List[int]] = None
+        self.context_model: Optional[str] = None
+        self.context_current = False
+        # Context returned by the turn in progress, kept once it is recorded
+        self.pending_context: Optional[List[int]] = None
+        self.pending_model: Optional[str] = None
+        self.turn_count = 0
+        self.compactions = 0
+        # Set while older turns are being summarized in the background
+        self.compacting = False
+        self.created = time.time()
+        self.last_used = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def history(self) -> str:
+        """The conversation so far as text: the summary, then the recent turns"""
+        parts = []
+        if self.summary:
+            parts.append(f"Summary of the earlier conversation: {self.summary}")
+        parts.extend(turn.format() for turn in self.turns)
+        return "\n\n".join(parts)
+
+    def prepare(self, prompt: str, model: str) -> Tuple[str, Optional[List[int]]]:
+        """
+        The (prompt, context) to generate the next answer with: the prompt
+        alone with the context tokens if they cover the conversation and
+        belong to model, else the prompt after the history as text.
+        """
+        self.pending_context = self.pending_model = None
+        if self.context and self.context_current and self.context_model == model:
+            return prompt, self.context
+        history = self.history()
+        if not history:
+            return prompt, None
+        return f"Conversation so far:\n{history}\n\n{prompt}", None
+
+    def set_pending_context(self, context: Optional[List[int]], model: str):
+        self.pending_context = context
+        self.pending_model = model
+
+    def record(self, query: str, response: str):
+        """Add a finished turn, keeping the context its generation returned"""
+        self.turns.append(Turn(query, response))
+        self.turn_count += 1
+        if self.pending_context:
+            self.context, self.context_model = self.pending_context, self.pending_model
+            self.context_current = True
+        else:
+            # The answer's context wasn't kept, e.g. it held retrieved
+            # passages, so the context no longer covers the turns
+            self.context_current = False
+        self.pending_context = self.pending_model = None
+
+    def context_tokens(self, chars_per_token: float = 4.0) -> int:
+        """Tokens the next turn builds on"""
+        if self.context and self.context_current:
+            return len(self.context)
+        return estimate_tokens(self.history(), chars_per_token)
+
+    def needs_compaction(self, max_context_tokens: int, chars_per_token: float = 4.0) -> bool:
+        return self.context_tokens(chars_per_token) > max_context_tokens
+
+    def info(self) -> Dict[str, Any]:
+        return {"id": self.id, "turn": self.turn_count, "summarized": bool(self.summary)}
+
+class SessionStore:
+    """Sessions by id, at most max_sessions, least recently used first out."""
+
+    def __init__(self, max_sessions: int = 1000, idle_timeout: float = 1800):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sessions: OrderedDict = OrderedDict()
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def _expire(self, now: float):
+        while self.sessions:
+            session = next(iter(self.sessions.values()))
+            if now - session.last_used < self.idle_timeout:
+                return
+            del self.sessions[session.id]
+            self.expired += 1
+
+    def create(self) -> Session:
+        """Start a session under a new, unguessable id"""
+        now = time.monotonic()
+        with self._lock:
+            if self.idle_timeout:
+                self._expire(now)
+            session = Session(secrets.token_urlsafe(16))
+            session.last_used = now
+            self.sessions[session.id] = session
+            self.created += 1
+            while len(self.sessions) > self.max_sessions:
+                self.sessions.popitem(last=False)
+                self.evicted += 1
+            return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        """
+        The session with session_id, which becomes the most recently used,
+        or None if there is none (anymore).
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.idle_timeout:
+                self._expire(now)
+            session = self.sessions.get(session_id)
+            if session is not None:
+                self.sessions.move_to_end(session.id)
+                session.last_used = now
+            return session
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "sessions": len(self.sessions),
+            "created": self.created,
+            "evicted": self.evicted,
+            "expired": self.expired
+        }
+
+def current_session() -> Optional[Session]:
+    """The session of the turn being processed, or None outside a session"""
+    return _current_session.get()
+
+@contextmanager
+def use_session(session: Session) -> Iterator[Session]:
+    """Make session the current session in the enclosed block"""
+    token = _current_session.set(session)
+    try:
+        yield session
+    finally:
+        _current_session.reset(token)
+
+def summary_prompt(summary: str, turns: List[Turn]) -> str:
+    """Prompt asking to fold turns into the running summary"""
+    exchanges = "\n\n".join(turn.format() for turn in turns)
+    previous = f"Summary so far:\n{summary}\n\n" if summary else ""
+    return (f"{previous}New exchanges:\n{exchanges}\n\n"
+            "Update the summary of this conversation to cover the new exchanges. Keep the facts, "
+            "names and open questions a follow-up could refer to, in at most a few sentences.\n\nSummary:")
+
+def turns_to_fold(session: Session, keep_turns: int) -> List[Turn]:
+    """The oldest turns to fold into the summary, leaving keep_turns (at least one when possible)"""
+    keep = max(0, min(keep_turns, len(session.turns) - 1))
+    return session.turns[:len(session.turns) - keep]
+
+def apply_compaction(session: Session, folded: List[Turn], summary: str):
+    """Replace folded turns with the summary covering them"""
+    session.summary = summary
+    session.turns = session.turns[len(folded):]
+    # The next turn starts again from the history as text
+    session.context = None
+    session.context_current = False
+    session.compactions += 1
+
+def session_store_from_config(session_config: Dict[str, Any]) -> Optional[SessionStore]:
+    """Build the store described by the "sessions" config section, or None when it is disabled."""
+    if not session_config.get('enabled', True):
+        return None
+    return SessionStore(
+        max_sessions=session_config.get('max_sessions', 1000),
+        idle_timeout=session_config.get('idle_timeout', 1800)
+    )
@@ -8,14 +8,7 @@ import sys
 import time
 import requests
 
-def load_config():
-    """Load configuration from config.json"""
-    try:
-        with open('/app/config.json', 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        sys.exit(1)
+from common import load_config
 
 def load_workflow(workflow_path):
     """Load workflow JSON from file"""
@@ -3,19 +3,9 @@
 Setup script for initializing the Qdrant vector database.
 """
 
-import json
-import sys
 from qdrant_client import QdrantClient
-from qdrant_client.http import models
 
-def load_config():
-    """Load configuration from config.json"""
-    try:
-        with open('/app/config.json', 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        print(f"Error loading config: {e}")
-        sys.exit(1)
+from common import create_collection, load_config
 
 def setup_vectordb():
     """Initialize the Qdrant vector database"""
@@ -23,7 +13,7 @@ def setup_vectordb():
     vectordb_config = config['vectordb']
     
     # Connect to Qdrant
-    client = QdrantClient(url=vectordb_config['host'])
+    client = QdrantClient(url=vectordb_config.get('url', vectordb_config.get('host')))
     
     # Check if collection exists
     collections = client.get_collections().collections
@@ -34,13 +24,7 @@ def setup_vectordb():
         return
     
     # Create collection
-    client.create_collection(
-        collection_name=vectordb_config['collection_name'],
-        vectors_config=models.VectorParams(
-            size=vectordb_config['dimension'],
-            distance=models.Distance.COSINE
-        )
-    )
+    create_collection(client, vectordb_config)
     
     print(f"Created collection {vectordb_config['collection_name']} successfully.")
 
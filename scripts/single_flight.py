@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Single-flight execution: concurrent calls with the same key share one run.
+
+The first caller of a key (the leader) runs the call; callers arriving
+while it runs (followers) wait for its result instead of starting their
+own. Calls that stream, like LLM generations, pass each fragment to
+emit(), and every caller receives the fragments through its own token
+callback, followers joining midway getting the earlier fragments first.
+The shared run is only cancelled once every caller has cancelled, so a
+leader whose client goes away doesn't cut off the others.
+"""
+
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Seconds between checks of a waiting follower's cancel event
+FOLLOWER_POLL_INTERVAL = 0.05
+
+class Participant:
+    """One caller of a flight: where its fragments go and its cancel event"""
+
+    def __init__(self, on_token: Optional[Callable[[str], None]], cancel: Optional[threading.Event]):
+        self.on_token = on_token
+        self.cancel = cancel
+        # Raised by on_token; re-raised to this caller once the flight ends
+        self.error = None
+
+    @property
+    def active(self) -> bool:
+        return self.error is None and not (self.cancel is not None and self.cancel.is_set())
+
+    def deliver(self, fragment: str):
+        if self.on_token is None or not self.active:
+            return
+        try:
+            self.on_token(fragment)
+        except Exception as e:
+            self.error = e
+
+class Flight:
+    """
+    A running call and its callers. The flight doubles as the run's cancel
+    event: is_set() is True once no caller is still waiting.
+    """
+
+    def __init__(self):
+        self.fragments = []
+        self.participants = []
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    def join(self, participant: Participant):
+        # Replay under the lock so no fragment is missed or delivered twice
+        with self._lock:
+            for fragment in self.fragments:
+                participant.deliver(fragment)
+            self.participants.append(participant)
+
+    def emit(self, fragment: str):
+        with self._lock:
+            self.fragments.append(fragment)
+            for participant in self.participants:
+                participant.deliver(fragment)
+
+    def is_set(self) -> bool:
+        return not any(participant.active for participant in self.participants)
+
+class SingleFlight:
+    """Deduplicates concurrent calls by key and counts how many were shared."""
+
+    def __init__(self):
+        self.flights: Dict[str, Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+
+    def run(self, key: str, fn: Callable[[Callable[[str], None], Flight], Any],
+            on_token: Optional[Callable[[str], None]] = None,
+            cancel: Optional[threading.Event] = None) -> Tuple[Any, bool]:
+        """
+        Return (result, shared): fn(emit, cancel)'s result, run by this
+        caller or by an identical call already in flight, in which case
+        shared is True. on_token receives the fragments fn emits. A
+        follower whose cancel event is set stops waiting and gets the
+        fragments received so far.
+        """
+        with self._lock:
+            flight = self.flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = Flight()
+                self.flights[key] = flight
+                self.leaders += 1
+            else:
+                self.coalesced += 1
+        participant = Participant(on_token, cancel)
+        flight.join(participant)
+
+        if leader:
+            try:
+                flight.result = fn(flight.emit, flight)
+            except BaseException as e:
+                flight.error = e
+            finally:
+                with self._lock:
+                    del self.flights[key]
+                flight.done.set()
+        else:
+            while not flight.done.wait(FOLLOWER_POLL_INTERVAL if cancel is not None else None):
+                if cancel.is_set():
+                    return ''.join(flight.fragments), True
+
+        if participant.error is not None:
+            raise participant.error
+        if flight.error is not None:
+            raise flight.error
+        return flight.result, not leader
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self.flights),
+            "upstream_calls": self.leaders,
+            "coalesced_calls": self.coalesced,
+            "coalesced_ratio": self.coalesced / calls if calls else 0.0
+        }
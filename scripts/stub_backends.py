@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Stub Ollama and Qdrant servers for benchmarking the serving path.
+
+The Ollama stub answers /api/generate (streaming and not) after a fixed
+latency to the first token and then at a fixed token rate, and reports
+prompt_eval_count/eval_count/eval_duration like the real server. Like
+Ollama it returns the context tokens of the exchange, and a request that
+passes them back only pays prompt_rate for its new prompt tokens. The
+Qdrant stub answers points/search and points/search/batch with cosine
+search over a small synthetic collection. HashingEmbedder stands in for
+the sentence-transformers model so no model download is needed.
+
+Run directly to serve both stubs until interrupted:
+    python scripts/stub_backends.py --ollama-port 11434 --qdrant-port 6333
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, List, Any
+
+import numpy as np
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            # Clients close streamed responses early; that's not an error
+            pass
+
+    def _read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get('Content-Length', 0))
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send_json(self, body: Any, status_code: int = 200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status_code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+class StubOllamaHandler(_JSONHandler):
+    """
+    Set on the server: latency (s to first token), token_rate (tokens/s),
+    response_tokens and prompt_rate (prompt tokens/s, 0 for no prefill time)
+    """
+
+    def do_GET(self):
+        if self.path == '/api/tags':
+            self._send_json({"models": [{"name": "stub"}]})
+        else:
+            self._send_json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        if self.path != '/api/generate':
+            self._send_json({"error": "not found"}, 404)
+            return
+        request = self._read_json()
+        prompt_words = re.findall(r'\S+', request.get('prompt', '')) or ['token']
+        count = self.server.response_tokens
+        words = [prompt_words[i % len(prompt_words)] for i in range(count)]
+        interval = 1.0 / self.server.token_rate
+        # Words stand in for tokens; ids are only meant to be passed back
+        context = list(request.get('context') or []) + [len(word) for word in prompt_words + words]
+        stats = {
+            "done": True,
+            "prompt_eval_count": len(prompt_words),
+            "eval_count": count,
+            "eval_duration": int(count * interval * 1e9),
+            "context": context
+        }
+
+        prefill = len(prompt_words) / self.server.prompt_rate if self.server.prompt_rate else 0.0
+        time.sleep(self.server.latency + prefill)
+        if request.get('stream', True) is False:
+            time.sleep(count * interval)
+            self._send_json({"model": request.get('model'), "response": ' '.join(words), **stats})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(interval)
+            self._write_chunk({"model": request.get('model'), "response": (' ' if i else '') + word, "done": False})
+        self._write_chunk({"model": request.get('model'), "response": "", **stats})
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, message: Dict[str, Any]):
+        data = (json.dumps(message) + '\n').encode('utf-8')
+        self.wfile.write(f'{len(data):X}\r\n'.encode('ascii') + data + b'\r\n')
+        self.wfile.flush()
+
+class StubQdrantHandler(_JSONHandler):
+    """Set on the server: vectors (unit rows) and payloads of the collection"""
+
+    def do_POST(self):
+        request = self._read_json()
+        if self.path.endswith('/points/search/batch'):
+            self._send_json({"result": [self._search(search) for search in request.get('searches', [])],
+                             "status": "ok"})
+        elif self.path.endswith('/points/search'):
+            self._send_json({"result": self._search(request), "status": "ok"})
+        else:
+            self._send_json({"status": {"error": "not found"}}, 404)
+
+    def _search(self, request: Dict[str, Any]) -> List[Dict[str, Any]]:
+        scores = self.server.vectors @ np.asarray(request['vector'], dtype=np.float32)
+        top = np.argsort(-scores)[:request.get('limit', 10)]
+        threshold = request.get('score_threshold')
+        return [
+            {"id": int(i), "score": float(scores[i]), "payload": self.server.payloads[i]}
+            for i in top if threshold is None or scores[i] >= threshold
+        ]
+
+class HashingEmbedder:
+    """Deterministic bag-of-words embeddings with the QueryEmbedder interface"""
+
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+
+    def embed(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dimension, dtype=np.float32)
+        for word in re.findall(r'\w+', text.lower()):
+            digest = hashlib.md5(word.encode('utf-8')).digest()
+            vector[int.from_bytes(digest[:4], 'little') % self.dimension] += 1.0
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        return np.stack([self.embed(text) for text in texts])
+
+def _serve(server: ThreadingHTTPServer) -> ThreadingHTTPServer:
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def start_stub_ollama(port: int = 0, latency: float = 0.05, token_rate: float = 50.0,
+                      response_tokens: int = 32, host: str = '127.0.0.1',
+                      prompt_rate: float = 0.0) -> ThreadingHTTPServer:
+    """Serve the Ollama stub in a background thread; port 0 picks a free port."""
+    server = ThreadingHTTPServer((host, port), StubOllamaHandler)
+    server.latency = latency
+    server.token_rate = token_rate
+    server.response_tokens = response_tokens
+    server.prompt_rate = prompt_rate
+    return _serve(server)
+
+def start_stub_qdrant(port: int = 0, documents: int = 1000, embedder: HashingEmbedder = None,
+                      host: str = '127.0.0.1') -> ThreadingHTTPServer:
+    """Serve the Qdrant stub over synthetic documents in a background thread."""
+    embedder = embedder or HashingEmbedder()
+    topics = ['machine learning', 'neural networks', 'natural language processing', 'computer vision',
+              'reinforcement learning', 'databases', 'distributed systems', 'compilers']
+    payloads = []
+    for i in range(documents):
+        topic = topics[i % len(topics)]
+        payloads.append({
+            "title": f"Document {i} on {topic}",
+            "text": f"Document {i} discusses {topic}. " * 20,
+            "source": f"synthetic/{i}.txt"
+        })
+    server = ThreadingHTTPServer((host, port), StubQdrantHandler)
+    server.vectors = embedder.embed_batch([payload["text"] for payload in payloads])
+    server.payloads = payloads
+    return _serve(server)
+
+def server_url(server: ThreadingHTTPServer) -> str:
+    host, port = server.server_address[:2]
+    return f"http://{host}:{port}"
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve stub Ollama and Qdrant backends.")
+    parser.add_argument('--ollama-port', type=int, default=11434)
+    parser.add_argument('--qdrant-port', type=int, default=6333)
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds to the first token")
+    parser.add_argument('--token-rate', type=float, default=50.0, help="generated tokens per second")
+    parser.add_argument('--response-tokens', type=int, default=32)
+    parser.add_argument('--documents', type=int, default=1000, help="synthetic Qdrant collection size")
+    args = parser.parse_args()
+
+    ollama = start_stub_ollama(args.ollama_port, args.latency, args.token_rate, args.response_tokens, host='')
+    qdrant = start_stub_qdrant(args.qdrant_port, args.documents, host='')
+    print(f"Stub Ollama on port {ollama.server_address[1]}, stub Qdrant on port {qdrant.server_address[1]}. "
+          f"Press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        print('Stubs stopped.')
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for the asyncio engine and its request deadlines.
+"""
+
+import asyncio
+import contextvars
+import threading
+import time
+
+from async_engine import AsyncEngine, DeadlineExceeded
+
+ENGINE = AsyncEngine(max_workers=4)
+
+def test_run_returns_the_result_and_keeps_context():
+    request_id = contextvars.ContextVar('request_id', default=None)
+
+    async def pipeline():
+        first, second = await asyncio.gather(
+            ENGINE.run_blocking(request_id.get),
+            ENGINE.run_blocking(lambda: request_id.get())
+        )
+        return first, second
+
+    request_id.set("abc")
+    assert ENGINE.run(pipeline()) == ("abc", "abc")
+
+def test_errors_reach_the_caller():
+    async def failing():
+        raise ValueError("bad input")
+
+    try:
+        ENGINE.run(failing())
+    except ValueError as e:
+        assert str(e) == "bad input"
+    else:
+        raise AssertionError("the error was swallowed")
+
+def test_deadline_cancels_blocking_calls():
+    stopped = threading.Event()
+
+    def slow_call(cancel):
+        # Stops as soon as the awaiting task is cancelled
+        if cancel.wait(5):
+            stopped.set()
+
+    async def pipeline():
+        await ENGINE.run_cancellable(slow_call)
+
+    start = time.perf_counter()
+    try:
+        ENGINE.run(pipeline(), timeout=0.1)
+    except DeadlineExceeded:
+        pass
+    else:
+        raise AssertionError("the deadline was not enforced")
+    assert time.perf_counter() - start < 1
+    assert stopped.wait(1)
+
+def test_work_within_the_deadline_completes():
+    async def quick():
+        await asyncio.sleep(0.01)
+        return "done"
+
+    assert ENGINE.run(quick(), timeout=1) == "done"
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Tests for the character and token chunkers.
+"""
+
+from chunker import CharacterChunker, TokenChunker, chunker_from_config, split_sentences
+
+def whitespace_tokenizer(texts, add_special_tokens=False):
+    """One token per word, with the tokenizer call signature TokenChunker uses"""
+    return {'input_ids': [text.split() for text in texts]}
+
+def test_character_chunks_overlap():
+    chunks = CharacterChunker(chunk_size=10, overlap=4).split("abcdefghijklmnopqrst")
+    assert chunks == ["abcdefghij", "ghijklmnop", "mnopqrst", "st"]
+    assert CharacterChunker(chunk_size=10, overlap=0).split("   ") == []
+
+def test_split_sentences_marks_paragraphs():
+    text = "One. Two!\n\nThree? (Four.) Five"
+    spans = split_sentences(text)
+    assert [text[start:end] for start, end, _ in spans] == ["One.", "Two!", "Three?", "(Four.)", "Five"]
+    assert [starts for _, _, starts in spans] == [True, False, True, False, False]
+
+def test_token_chunks_keep_sentences_whole_and_overlap():
+    text = "a b c. d e f. g h i. j k l."
+    # 8 tokens after the two reserved for special tokens
+    chunks = TokenChunker(whitespace_tokenizer, max_tokens=10, overlap_tokens=3).split(text)
+    assert chunks == ["a b c. d e f.", "d e f. g h i.", "g h i. j k l."]
+
+def test_token_chunks_close_at_paragraph_breaks():
+    text = "a b c d e.\n\nf g h."
+    chunker = TokenChunker(whitespace_tokenizer, max_tokens=12, overlap_tokens=0, min_fill=0.5)
+    assert chunker.split(text) == ["a b c d e.", "f g h."]
+
+def test_long_sentences_are_cut_into_word_runs():
+    text = " ".join(f"w{i}" for i in range(20)) + "."
+    chunks = TokenChunker(whitespace_tokenizer, max_tokens=10, overlap_tokens=0).split(text)
+    assert all(len(chunk.split()) <= 8 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
+
+def test_chunker_from_config():
+    assert isinstance(chunker_from_config({}, "model"), CharacterChunker)
+    chunker = chunker_from_config({"chunker": "token", "max_tokens": 64}, "model", tokenizer=whitespace_tokenizer)
+    assert isinstance(chunker, TokenChunker) and chunker.max_tokens == 62
+    try:
+        chunker_from_config({"chunker": "other"}, "model")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("an unknown chunker was accepted")
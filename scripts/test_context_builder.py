@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Tests for packing search results into the RAG prompt context.
+"""
+
+from context_builder import ContextBuilder, find_overlap, merge_text
+
+SENTENCE = "Neural networks learn representations from data by adjusting their weights. "
+
+def chunk(doc_id, text, score, source="guide.md"):
+    return {"id": doc_id, "title": source, "source": source, "content": text, "score": score}
+
+def test_find_overlap():
+    left = "a" * 20 + SENTENCE
+    right = SENTENCE + "b" * 20
+    assert find_overlap(left, right, min_overlap=50) == len(SENTENCE)
+    assert find_overlap(left, "c" * 100, min_overlap=50) == 0
+
+def test_merge_text_extends_either_end():
+    head, tail = "x" * 30 + SENTENCE, SENTENCE + "y" * 30
+    assert merge_text(head, tail, 50) == "x" * 30 + SENTENCE + "y" * 30
+    assert merge_text(tail, head, 50) == "x" * 30 + SENTENCE + "y" * 30
+    assert merge_text(head, SENTENCE, 50) == head
+    assert merge_text(head, "z" * 100, 50) is None
+
+def test_overlapping_chunks_are_merged_once():
+    first = "Intro text. " * 5 + SENTENCE
+    second = SENTENCE + "More detail follows here. " * 3
+    packed = ContextBuilder(max_tokens=1000).build([chunk("1", first, 0.9), chunk("2", second, 0.8)])
+    assert packed["context"].count(SENTENCE.strip()) == 1
+    assert packed["context"].count("Document: guide.md") == 1
+    assert [doc["id"] for doc in packed["documents"]] == ["1", "2"]
+
+def test_chunks_of_other_sources_are_not_merged():
+    packed = ContextBuilder(max_tokens=1000).build([
+        chunk("1", "Intro text. " * 5 + SENTENCE, 0.9, "a.md"),
+        chunk("2", SENTENCE + "Other text. " * 5, 0.8, "b.md")
+    ])
+    assert packed["context"].count("Document:") == 2
+
+def test_budget_and_stable_order():
+    results = [chunk(str(i), f"Passage {i} " + "word " * 60, 1.0 - i / 10, f"doc{i}.md") for i in range(5)]
+    builder = ContextBuilder(max_tokens=200)
+    packed = builder.build(results)
+    assert packed["tokens"] <= 200
+    assert len(packed["documents"]) < 5
+    # The same documents give the same context in whatever order they arrive
+    assert builder.build(list(reversed(packed["documents"])))["context"] == packed["context"]
+
+def test_best_result_is_cut_to_the_budget():
+    packed = ContextBuilder(max_tokens=50).build([chunk("1", "word " * 500, 0.9)])
+    assert packed["documents"] and packed["tokens"] <= 50
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Tests for the embedding daemon's socket location and peer check.
+"""
+
+import os
+import stat
+import threading
+
+from common import embedding_daemon
+from common.embedding_daemon import EmbeddingDaemon, RemoteEmbedder, connect_embedder, default_socket_path
+
+def test_default_socket_is_per_user(monkeypatch, tmp_path):
+    monkeypatch.setenv('XDG_RUNTIME_DIR', str(tmp_path))
+    assert default_socket_path() == str(tmp_path / 'ai-workflow-embeddings.sock')
+    monkeypatch.delenv('XDG_RUNTIME_DIR')
+    assert default_socket_path() == f"/tmp/ai-workflow-{os.getuid()}/embeddings.sock"
+
+def test_clients_only_use_their_own_users_daemon(monkeypatch, tmp_path):
+    socket_path = str(tmp_path / 'run' / 'embeddings.sock')
+    daemon = EmbeddingDaemon(socket_path)
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    try:
+        assert stat.S_IMODE(os.stat(tmp_path / 'run').st_mode) == 0o700
+        RemoteEmbedder(socket_path, 'model')._connect().close()
+
+        monkeypatch.setattr(embedding_daemon.os, 'getuid', lambda: os.geteuid() + 1)
+        try:
+            connect_embedder(socket_path, 'model')
+        except PermissionError:
+            pass
+        else:
+            raise AssertionError("a daemon of another user was used")
+        # The other user's daemon is left alone
+        assert os.path.exists(socket_path)
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
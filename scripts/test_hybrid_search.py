@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Tests for reciprocal rank fusion of lexical and vector results.
+"""
+
+from hybrid_search import reciprocal_rank_fusion
+
+def results(*ids):
+    return [{"id": doc_id, "title": doc_id, "content": doc_id, "relevance": 0.5} for doc_id in ids]
+
+def test_documents_found_by_both_retrievers_rank_first():
+    fused = reciprocal_rank_fusion({"lexical": results("a", "b", "c"), "vector": results("c", "d", "a")}, k=60)
+    assert [doc["id"] for doc in fused][:2] == ["a", "c"]
+    assert fused[0]["retrievers"] == ["lexical", "vector"]
+    assert {doc["id"] for doc in fused} == {"a", "b", "c", "d"}
+
+def test_scores_are_reciprocal_ranks():
+    fused = reciprocal_rank_fusion({"lexical": results("a", "b"), "vector": results("b")}, k=10)
+    scores = {doc["id"]: doc["score"] for doc in fused}
+    assert scores["a"] == 1 / 11
+    assert scores["b"] == 1 / 12 + 1 / 11
+
+def test_weights_and_top_k():
+    lists = {"lexical": results("a"), "vector": results("b")}
+    fused = reciprocal_rank_fusion(lists, weights={"vector": 2.0}, top_k=1)
+    assert [doc["id"] for doc in fused] == ["b"]
+
+def test_inputs_are_not_modified():
+    lexical = results("a")
+    reciprocal_rank_fusion({"lexical": lexical, "vector": results("a")})
+    assert "retrievers" not in lexical[0]
+    assert "score" not in lexical[0]
@@ -0,0 +1,36 @@
+#!/usr/bin/env python3
+"""
+Tests for the chunk payloads ingestion writes to Qdrant and the snapshot.
+"""
+
+import json
+
+import numpy as np
+
+from ingest_documents import carry_over_snapshot, chunk_payload, iter_document_chunks, snapshot_payload
+from vector_search import SnapshotWriter, iter_snapshot
+
+def test_record_fields_cannot_replace_reserved_payload_keys(tmp_path):
+    path = tmp_path / "records.jsonl"
+    record = {"id": "rec-1", "text": "A record about databases", "source": "crm", "author": "ann"}
+    path.write_text(json.dumps(record) + "\n")
+    [chunk] = list(iter_document_chunks(path))
+
+    payload = snapshot_payload(chunk)
+    assert payload["id"] == chunk["id"] != "rec-1"
+    assert payload["text"] == "A record about databases"
+    assert payload["source"] == str(path)
+    assert (payload["record_id"], payload["record_source"], payload["author"]) == ("rec-1", "crm", "ann")
+    assert "id" not in chunk_payload(chunk)
+
+def test_stale_rows_of_jsonl_records_are_dropped(tmp_path):
+    path = tmp_path / "records.jsonl"
+    path.write_text(json.dumps({"id": "rec-1", "text": "old text"}) + "\n")
+    old_chunk = list(iter_document_chunks(path))[0]
+    snapshot_path = str(tmp_path / "snapshot")
+    with SnapshotWriter(snapshot_path) as writer:
+        writer.append(np.ones((1, 4), dtype=np.float32), [snapshot_payload(old_chunk)])
+
+    with SnapshotWriter(snapshot_path) as writer:
+        carry_over_snapshot(snapshot_path, writer, {old_chunk["id"]})
+    assert [payload for _, payloads in iter_snapshot(snapshot_path) for payload in payloads] == []
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the incremental ingestion manifest and stable point IDs.
+"""
+
+import uuid
+
+from ingest_manifest import DeltaTracker, IngestManifest, chunk_hash, chunk_point_id
+
+def make_chunks(source, texts):
+    return [{"id": chunk_point_id(source, chunk_hash(text)), "text": text,
+             "metadata": {"chunk_hash": chunk_hash(text)}} for text in texts]
+
+def test_point_ids_are_stable_uuid5():
+    point_id = chunk_point_id("docs/a.md", chunk_hash("some text"))
+    assert uuid.UUID(point_id).version == 5
+    assert point_id == chunk_point_id("docs/a.md", chunk_hash("some text"))
+    assert point_id != chunk_point_id("docs/b.md", chunk_hash("some text"))
+    assert point_id != chunk_point_id("docs/a.md", chunk_hash("other text"))
+
+def test_delta_yields_only_new_chunks(tmp_path):
+    source = tmp_path / "a.md"
+    source.write_text("v1")
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+
+    first = DeltaTracker(manifest)
+    assert len(list(first.delta(source, make_chunks(str(source), ["one", "two"])))) == 2
+    first.current.save()
+
+    second = DeltaTracker(IngestManifest.load(str(tmp_path / "manifest.json")))
+    changed = list(second.delta(source, make_chunks(str(source), ["one", "three"])))
+    assert [chunk["text"] for chunk in changed] == ["three"]
+    assert second.unchanged_chunks == 1
+    assert second.stale_ids == {chunk_point_id(str(source), chunk_hash("two"))}
+
+def test_force_reembeds_everything(tmp_path):
+    source = tmp_path / "a.md"
+    source.write_text("v1")
+    tracker = DeltaTracker(IngestManifest(str(tmp_path / "manifest.json")))
+    list(tracker.delta(source, make_chunks(str(source), ["one"])))
+    forced = DeltaTracker(tracker.current, force=True)
+    assert len(list(forced.delta(source, make_chunks(str(source), ["one"])))) == 1
+
+def test_removed_files_are_forgotten(tmp_path):
+    kept, removed = tmp_path / "kept.md", tmp_path / "removed.md"
+    for path in (kept, removed):
+        path.write_text("text")
+    tracker = DeltaTracker(IngestManifest(str(tmp_path / "manifest.json")))
+    for path in (kept, removed):
+        list(tracker.delta(path, make_chunks(str(path), [path.name])))
+
+    next_run = DeltaTracker(tracker.current)
+    assert next_run.remove_missing({str(kept)}) == [str(removed)]
+    assert next_run.stale_ids == {chunk_point_id(str(removed), chunk_hash("removed.md"))}
+    assert next_run.current.sources() == {str(kept)}
+
+def test_unchanged_files_are_detected(tmp_path):
+    source = tmp_path / "a.md"
+    source.write_text("v1")
+    manifest = IngestManifest(str(tmp_path / "manifest.json"))
+    assert not manifest.is_unchanged(source)
+    manifest.set_file(source, [])
+    assert manifest.is_unchanged(source)
+    source.write_text("version 2")
+    assert not manifest.is_unchanged(source)
+
+def test_points_of_files_that_fail_midway_are_deleted_next_run(tmp_path):
+    source = tmp_path / "a.md"
+    source.write_text("v1")
+    first = DeltaTracker(IngestManifest(str(tmp_path / "manifest.json")))
+    list(first.delta(source, make_chunks(str(source), ["one", "two"])))
+
+    def failing_chunks():
+        yield from make_chunks(str(source), ["one", "partial"])
+        raise ValueError("unreadable section")
+
+    source.write_text("version 2")
+    second = DeltaTracker(first.current)
+    uploaded = []
+    try:
+        for chunk in second.delta(source, failing_chunks()):
+            uploaded.append(chunk["text"])
+    except ValueError:
+        pass
+    assert uploaded == ["partial"]
+    assert not second.current.is_unchanged(source)
+    assert second.stale_ids == set()
+
+    third = DeltaTracker(second.current)
+    assert [chunk["text"] for chunk in third.delta(source, make_chunks(str(source), ["one", "three"]))] == ["three"]
+    assert third.stale_ids == {chunk_point_id(str(source), chunk_hash(text)) for text in ("two", "partial")}
@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+"""
+Tests for the BM25 lexical index.
+"""
+
+from lexical_index import LexicalIndex
+
+DOCUMENTS = [
+    {"id": "1", "title": "Databases", "content": "Relational databases store rows in tables with indexes"},
+    {"id": "2", "title": "Vectors", "content": "Vector databases search embeddings by cosine similarity"},
+    {"id": "3", "title": "Cooking", "content": "Slow cooking brings out the flavour of the stew"},
+    {"id": "4", "title": "Indexes", "content": "An inverted index maps each term to its postings; indexes speed up search"},
+]
+
+def build_index():
+    index = LexicalIndex()
+    index.add_documents(DOCUMENTS)
+    return index
+
+def test_top_k_ranks_matching_documents():
+    results = build_index().search("relational databases", top_k=2)
+    # Matching both terms beats matching one
+    assert [doc["id"] for doc in results] == ["1", "2"]
+    assert results[0]["score"] >= results[1]["score"]
+    assert all(0 < doc["relevance"] <= 1 for doc in results)
+
+def test_top_k_limits_results():
+    index = build_index()
+    assert len(index.search("search databases", top_k=1)) == 1
+    assert len(index.search("search databases", top_k=None)) == 3
+
+def test_rare_terms_outweigh_common_ones():
+    results = build_index().search("databases stew")
+    assert results[0]["id"] == "3"
+
+def test_stopword_only_queries_match_nothing():
+    index = build_index()
+    assert index.search("the of and") == []
+    assert index.search("") == []
+
+def test_unknown_terms_match_nothing():
+    assert build_index().search("quantum chromodynamics") == []
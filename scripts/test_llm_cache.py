@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Tests for the LLM response cache keys and backends.
+"""
+
+import time
+
+from llm_cache import MemoryCache, SQLiteCache, make_cache_key
+
+def test_keys_cover_everything_that_shapes_the_output():
+    key = make_cache_key("model", "prompt", "system", {"temperature": 0.2, "top_p": 0.9})
+    assert key == make_cache_key("model", "prompt", "system", {"top_p": 0.9, "temperature": 0.2})
+    assert key != make_cache_key("other", "prompt", "system", {"temperature": 0.2, "top_p": 0.9})
+    assert key != make_cache_key("model", "prompt!", "system", {"temperature": 0.2, "top_p": 0.9})
+    assert key != make_cache_key("model", "prompt", "other", {"temperature": 0.2, "top_p": 0.9})
+    assert key != make_cache_key("model", "prompt", "system", {"temperature": 0.3, "top_p": 0.9})
+
+def test_memory_cache_evicts_least_recently_used():
+    cache = MemoryCache(max_entries=2)
+    cache.set("a", "1")
+    cache.set("b", "2")
+    assert cache.get("a") == "1"
+    cache.set("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1" and cache.get("c") == "3"
+    assert cache.stats()["evictions"] == 1
+
+def test_memory_cache_expires_entries():
+    cache = MemoryCache(ttl=0.01)
+    cache.set("a", "1")
+    time.sleep(0.02)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+def test_sqlite_cache_survives_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    SQLiteCache(path).set("a", "1")
+    cache = SQLiteCache(path, max_entries=1)
+    assert cache.get("a") == "1"
+    cache.set("b", "2")
+    assert len(cache) == 1 and cache.get("b") == "2"
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for balancing, failover and ejection in the LLM backend pool.
+"""
+
+import time
+
+import requests
+
+from llm_client import Backend, LLMPool
+
+class FakeClient:
+    """Stands in for LLMClient: answers, or fails with the given error"""
+
+    def __init__(self, base_url, error=None):
+        self.base_url = base_url
+        self.error = error
+        self.calls = 0
+
+    def generate(self, model, prompt, *args, **kwargs):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return {"response": f"{self.base_url} answered", "done": True}
+
+def make_pool(*clients, **options):
+    options.setdefault("health_check_interval", 0)
+    return LLMPool([Backend(client) for client in clients], **options)
+
+def test_requests_fail_over_to_a_working_backend():
+    down = FakeClient("http://down", requests.ConnectionError("refused"))
+    up = FakeClient("http://up")
+    pool = make_pool(down, up)
+    for _ in range(4):
+        assert pool.generate("model", "hi")["response"] == "http://up answered"
+    assert up.calls == 4
+
+def test_failing_backends_are_ejected_and_readmitted():
+    down = FakeClient("http://down", requests.ConnectionError("refused"))
+    up = FakeClient("http://up")
+    pool = make_pool(down, up, eject_after_failures=2, eject_seconds=0.05)
+    # Ties are broken at random, so send requests until down has failed twice
+    for _ in range(200):
+        pool.generate("model", "hi")
+        if down.calls == 2:
+            break
+    assert not pool.backends[0].healthy
+    for _ in range(10):
+        pool.generate("model", "hi")
+    # Ejected, so later requests skip it
+    assert down.calls == 2
+    down.error = None
+    time.sleep(0.06)
+    for _ in range(200):
+        pool.generate("model", "hi")
+        if down.calls > 2:
+            break
+    assert pool.backends[0].healthy and down.calls > 2
+
+def test_client_errors_are_not_retried_elsewhere():
+    bad_request = requests.HTTPError("400", response=requests.Response())
+    bad_request.response.status_code = 400
+    first = FakeClient("http://first", bad_request)
+    second = FakeClient("http://second", bad_request)
+    pool = make_pool(first, second)
+    try:
+        pool.generate("model", "hi")
+    except requests.HTTPError:
+        pass
+    else:
+        raise AssertionError("the error was swallowed")
+    assert first.calls + second.calls == 1
+    assert all(backend.healthy for backend in pool.backends)
+
+def test_models_are_served_only_by_their_backends():
+    small, large = FakeClient("http://small"), FakeClient("http://large")
+    pool = LLMPool([Backend(small, models=["small"]), Backend(large, models=["large"])], health_check_interval=0)
+    assert pool.generate("large", "hi")["response"] == "http://large answered"
+    try:
+        pool.generate("other", "hi")
+    except RuntimeError as e:
+        assert "other" in str(e)
+    else:
+        raise AssertionError("a model no backend serves was accepted")
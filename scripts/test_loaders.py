@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Tests for the extension-keyed document loaders.
+"""
+
+import json
+
+from loaders import LOADERS, iter_sections, register_loader, supported_extensions
+
+def test_registry_covers_the_built_in_formats():
+    for extension in ('.txt', '.md', '.jsonl', '.html', '.pdf'):
+        assert extension in supported_extensions()
+
+def test_registered_loaders_receive_their_options(tmp_path):
+    @register_loader('.fake')
+    def load_fake(file_path, options):
+        yield {"text": options["prefix"] + file_path.read_text(), "metadata": {}}
+
+    try:
+        path = tmp_path / "doc.FAKE"
+        path.write_text("body")
+        sections = list(iter_sections(path, {"fake": {"prefix": "> "}}))
+        assert sections == [{"text": "> body", "metadata": {}}]
+    finally:
+        del LOADERS['.fake']
+
+def test_unknown_extensions_are_rejected(tmp_path):
+    path = tmp_path / "image.png"
+    path.write_bytes(b"")
+    try:
+        iter_sections(path)
+    except ValueError as e:
+        assert ".png" in str(e)
+    else:
+        raise AssertionError("an unknown extension was accepted")
+
+def test_text_blocks_are_cut_at_paragraphs(tmp_path):
+    paragraphs = [f"Paragraph {i} " + "word " * 10 for i in range(6)]
+    text = "\n\n".join(paragraphs)
+    path = tmp_path / "doc.txt"
+    path.write_text(text)
+    sections = list(iter_sections(path, {"txt": {"block_size": 150}}))
+    assert len(sections) > 1
+    assert "".join(section["text"] for section in sections) == text
+    for paragraph in paragraphs:
+        assert any(paragraph in section["text"] for section in sections)
+
+def test_jsonl_maps_fields_to_metadata(tmp_path):
+    path = tmp_path / "records.jsonl"
+    records = [
+        {"body": "First record", "author": "ann", "year": 2020, "tags": ["x"]},
+        {"body": ""},
+        {"body": "Second record", "author": "bob"}
+    ]
+    path.write_text("\n".join(json.dumps(record) for record in records) + "\n\n")
+    sections = list(iter_sections(path, {"jsonl": {"text_field": "body"}}))
+    assert sections == [
+        {"text": "First record", "metadata": {"author": "ann", "year": 2020, "line": 1}},
+        {"text": "Second record", "metadata": {"author": "bob", "line": 3}}
+    ]
+    selected = list(iter_sections(path, {"jsonl": {"text_field": "body", "metadata_fields": ["year"]}}))
+    assert [section["metadata"] for section in selected] == [{"year": 2020, "line": 1}, {"line": 3}]
+
+def test_html_keeps_visible_text(tmp_path):
+    path = tmp_path / "page.html"
+    path.write_text("<html><head><style>p {}</style><script>var x;</script></head>"
+                    "<body><h1>Title</h1><p>First &amp; second.</p><div>Third</div></body></html>")
+    text = "".join(section["text"] for section in iter_sections(path))
+    assert [part.strip() for part in text.split("\n\n") if part.strip()] == ["Title", "First & second.", "Third"]
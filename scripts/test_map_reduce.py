@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for map-reduce summarization batching.
+"""
+
+import asyncio
+
+from map_reduce import SummaryError, map_reduce_summarize, number_sections, pack_batches, split_numbered, split_text
+
+def test_split_text_cuts_at_breaks():
+    text = "first paragraph here\n\nsecond paragraph follows here"
+    pieces = split_text(text, 30)
+    assert all(len(piece) <= 30 for piece in pieces)
+    assert " ".join(pieces).split() == text.split()
+    assert split_text("x" * 70, 30) == ["x" * 30, "x" * 30, "x" * 10]
+    assert split_text("short text", 30) == ["short text"]
+
+def test_pack_batches_respects_the_budget_and_order():
+    texts = ["a" * 40, "b" * 40, "c" * 40, "d" * 200]
+    batches = pack_batches(texts, budget_tokens=25, chars_per_token=4)
+    assert batches == [["a" * 40, "b" * 40], ["c" * 40], ["d" * 200]]
+
+def test_small_inputs_take_one_call():
+    calls = []
+
+    async def summarize(texts, level, final):
+        calls.append((len(texts), level, final))
+        return "summary"
+
+    summary, stats = asyncio.run(map_reduce_summarize(["short text", "another"], summarize, budget_tokens=100))
+    assert summary == "summary"
+    assert stats == {"map_batches": 1, "reduce_levels": 0}
+    assert calls == [(2, 0, True)]
+
+def test_large_inputs_are_mapped_then_reduced():
+    calls = []
+
+    async def summarize(texts, level, final):
+        calls.append((level, final))
+        return f"summary of {len(texts)}"
+
+    texts = ["word " * 100 for _ in range(8)]
+    summary, stats = asyncio.run(map_reduce_summarize(texts, summarize, budget_tokens=150))
+    assert stats["map_batches"] == 8 and stats["reduce_levels"] == 1
+    # Every map call runs before the single final merge
+    assert calls.count((0, False)) == 8 and calls[-1] == (1, True)
+    assert summary == "summary of 8"
+
+def test_every_summary_is_merged_after_max_levels():
+    merged = []
+
+    async def summarize(texts, level, final):
+        if final:
+            merged.extend(texts)
+            return "answer"
+        # Summaries as long as their input never shrink the batch count
+        return "x" * 400
+
+    texts = ["word " * 100 for _ in range(6)]
+    summary, stats = asyncio.run(map_reduce_summarize(texts, summarize, budget_tokens=150, max_levels=1))
+    assert summary == "answer" and stats["reduce_levels"] == 1
+    assert len(merged) == 6
+    assert sum(len(text) for text in merged) <= 600
+
+def test_a_failed_summary_cancels_the_others():
+    cancelled = []
+
+    async def summarize(texts, level, final):
+        if texts[0].startswith("bad"):
+            raise SummaryError("backend failed")
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(level)
+            raise
+        return "summary"
+
+    texts = ["bad " * 100] + ["word " * 100 for _ in range(3)]
+    try:
+        asyncio.run(map_reduce_summarize(texts, summarize, budget_tokens=150))
+    except SummaryError:
+        pass
+    else:
+        raise AssertionError("the failure was swallowed")
+    assert cancelled == [0, 0, 0]
+
+def test_numbered_responses_split_per_section():
+    prompt = number_sections(["first text", "second text"])
+    assert prompt == "[1] first text\n\n[2] second text"
+    assert split_numbered("Summaries:\n[1] one\ncontinued\n [2] two", 2) == ["one\ncontinued", "two"]
+    assert split_numbered("[1] one", 2) is None
+    assert split_numbered("[2] two\n[1] one", 2) is None
+    assert split_numbered("[1]\n[2] two", 2) is None
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Tests for the metrics registry and stage tracing.
+"""
+
+import metrics
+from metrics import Registry, stage, trace
+
+def test_render_uses_the_text_exposition_format():
+    registry = Registry()
+    requests = registry.counter('requests_total', 'Requests handled.', ('path',))
+    queued = registry.gauge('queued', 'Requests waiting.')
+    latency = registry.histogram('latency_seconds', 'Latency.', buckets=(0.1, 1.0))
+    requests.inc(path='/query')
+    requests.inc(2, path='/say "hi"')
+    queued.set(3)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    assert registry.render() == (
+        '# HELP requests_total Requests handled.\n'
+        '# TYPE requests_total counter\n'
+        'requests_total{path="/query"} 1\n'
+        'requests_total{path="/say \\"hi\\""} 2\n'
+        '# HELP queued Requests waiting.\n'
+        '# TYPE queued gauge\n'
+        'queued 3\n'
+        '# HELP latency_seconds Latency.\n'
+        '# TYPE latency_seconds histogram\n'
+        'latency_seconds_bucket{le="0.1"} 1\n'
+        'latency_seconds_bucket{le="1"} 2\n'
+        'latency_seconds_bucket{le="+Inf"} 2\n'
+        'latency_seconds_sum 0.55\n'
+        'latency_seconds_count 2\n'
+    )
+
+def test_labels_must_match_the_declared_names():
+    counter = Registry().counter('events_total', 'Events.', ('kind',))
+    for labels in ({}, {"kind": "a", "extra": "b"}, {"other": "a"}):
+        try:
+            counter.inc(**labels)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"labels {labels} were accepted")
+
+def test_duplicate_names_are_rejected():
+    registry = Registry()
+    registry.counter('events_total', 'Events.')
+    try:
+        registry.gauge('events_total', 'Events.')
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("a duplicate metric was registered")
+
+def test_gauge_callbacks_run_at_render_time():
+    registry = Registry()
+    depth = [1]
+    registry.gauge('depth', 'Queue depth.', function=lambda: depth[0])
+    depth[0] = 7
+    assert 'depth 7\n' in registry.render()
+
+def test_stages_are_recorded_in_the_active_trace():
+    with trace() as active:
+        with stage('test_stage'):
+            pass
+        with stage('test_stage'):
+            pass
+    with stage('test_stage'):
+        pass
+    timings = active.timings()
+    assert set(timings) == {'test_stage', 'total'}
+    counts = [value for name, labels, value in metrics.STAGE_SECONDS.samples()
+              if name.endswith('_count') and labels == {'stage': 'test_stage'}]
+    assert counts == [3]
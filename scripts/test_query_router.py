@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Tests for keyword and embedding query routing.
+"""
+
+import numpy as np
+
+from query_router import EmbeddingRouter, QueryRouter, Route, router_from_config
+
+class KeywordEmbedder:
+    """One dimension per known word, so similar wording gives similar vectors"""
+
+    WORDS = ["weather", "rain", "forecast", "recipe", "cook", "bake"]
+
+    def embed(self, text):
+        words = text.lower().split()
+        vector = np.array([float(word in words) for word in self.WORDS], dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed_batch(self, texts):
+        return np.stack([self.embed(text) for text in texts])
+
+def test_default_routes_pick_intent_and_topic():
+    router = router_from_config({})
+    match = router.route("Please find documents about neural networks")
+    assert (match.intent, match.handler, match.method) == ("search", "search", "keyword")
+    assert match.topic == "documents about neural networks"
+    match = router.route("Summarize: the history of databases?")
+    assert (match.intent, match.topic) == ("summarize", "the history of databases")
+
+def test_earlier_routes_win_and_keywords_match_whole_words():
+    router = router_from_config({})
+    assert router.route("summarize what you find on vectors").intent == "search"
+    assert router.route("the findings so far").intent == "general"
+    general = router.route("  what is AI?  ")
+    assert (general.intent, general.handler, general.topic) == ("general", "general", "what is AI")
+
+def test_routes_from_config_carry_their_system_prompt():
+    router = router_from_config({"routes": [
+        {"name": "code", "handler": "general", "keywords": ["write code"], "system_prompt": "You write code."}
+    ]})
+    match = router.route("write code for a parser")
+    assert (match.intent, match.handler, match.system_prompt, match.topic) == \
+        ("code", "general", "You write code.", "for a parser")
+
+def test_embedding_routing_for_queries_without_keywords():
+    routes = [
+        Route("weather", [], examples=["weather forecast", "will it rain"]),
+        Route("cooking", [], examples=["bake a cake recipe", "how to cook rice"])
+    ]
+    router = QueryRouter(routes, EmbeddingRouter(KeywordEmbedder(), routes, threshold=0.5))
+    match = router.route("rain forecast")
+    assert (match.intent, match.method) == ("weather", "embedding")
+    assert match.score >= 0.5
+    assert router.route("tell me a joke").intent == "general"
+
+class FlakyEmbedder(KeywordEmbedder):
+    """Fails the queries listed in failures with the given error"""
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def embed(self, text):
+        if text in self.failures:
+            raise self.failures[text]
+        return super().embed(text)
+
+def test_embedding_errors_fall_back_per_query():
+    routes = [Route("weather", [], examples=["weather forecast", "will it rain"])]
+    embedder = FlakyEmbedder({"rain today": RuntimeError("CUDA out of memory")})
+    router = QueryRouter(routes, EmbeddingRouter(embedder, routes))
+    assert router.route("rain today").intent == "general"
+    assert router.route("rain forecast").intent == "weather"
+
+def test_missing_embedding_packages_disable_embedding_routing():
+    routes = [Route("weather", [], examples=["weather forecast", "will it rain"])]
+    embedder = FlakyEmbedder({"rain today": ImportError("No module named 'sentence_transformers'")})
+    router = QueryRouter(routes, EmbeddingRouter(embedder, routes))
+    assert router.route("rain today").intent == "general"
+    assert router.embedding_router is None
+    assert router.route("rain forecast").intent == "general"
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Tests for the semantic answer cache and its corpus-version invalidation.
+"""
+
+import numpy as np
+
+from semantic_cache import NumpyCacheIndex, SemanticCache
+
+class WordEmbedder:
+    WORDS = ["what", "is", "machine", "learning", "deep", "explain", "databases"]
+
+    def embed(self, text):
+        words = text.lower().replace("?", "").split()
+        vector = np.array([float(word in words) for word in self.WORDS], dtype=np.float32)
+        return vector / max(np.linalg.norm(vector), 1e-12)
+
+def make_cache(version, threshold=0.8):
+    return SemanticCache(WordEmbedder(), NumpyCacheIndex(max_entries=4), threshold=threshold,
+                         corpus_version=lambda: version[0], check_interval=0)
+
+def answer(text):
+    return {"type": "general", "query": "q", "response": text, "metadata": {}}
+
+def test_similar_queries_hit():
+    cache = make_cache(["v1"])
+    cache.put("what is machine learning", "general", answer("ML is ..."))
+    hit = cache.get("what is machine learning?", "general")
+    assert hit["response"] == "ML is ..."
+    assert hit["query"] == "what is machine learning?"
+    assert hit["metadata"]["cache_hit"] and hit["metadata"]["cached_query"] == "what is machine learning"
+    assert cache.get("explain databases", "general") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+def test_other_intents_do_not_hit():
+    cache = make_cache(["v1"])
+    cache.put("what is machine learning", "general", answer("ML is ..."))
+    assert cache.get("what is machine learning", "search") is None
+
+def test_new_corpus_version_invalidates_entries():
+    version = ["v1"]
+    cache = make_cache(version)
+    cache.put("what is machine learning", "general", answer("ML is ..."))
+    version[0] = "v2"
+    assert cache.get("what is machine learning", "general") is None
+    assert len(cache.index) == 0
+    cache.put("what is machine learning", "general", answer("ML, re-ingested"))
+    assert cache.get("what is machine learning", "general")["response"] == "ML, re-ingested"
+
+def test_cached_results_are_copies():
+    cache = make_cache(["v1"])
+    result = answer("ML is ...")
+    cache.put("what is machine learning", "general", result)
+    result["response"] = "changed"
+    cache.get("what is machine learning", "general")["metadata"]["extra"] = True
+    hit = cache.get("what is machine learning", "general")
+    assert hit["response"] == "ML is ..." and "extra" not in hit["metadata"]
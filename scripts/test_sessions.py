@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Tests for conversation sessions: history, context reuse and compaction.
+"""
+
+import time
+
+from sessions import SessionStore, Session, apply_compaction, summary_prompt, turns_to_fold
+
+def add_turn(session, query, response, context=None, model="model"):
+    session.prepare(query, model)
+    if context is not None:
+        session.set_pending_context(context, model)
+    session.record(query, response)
+
+def test_context_tokens_are_reused_for_the_same_model():
+    session = Session("s")
+    assert session.prepare("hello", "model") == ("hello", None)
+    add_turn(session, "hello", "hi", context=[1, 2, 3])
+    assert session.prepare("next", "model") == ("next", [1, 2, 3])
+    # Another model can't read the context, so it gets the history as text
+    prompt, context = session.prepare("next", "other")
+    assert context is None
+    assert "User: hello\nAssistant: hi" in prompt and prompt.endswith("next")
+
+def test_turns_without_kept_context_fall_back_to_text():
+    session = Session("s")
+    add_turn(session, "hello", "hi", context=[1, 2, 3])
+    # e.g. an answer from retrieved passages, whose context isn't kept
+    add_turn(session, "find docs", "found them")
+    prompt, context = session.prepare("next", "model")
+    assert context is None
+    assert "User: find docs\nAssistant: found them" in prompt
+
+def test_compaction_folds_old_turns_into_the_summary():
+    session = Session("s")
+    for i in range(5):
+        add_turn(session, f"question {i} " * 20, f"answer {i} " * 20, context=list(range(100 * (i + 1))))
+    assert session.needs_compaction(max_context_tokens=300)
+
+    folded = turns_to_fold(session, keep_turns=2)
+    assert len(folded) == 3
+    assert "question 0" in summary_prompt("", folded)
+    apply_compaction(session, folded, "They asked about questions 0 to 2.")
+
+    assert [turn.query.split()[1] for turn in session.turns] == ["3", "4"]
+    assert session.compactions == 1
+    assert not session.needs_compaction(max_context_tokens=300)
+    # The next turn starts again from the summary and kept turns as text
+    prompt, context = session.prepare("next", "model")
+    assert context is None
+    assert prompt.startswith("Conversation so far:\nSummary of the earlier conversation: They asked")
+
+def test_turns_to_fold_keeps_the_latest_turn():
+    session = Session("s")
+    add_turn(session, "only", "turn")
+    assert turns_to_fold(session, keep_turns=0) == session.turns
+    add_turn(session, "second", "turn")
+    assert [turn.query for turn in turns_to_fold(session, keep_turns=5)] == ["only"]
+
+def test_store_evicts_and_expires():
+    store = SessionStore(max_sessions=2, idle_timeout=0.05)
+    first, second = store.create(), store.create()
+    assert store.get(first.id) is first
+    store.create()
+    assert list(store.sessions)[0] == first.id and second.id not in store.sessions
+    time.sleep(0.06)
+    assert store.get(first.id) is None
+    assert len(store) == 0
+    assert store.stats()["evicted"] == 1 and store.stats()["expired"] == 2
+
+def test_store_only_knows_ids_it_issued():
+    store = SessionStore()
+    session = store.create()
+    assert len(session.id) >= 20 and session.id != store.create().id
+    assert store.get("chosen-by-client") is None
+    assert "chosen-by-client" not in store.sessions
+    assert store.stats()["created"] == 2
@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Tests for single-flight coalescing of identical calls.
+"""
+
+import threading
+
+from single_flight import SingleFlight
+
+def test_concurrent_calls_share_one_run():
+    """Callers arriving while a call runs get its result and fragments"""
+    flights = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def generate(emit, cancel):
+        calls.append(1)
+        emit("Hello")
+        started.set()
+        release.wait(5)
+        emit(" world")
+        return "Hello world"
+
+    results = {}
+    tokens = {name: [] for name in ("leader", "follower")}
+
+    def call(name):
+        results[name] = flights.run("key", generate, on_token=tokens[name].append)
+
+    leader = threading.Thread(target=call, args=("leader",))
+    leader.start()
+    assert started.wait(5)
+    follower = threading.Thread(target=call, args=("follower",))
+    follower.start()
+    while not flights.coalesced:
+        pass
+    release.set()
+    leader.join(5)
+    follower.join(5)
+
+    assert len(calls) == 1
+    assert results == {"leader": ("Hello world", False), "follower": ("Hello world", True)}
+    # The follower joined midway and still gets every fragment, in order
+    assert tokens["follower"] == ["Hello", " world"]
+    assert flights.stats()["coalesced_calls"] == 1
+    assert flights.stats()["in_flight"] == 0
+
+def test_sequential_calls_run_separately():
+    flights = SingleFlight()
+    assert flights.run("key", lambda emit, cancel: "first") == ("first", False)
+    assert flights.run("key", lambda emit, cancel: "second") == ("second", False)
+    assert flights.stats()["upstream_calls"] == 2
+
+def test_errors_reach_every_caller():
+    flights = SingleFlight()
+
+    def fail(emit, cancel):
+        raise RuntimeError("backend down")
+
+    try:
+        flights.run("key", fail)
+    except RuntimeError as e:
+        assert str(e) == "backend down"
+    else:
+        raise AssertionError("the error was swallowed")
+    assert flights.stats()["in_flight"] == 0
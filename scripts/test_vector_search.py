@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+"""
+Tests for query embedding with a stand-in sentence-transformers model.
+"""
+
+import sys
+import time
+import types
+
+import numpy as np
+
+from vector_search import ModelUnavailable, QueryEmbedder
+
+class FakeModel:
+    def encode(self, texts, show_progress_bar=False):
+        if isinstance(texts, str):
+            return np.array([len(texts), 1.0], dtype=np.float32)
+        return np.array([[len(text), 1.0] for text in texts], dtype=np.float32)
+
+def install_model(monkeypatch, failures):
+    """A sentence_transformers module whose model fails to load failures times"""
+    loads = []
+
+    def load(model_name):
+        loads.append(model_name)
+        if len(loads) <= failures:
+            raise OSError("model download failed")
+        return FakeModel()
+
+    monkeypatch.setitem(sys.modules, 'sentence_transformers', types.SimpleNamespace(SentenceTransformer=load))
+    return loads
+
+def expect_error(call, error_type):
+    try:
+        call()
+    except error_type:
+        pass
+    else:
+        raise AssertionError(f"{error_type.__name__} was not raised")
+
+def test_embeddings_are_unit_length_and_cached(monkeypatch):
+    loads = install_model(monkeypatch, failures=0)
+    embedder = QueryEmbedder("model", cache_size=2)
+    single = embedder.embed("abc")
+    assert np.isclose(np.linalg.norm(single), 1.0)
+    batch = embedder.embed_batch(["abc", "de"])
+    assert np.allclose(batch[0], single) and batch.shape == (2, 2)
+    assert loads == ["model"]
+
+def test_failed_loads_are_retried_after_a_backoff(monkeypatch):
+    loads = install_model(monkeypatch, failures=2)
+    embedder = QueryEmbedder("model", retry_seconds=0.05, max_retry_seconds=0.1)
+    expect_error(lambda: embedder.embed("query"), OSError)
+    # Within the backoff, queries fail without another load
+    expect_error(lambda: embedder.embed("query"), ModelUnavailable)
+    assert len(loads) == 1
+
+    time.sleep(0.06)
+    expect_error(lambda: embedder.embed("query"), OSError)
+    # The backoff doubled
+    time.sleep(0.06)
+    expect_error(lambda: embedder.embed("query"), ModelUnavailable)
+    time.sleep(0.05)
+    assert embedder.embed("query").shape == (2,)
+    assert len(loads) == 3
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Tests for the compact vector store: int8 and product-quantized recall.
+"""
+
+import numpy as np
+
+from vector_store import VectorStore, dequantize_int8, normalize, quantize_int8
+
+def clustered_vectors(count=2000, dimension=64, clusters=50, seed=0):
+    """Vectors around cluster centres, like embeddings of related texts"""
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(clusters, dimension))
+    vectors = centres[rng.integers(clusters, size=count)] + 0.5 * rng.normal(size=(count, dimension))
+    queries = vectors[rng.choice(count, 50, replace=False)] + 0.1 * rng.normal(size=(50, dimension))
+    return normalize(vectors.astype(np.float32)), normalize(queries.astype(np.float32))
+
+def recall(store, exact, queries, k):
+    hits = 0
+    for (found, _), (expected, _) in zip(store.search(queries, k), exact.search(queries, k)):
+        hits += len(set(found.tolist()) & set(expected.tolist()))
+    return hits / (k * len(queries))
+
+def test_int8_round_trip():
+    vectors, _ = clustered_vectors(count=100)
+    codes, scales = quantize_int8(vectors)
+    assert codes.dtype == np.int8
+    assert np.abs(dequantize_int8(codes, scales) - vectors).max() < 0.01
+
+def test_int8_recall():
+    vectors, queries = clustered_vectors()
+    exact = VectorStore.from_vectors(vectors)
+    assert recall(VectorStore.from_vectors(vectors, dtype="int8"), exact, queries, 10) >= 0.95
+
+def test_product_quantized_recall():
+    vectors, queries = clustered_vectors()
+    exact = VectorStore.from_vectors(vectors)
+    store = VectorStore.from_vectors(vectors, dtype="int8", pq_subspaces=16, rerank=10)
+    assert store.codes.shape == (16, len(vectors))
+    assert recall(store, exact, queries, 10) >= 0.9
+
+def test_save_and_load(tmp_path):
+    vectors, queries = clustered_vectors(count=500)
+    store = VectorStore.from_vectors(vectors, dtype="int8", pq_subspaces=8)
+    meta = store.save(str(tmp_path))
+    loaded = VectorStore.load(str(tmp_path), meta)
+    assert loaded.dtype == "int8" and len(loaded) == 500
+    for (found, scores), (expected, expected_scores) in zip(loaded.search(queries, 5), store.search(queries, 5)):
+        assert found.tolist() == expected.tolist()
+        assert np.allclose(scores, expected_scores)
+
+def test_search_returns_best_first():
+    vectors, queries = clustered_vectors(count=300)
+    for indices, scores in VectorStore.from_vectors(vectors).search(queries, 5):
+        assert len(indices) == 5
+        assert np.all(np.diff(scores) <= 0)
@@ -0,0 +1,459 @@
+#!/usr/bin/env python3
+"""
+Vector retrieval for the query server.
+
+Queries are embedded with the same SentenceTransformer model used at
+ingestion time. The model is loaded once and kept in memory, and query
+embeddings are cached in an LRU. If loading fails, it is retried after a
+backoff that doubles with each failure; until then queries fail at once. Search goes to the Qdrant collection
+filled by ingest_documents.py through a pooled HTTP session. A brute-force
+NumPy index loaded from a local snapshot can stand in when no Qdrant
+service is available.
+
+A snapshot is a directory holding:
+    meta.json       {"dimension": d, "count": n, "dtype": "float32" or "int8",
+                     "pq_subspaces": m (optional),
+                     "corpus_version": id changed by every write}
+    payloads.jsonl  one JSON payload per vector, in the same order
+plus the vector files of a VectorStore (see vector_store.py): n x d unit
+vectors as float32 or int8 with row scales, and optional product
+quantization codes. The snapshot is searched through memory maps.
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from itertools import islice
+from pathlib import Path
+from typing import Dict, List, Any, Iterator, Optional, Tuple
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    from .vector_store import VectorStore, normalize, quantize_int8
+except ImportError:
+    # Imported as a top-level module by the command-line scripts
+    from vector_store import VectorStore, normalize, quantize_int8
+
+class ModelUnavailable(RuntimeError):
+    """The embedding model failed to load and the next attempt isn't due yet"""
+
+class QueryEmbedder:
+    """
+    Loads the embedding model on first use and caches query embeddings.
+    After a failed load, the model raises ModelUnavailable for retry_seconds,
+    doubling up to max_retry_seconds while loads keep failing.
+    """
+
+    def __init__(self, model_name: str, cache_size: int = 1024,
+                 retry_seconds: float = 30.0, max_retry_seconds: float = 600.0):
+        self.model_name = model_name
+        self.cache_size = cache_size
+        self.retry_seconds = retry_seconds
+        self.max_retry_seconds = max_retry_seconds
+        self._model = None
+        self._model_lock = threading.Lock()
+        self._load_error = None
+        self._retry_at = 0.0
+        self._backoff = retry_seconds
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    now = time.monotonic()
+                    if now < self._retry_at:
+                        raise ModelUnavailable(f"Embedding model {self.model_name} failed to load, retrying in "
+                                               f"{self._retry_at - now:.0f}s: {self._load_error}") from self._load_error
+                    try:
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name)
+                    except Exception as e:
+                        self._load_error = e
+                        self._retry_at = now + self._backoff
+                        self._backoff = min(self._backoff * 2, self.max_retry_seconds)
+                        raise
+        return self._model
+
+    def embed(self, text: str) -> np.ndarray:
+        """Return the unit-length float32 embedding for text."""
+        with self._cache_lock:
+            cached = self._cache.get(text)
+            if cached is not None:
+                self._cache.move_to_end(text)
+                return cached
+
+        embedding = normalize(self.model.encode(text, show_progress_bar=False))
+
+        self._store(text, embedding)
+        return embedding
+
+    def embed_batch(self, texts: List[str]) -> np.ndarray:
+        """Embed many texts, encoding all cache misses in a single model call."""
+        embeddings = [None] * len(texts)
+        with self._cache_lock:
+            for i, text in enumerate(texts):
+                cached = self._cache.get(text)
+                if cached is not None:
+                    self._cache.move_to_end(text)
+                    embeddings[i] = cached
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            encoded = normalize(self.model.encode([texts[i] for i in missing], show_progress_bar=False))
+            for i, embedding in zip(missing, encoded):
+                embeddings[i] = embedding
+                self._store(texts[i], embedding)
+        return np.stack(embeddings)
+
+    def _store(self, text: str, embedding: np.ndarray):
+        with self._cache_lock:
+            self._cache[text] = embedding
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+def payload_to_result(point_id: Any, score: float, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a stored chunk payload into the search result shape used by the server."""
+    return {
+        "id": str(point_id),
+        "title": payload.get("title") or payload.get("filename") or str(point_id),
+        "content": payload.get("text", payload.get("content", "")),
+        "source": payload.get("source"),
+        "score": score,
+        "relevance": score
+    }
+
+class QdrantSearch:
+    """Searches a Qdrant collection over its REST API with a pooled session."""
+
+    def __init__(self, url: str, collection_name: str, timeout: float = 5.0, pool_size: int = 8,
+                 search_params: Optional[Dict[str, Any]] = None):
+        self.search_url = f"{url.rstrip('/')}/collections/{collection_name}/points/search"
+        self.batch_search_url = f"{self.search_url}/batch"
+        self.timeout = timeout
+        # Sent as "params", e.g. how quantized vectors are rescored
+        self.search_params = search_params
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def _request(self, vector: np.ndarray, top_k: int, score_threshold: Optional[float]) -> Dict[str, Any]:
+        body = {
+            "vector": vector.tolist(),
+            "limit": top_k,
+            "with_payload": True
+        }
+        if score_threshold is not None:
+            body["score_threshold"] = score_threshold
+        if self.search_params:
+            body["params"] = self.search_params
+        return body
+
+    @staticmethod
+    def _results(points: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        return [payload_to_result(point["id"], point["score"], point.get("payload") or {}) for point in points]
+
+    def search(self, vector: np.ndarray, top_k: int,
+               score_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        body = self._request(vector, top_k, score_threshold)
+        response = self.session.post(self.search_url, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return self._results(response.json()["result"])
+
+    def search_batch(self, vectors: np.ndarray, top_k: int,
+                     score_threshold: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """Run one search per vector in a single batch request."""
+        body = {"searches": [self._request(vector, top_k, score_threshold) for vector in vectors]}
+        response = self.session.post(self.batch_search_url, json=body, timeout=self.timeout)
+        response.raise_for_status()
+        return [self._results(points) for points in response.json()["result"]]
+
+class NumpyIndex:
+    """Brute-force cosine search over vectors loaded from a local snapshot."""
+
+    def __init__(self, vectors, payloads: List[Dict[str, Any]]):
+        # A VectorStore, or an array of vectors to store as float32
+        self.store = vectors if isinstance(vectors, VectorStore) else VectorStore.from_vectors(vectors)
+        self.payloads = payloads
+
+    @classmethod
+    def load(cls, snapshot_path: str, rerank: int = 10, attempts: int = 3) -> 'NumpyIndex':
+        """
+        Load a snapshot. A snapshot replaced while it is being read is read
+        again, up to attempts times, so its files are never mixed with the
+        files of the snapshot that replaced it.
+        """
+        path = Path(snapshot_path)
+        for attempt in range(1, attempts + 1):
+            try:
+                with open(path / 'meta.json', 'r') as f:
+                    meta = json.load(f)
+                store = VectorStore.load(path, meta, rerank=rerank)
+                with open(path / 'payloads.jsonl', 'r', encoding='utf-8') as f:
+                    payloads = [json.loads(line) for line in f if line.strip()]
+                with open(path / 'meta.json', 'r') as f:
+                    if json.load(f) == meta or attempt == attempts:
+                        return cls(store, payloads)
+            except (OSError, ValueError):
+                if attempt == attempts:
+                    raise
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    def search(self, vector: np.ndarray, top_k: int,
+               score_threshold: Optional[float] = None) -> List[Dict[str, Any]]:
+        return self.search_batch(np.atleast_2d(vector), top_k, score_threshold)[0]
+
+    def search_batch(self, vectors: np.ndarray, top_k: int,
+                     score_threshold: Optional[float] = None) -> List[List[Dict[str, Any]]]:
+        """Score every query against the index with blocked matrix products."""
+        if not len(self):
+            return [[] for _ in vectors]
+        return [self._results(indices, scores, score_threshold)
+                for indices, scores in self.store.search(vectors, top_k)]
+
+    def _results(self, indices: np.ndarray, scores: np.ndarray,
+                 score_threshold: Optional[float]) -> List[Dict[str, Any]]:
+        results = []
+        for position, score in zip(indices.tolist(), scores.tolist()):
+            if score_threshold is not None and score < score_threshold:
+                break
+            payload = self.payloads[position]
+            results.append(payload_to_result(payload.get("id", position), score, payload))
+        return results
+
+class VectorSearch:
+    """
+    Embeds queries and searches Qdrant, falling back to the local snapshot
+    index when Qdrant is not configured or the request fails.
+    """
+
+    def __init__(self, embedder: QueryEmbedder, qdrant: Optional[QdrantSearch] = None,
+                 snapshot_path: Optional[str] = None, score_threshold: Optional[float] = None,
+                 rerank: int = 10):
+        self.embedder = embedder
+        self.qdrant = qdrant
+        self.snapshot_path = snapshot_path
+        self.score_threshold = score_threshold
+        # Rerank candidates per result for product-quantized snapshots
+        self.rerank = rerank
+        self._local_index = None
+        # Identifies the meta.json the local index was loaded from
+        self._local_stamp = None
+        self._local_lock = threading.Lock()
+
+    @property
+    def local_index(self) -> Optional[NumpyIndex]:
+        """The snapshot index, reloaded whenever the snapshot is rewritten"""
+        if not self.snapshot_path:
+            return None
+        try:
+            stat = os.stat(Path(self.snapshot_path, 'meta.json'))
+        except OSError:
+            # No snapshot, or one being swapped in; keep what is loaded
+            return self._local_index
+        stamp = (stat.st_ino, stat.st_mtime_ns)
+        if stamp != self._local_stamp:
+            with self._local_lock:
+                if stamp != self._local_stamp:
+                    try:
+                        self._local_index = NumpyIndex.load(self.snapshot_path, rerank=self.rerank)
+                    except Exception as e:
+                        if self._local_index is None:
+                            raise
+                        print(f"Snapshot reload failed, keeping the loaded one: {e}")
+                    self._local_stamp = stamp
+        return self._local_index
+
+    def search(self, query: str, top_k: int) -> List[Dict[str, Any]]:
+        vector = self.embedder.embed(query)
+        if self.qdrant is not None:
+            try:
+                return self.qdrant.search(vector, top_k, self.score_threshold)
+            except Exception as e:
+                if self.local_index is None:
+                    raise
+                print(f"Qdrant search failed, using local snapshot: {e}")
+        if self.local_index is None:
+            raise RuntimeError("No vector index available: Qdrant is not configured and no snapshot was found")
+        return self.local_index.search(vector, top_k, self.score_threshold)
+
+    def search_batch(self, queries: List[str], top_k: int) -> List[List[Dict[str, Any]]]:
+        """Search many queries with one embedding call and one batched index search."""
+        if not queries:
+            return []
+        vectors = self.embedder.embed_batch(queries)
+        if self.qdrant is not None:
+            try:
+                return self.qdrant.search_batch(vectors, top_k, self.score_threshold)
+            except Exception as e:
+                if self.local_index is None:
+                    raise
+                print(f"Qdrant search failed, using local snapshot: {e}")
+        if self.local_index is None:
+            raise RuntimeError("No vector index available: Qdrant is not configured and no snapshot was found")
+        return self.local_index.search_batch(vectors, top_k, self.score_threshold)
+
+class SnapshotWriter:
+    """
+    Appends vectors and payloads to a snapshot batch by batch, so a snapshot
+    of any size can be written with memory bounded by one batch.
+    Rows are written to a temporary sibling directory that replaces the
+    existing snapshot only on a successful close, so the old snapshot stays
+    readable meanwhile and a half-written one is never loaded. The old
+    snapshot is renamed aside before the new one is renamed into place and
+    only deleted afterwards, and a writer restores it if a previous one
+    died between the two renames.
+    dtype "int8" stores vectors quantized, and pq_subspaces > 0 adds
+    product quantization codes, trained when the snapshot is closed.
+    """
+
+    def __init__(self, snapshot_path: str, dtype: str = "float32", pq_subspaces: int = 0):
+        if dtype not in ("float32", "int8"):
+            raise ValueError(f"Unsupported snapshot dtype {dtype}")
+        self.path = Path(snapshot_path)
+        self.temp_path = self.path.with_name(self.path.name + '.tmp')
+        self.old_path = self.path.with_name(self.path.name + '.old')
+        if self.old_path.exists():
+            if self.path.exists():
+                shutil.rmtree(self.old_path)
+            else:
+                os.replace(self.old_path, self.path)
+        if self.temp_path.exists():
+            shutil.rmtree(self.temp_path)
+        self.temp_path.mkdir(parents=True)
+        self.dtype = dtype
+        self.pq_subspaces = pq_subspaces
+        self.dimension = None
+        self.count = 0
+        self._vectors = open(self.temp_path / 'vectors.bin', 'wb')
+        self._scales = open(self.temp_path / 'scales.bin', 'wb') if dtype == "int8" else None
+        self._payloads = open(self.temp_path / 'payloads.jsonl', 'w', encoding='utf-8')
+
+    def append(self, vectors: np.ndarray, payloads: List[Dict[str, Any]]):
+        vectors = normalize(vectors)
+        if self.dimension is None:
+            self.dimension = int(vectors.shape[1])
+        if self._scales is not None:
+            codes, scales = quantize_int8(vectors)
+            codes.tofile(self._vectors)
+            scales.tofile(self._scales)
+        else:
+            vectors.tofile(self._vectors)
+        for payload in payloads:
+            self._payloads.write(json.dumps(payload) + '\n')
+        self.count += len(payloads)
+
+    def close(self, commit: bool = True):
+        """Close the files and, if commit is True, replace the old snapshot."""
+        self._vectors.close()
+        if self._scales is not None:
+            self._scales.close()
+        self._payloads.close()
+        if not commit:
+            shutil.rmtree(self.temp_path, ignore_errors=True)
+            return
+        meta = {"dimension": self.dimension or 0, "count": self.count, "dtype": self.dtype}
+        if self.pq_subspaces and self.count:
+            store = VectorStore.load(self.temp_path, meta)
+            store.add_product_quantizer(self.pq_subspaces)
+            meta.update(store.save_product_quantizer(self.temp_path))
+        meta["corpus_version"] = uuid.uuid4().hex
+        with open(self.temp_path / 'meta.json', 'w') as f:
+            json.dump(meta, f)
+        if self.path.exists():
+            os.replace(self.path, self.old_path)
+        os.replace(self.temp_path, self.path)
+        shutil.rmtree(self.old_path, ignore_errors=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close(commit=exc_type is None)
+
+def iter_snapshot(snapshot_path: str, batch_size: int = 1024) -> Iterator[Tuple[np.ndarray, List[Dict[str, Any]]]]:
+    """
+    Yield (float32 vectors, payloads) batches from an existing snapshot,
+    reading vectors through a memory map so the whole file is never loaded.
+    Yields nothing if there is no committed snapshot at the path.
+    """
+    path = Path(snapshot_path)
+    if not (path / 'meta.json').exists():
+        return
+    with open(path / 'meta.json', 'r') as f:
+        meta = json.load(f)
+    if not meta['count']:
+        return
+    store = VectorStore.load(path, meta)
+    with open(path / 'payloads.jsonl', 'r', encoding='utf-8') as f:
+        start = 0
+        while start < meta['count']:
+            payloads = [json.loads(line) for line in islice(f, batch_size)]
+            yield store.rows(np.arange(start, start + len(payloads))), payloads
+            start += len(payloads)
+
+def snapshot_documents(snapshot_path: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Every chunk of a snapshot as a search result ("id", "title", "content",
+    "source"), with the ids vector search returns, or None if there is no
+    snapshot.
+    """
+    path = Path(snapshot_path, 'payloads.jsonl')
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            payloads = [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return None
+    return [payload_to_result(payload.get("id", position), 0.0, payload)
+            for position, payload in enumerate(payloads)]
+
+def snapshot_version(snapshot_path: str) -> Optional[str]:
+    """
+    Version of the snapshot's corpus, which changes whenever it is
+    rewritten, or None if there is no snapshot. Snapshots written before
+    versions were recorded are identified by their modification time.
+    """
+    meta_path = Path(snapshot_path, 'meta.json')
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        return meta.get('corpus_version') or str(meta_path.stat().st_mtime_ns)
+    except (OSError, ValueError):
+        return None
+
+def write_snapshot(snapshot_path: str, vectors: np.ndarray, payloads: List[Dict[str, Any]],
+                   dtype: str = "float32", pq_subspaces: int = 0):
+    """Write vectors and their payloads in the snapshot format NumpyIndex.load reads."""
+    with SnapshotWriter(snapshot_path, dtype, pq_subspaces) as writer:
+        writer.append(vectors, payloads)
+
+def vector_search_from_config(vectordb_config: Dict[str, Any], search_config: Dict[str, Any]) -> VectorSearch:
+    """Build a VectorSearch from the "vectordb" and "search" config sections."""
+    embedder = QueryEmbedder(
+        vectordb_config['embedding_model'],
+        cache_size=vectordb_config.get('embedding_cache_size', 1024),
+        retry_seconds=vectordb_config.get('embedding_retry_seconds', 30.0)
+    )
+    url = vectordb_config.get('url', vectordb_config.get('host'))
+    qdrant = None
+    if url:
+        qdrant = QdrantSearch(url, vectordb_config['collection_name'], timeout=vectordb_config.get('timeout', 5.0),
+                              search_params=vectordb_config.get('search_params'))
+    return VectorSearch(
+        embedder,
+        qdrant=qdrant,
+        snapshot_path=vectordb_config.get('snapshot_path'),
+        score_threshold=search_config.get('score_threshold'),
+        rerank=vectordb_config.get('pq_rerank', 10)
+    )
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+"""
+Compact vector storage for the local retrieval path.
+
+VectorStore holds unit vectors in one contiguous array, either float32 or
+int8 with a float32 scale per row (a quarter of the memory, with scores
+within about 1% of the exact ones). Scores are computed with matrix
+products over blocks of rows and the top k picked with argpartition, so
+searching never sorts the whole corpus. For large corpora a product
+quantizer can be added: each vector is then also stored as one byte per
+subspace, candidates are scored from those codes with per-query lookup
+tables, and only the best candidates are rescored with their full vectors.
+
+Stores are saved as flat files and loaded as memory maps, so only the
+pages a search touches are read and processes share them through the
+page cache:
+    vectors.bin       n x d float32, or n x d int8
+    scales.bin        n float32 row scales (int8 only)
+    pq_codebooks.npy  m x k x d/m float32 centroids (product quantizer only)
+    pq_codes.bin      m x n uint8 codes, by subspace (product quantizer only)
+"""
+
+from pathlib import Path
+from typing import Dict, List, Any, Optional, Tuple
+
+import numpy as np
+
+DTYPES = ("float32", "int8")
+
+# Rows scored per matrix product, bounding temporary memory
+BLOCK_ROWS = 65536
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length so dot products are cosine similarities."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+def quantize_int8(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Symmetric int8 codes and the float32 scale of each row, code * scale ~ value."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.maximum(np.abs(vectors).max(axis=-1), 1e-12) / 127.0
+    codes = np.rint(vectors / scales[..., None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+def dequantize_int8(codes: np.ndarray, scales: np.ndarray) -> np.ndarray:
+    return codes.astype(np.float32) * scales[..., None]
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best])]
+
+class ProductQuantizer:
+    """
+    Splits vectors into subspaces and replaces each part by the nearest of
+    up to 256 centroids learned with k-means, so a vector is stored as one
+    byte per subspace.
+    """
+
+    def __init__(self, codebooks: np.ndarray):
+        # subspaces x centroids x subspace dimension
+        self.codebooks = np.asarray(codebooks, dtype=np.float32)
+
+    @property
+    def subspaces(self) -> int:
+        return self.codebooks.shape[0]
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, subspaces: int, centroids: int = 256, iterations: int = 20,
+              sample_size: int = 10000, seed: int = 0) -> 'ProductQuantizer':
+        """Learn the codebooks with k-means on up to sample_size of the vectors."""
+        dimension = vectors.shape[1]
+        if dimension % subspaces:
+            raise ValueError(f"Dimension {dimension} is not divisible into {subspaces} subspaces")
+        if not 1 <= centroids <= 256:
+            raise ValueError("Codes are one byte, so at most 256 centroids per subspace")
+        rng = np.random.default_rng(seed)
+        if len(vectors) > sample_size:
+            vectors = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        centroids = min(centroids, len(vectors))
+        width = dimension // subspaces
+
+        codebooks = np.empty((subspaces, centroids, width), dtype=np.float32)
+        for j in range(subspaces):
+            part = vectors[:, j * width:(j + 1) * width]
+            codebook = part[rng.choice(len(part), centroids, replace=False)].copy()
+            for _ in range(iterations):
+                assignment = cls._nearest(part, codebook)
+                counts = np.bincount(assignment, minlength=centroids)
+                sums = np.stack([np.bincount(assignment, weights=part[:, w], minlength=centroids)
+                                 for w in range(width)], axis=1)
+                filled = counts > 0
+                codebook[filled] = sums[filled] / counts[filled, None]
+                # Re-seed empty clusters with random points
+                empty = np.flatnonzero(~filled)
+                if len(empty):
+                    codebook[empty] = part[rng.choice(len(part), len(empty))]
+            codebooks[j] = codebook
+        return cls(codebooks)
+
+    @staticmethod
+    def _nearest(part: np.ndarray, codebook: np.ndarray) -> np.ndarray:
+        # |x - c|^2 without the |x|^2 term, which doesn't change the argmin
+        distances = (codebook * codebook).sum(axis=1) - 2.0 * part @ codebook.T
+        return distances.argmin(axis=1)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """subspaces x n codes, one row per subspace so scoring reads them contiguously"""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        width = self.codebooks.shape[2]
+        codes = np.empty((self.subspaces, len(vectors)), dtype=np.uint8)
+        for j, codebook in enumerate(self.codebooks):
+            codes[j] = self._nearest(vectors[:, j * width:(j + 1) * width], codebook)
+        return codes
+
+    def lookup_tables(self, queries: np.ndarray) -> np.ndarray:
+        """queries x subspaces x centroids dot products of the query parts with the centroids"""
+        parts = np.asarray(queries, dtype=np.float32).reshape(len(queries), self.subspaces, -1)
+        return np.einsum('jkw,qjw->qjk', self.codebooks, parts)
+
+    def scores(self, codes: np.ndarray, tables: np.ndarray) -> np.ndarray:
+        """Approximate queries x n dot products of the encoded vectors with the tables' queries"""
+        # Centroid-major tables make each lookup gather one contiguous row of query scores
+        tables = np.ascontiguousarray(np.transpose(tables, (1, 2, 0)))
+        scores = np.zeros((codes.shape[1], tables.shape[2]), dtype=np.float32)
+        for j in range(self.subspaces):
+            scores += tables[j][codes[j]]
+        return scores.T
+
+class VectorStore:
+    """
+    Unit vectors, float32 or int8 with row scales, with optional product
+    quantization codes used to preselect rerank candidates.
+    """
+
+    def __init__(self, vectors: np.ndarray, scales: Optional[np.ndarray] = None,
+                 quantizer: Optional[ProductQuantizer] = None, codes: Optional[np.ndarray] = None,
+                 rerank: int = 10):
+        self.vectors = vectors
+        self.scales = scales
+        self.quantizer = quantizer
+        self.codes = codes
+        # Candidates per result rescored exactly when searching by codes
+        self.rerank = rerank
+
+    @property
+    def dtype(self) -> str:
+        return "int8" if self.scales is not None else "float32"
+
+    @property
+    def dimension(self) -> int:
+        return self.vectors.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @classmethod
+    def from_vectors(cls, vectors: np.ndarray, dtype: str = "float32",
+                     pq_subspaces: int = 0, rerank: int = 10) -> 'VectorStore':
+        """Normalize and store vectors, quantized to dtype and optionally with PQ codes."""
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype}, expected one of {DTYPES}")
+        vectors = normalize(vectors)
+        store = cls(*quantize_int8(vectors)) if dtype == "int8" else cls(vectors)
+        store.rerank = rerank
+        if pq_subspaces and len(vectors):
+            store.add_product_quantizer(pq_subspaces)
+        return store
+
+    def add_product_quantizer(self, subspaces: int, **train_options):
+        """Train a product quantizer on the stored vectors and encode them all."""
+        sample = np.linspace(0, len(self) - 1, min(len(self), train_options.pop('sample_size', 10000))).astype(np.int64)
+        self.quantizer = ProductQuantizer.train(self.rows(sample), subspaces, **train_options)
+        self.codes = np.concatenate([self.quantizer.encode(self.rows(np.arange(start, min(start + BLOCK_ROWS, len(self)))))
+                                     for start in range(0, len(self), BLOCK_ROWS)], axis=1)
+
+    def rows(self, indices: np.ndarray) -> np.ndarray:
+        """float32 vectors at indices"""
+        if self.scales is None:
+            return np.asarray(self.vectors[indices], dtype=np.float32)
+        return dequantize_int8(np.asarray(self.vectors[indices]), np.asarray(self.scales[indices]))
+
+    def scores(self, queries: np.ndarray) -> np.ndarray:
+        """Exact queries x n score matrix, computed a block of rows at a time"""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        scores = np.empty((len(queries), len(self)), dtype=np.float32)
+        for start in range(0, len(self), BLOCK_ROWS):
+            block = slice(start, min(start + BLOCK_ROWS, len(self)))
+            if self.scales is None:
+                scores[:, block] = queries @ np.asarray(self.vectors[block]).T
+            else:
+                scores[:, block] = (queries @ np.asarray(self.vectors[block], dtype=np.float32).T) * self.scales[block]
+        return scores
+
+    def search(self, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """(indices, scores) of the k best rows for each query, best first."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if not len(self):
+            return [(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)) for _ in queries]
+        if self.quantizer is None:
+            results = []
+            for row in self.scores(queries):
+                best = top_k(row, k)
+                results.append((best, row[best]))
+            return results
+
+        results = []
+        approximate = self.quantizer.scores(self.codes, self.quantizer.lookup_tables(queries))
+        for query, row in zip(queries, approximate):
+            candidates = np.sort(top_k(row, k * self.rerank))
+            exact = self.rows(candidates) @ query
+            best = top_k(exact, k)
+            results.append((candidates[best], exact[best]))
+        return results
+
+    def save(self, path: str) -> Dict[str, Any]:
+        """Write the store's files into the directory path; returns its meta.json fields."""
+        path = Path(path)
+        np.ascontiguousarray(self.vectors).tofile(path / 'vectors.bin')
+        meta = {"dimension": self.dimension, "count": len(self), "dtype": self.dtype}
+        if self.scales is not None:
+            np.ascontiguousarray(self.scales, dtype=np.float32).tofile(path / 'scales.bin')
+        meta.update(self.save_product_quantizer(path))
+        return meta
+
+    def save_product_quantizer(self, path: str) -> Dict[str, Any]:
+        """Write the codebooks and codes, if any; returns their meta.json fields."""
+        if self.quantizer is None:
+            return {}
+        path = Path(path)
+        np.save(path / 'pq_codebooks.npy', self.quantizer.codebooks)
+        np.ascontiguousarray(self.codes).tofile(path / 'pq_codes.bin')
+        return {"pq_subspaces": self.quantizer.subspaces}
+
+    @classmethod
+    def load(cls, path: str, meta: Dict[str, Any], mmap: bool = True, rerank: int = 10) -> 'VectorStore':
+        """Open the store files described by meta, as read-only memory maps unless mmap is False."""
+        path = Path(path)
+        count, dimension = meta['count'], meta['dimension']
+        dtype = meta.get('dtype', 'float32')
+        if dtype not in DTYPES:
+            raise ValueError(f"Unsupported vector dtype {dtype}, expected one of {DTYPES}")
+
+        def read(name: str, file_dtype: str, shape: Tuple[int, ...]) -> np.ndarray:
+            if not count:
+                return np.zeros(shape, dtype=file_dtype)
+            if mmap:
+                return np.memmap(path / name, dtype=file_dtype, mode='r', shape=shape)
+            return np.fromfile(path / name, dtype=file_dtype).reshape(shape)
+
+        vectors = read('vectors.bin', dtype, (count, dimension))
+        scales = read('scales.bin', 'float32', (count,)) if dtype == 'int8' else None
+        quantizer = codes = None
+        if meta.get('pq_subspaces'):
+            quantizer = ProductQuantizer(np.load(path / 'pq_codebooks.npy'))
+            # Codes are scanned in full by every search, so keep them in memory
+            codes = np.fromfile(path / 'pq_codes.bin', dtype=np.uint8).reshape(meta['pq_subspaces'], count)
+        return cls(vectors, scales, quantizer, codes, rerank=rerank)
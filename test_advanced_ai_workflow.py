@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Tests for the HTTP server.
+"""
+
+import json
+import socket
+import threading
+import time
+
+import requests
+
+import advanced_ai_workflow as workflow
+from scripts.stub_backends import server_url, start_stub_ollama
+
+def start_server(max_workers=8, max_queue=32):
+    server = workflow.BoundedThreadPoolHTTPServer(('127.0.0.1', 0), workflow.AdvancedAIHandler,
+                                                  max_workers=max_workers, max_queue=max_queue)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def stop_server(server):
+    server.shutdown()
+    server.server_close()
+
+def test_connections_beyond_the_queue_get_503():
+    server = start_server(max_workers=1, max_queue=0)
+    # A client that connects and sends nothing holds the only worker
+    silent = socket.create_connection(server.server_address)
+    try:
+        deadline = time.time() + 2
+        while server.busy < 1 and time.time() < deadline:
+            time.sleep(0.01)
+        assert server.busy == 1
+        response = requests.get(server_url(server) + '/health', timeout=2)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert response.json() == {'error': 'Server busy, try again later'}
+    finally:
+        silent.close()
+        stop_server(server)
+
+def test_batch_answers_in_query_order(monkeypatch):
+    ollama = start_stub_ollama(latency=0.01, token_rate=1000, response_tokens=4)
+    monkeypatch.setitem(workflow.CONFIG['llm'], 'base_url', server_url(ollama))
+    monkeypatch.setitem(workflow.CONFIG['search'], 'backend', 'lexical')
+    server = start_server()
+    try:
+        queries = ["what is machine learning", "find documents about machine learning", "summarize computer vision"]
+        response = requests.post(server_url(server) + '/query/batch',
+                                 json={'queries': queries, 'cache': False, 'parallelism': 2}, timeout=30)
+        assert response.status_code == 200
+        results = response.json()['results']
+        assert [result['query'] for result in results] == queries
+        assert [result['type'] for result in results] == ['general', 'search', 'summarize']
+    finally:
+        stop_server(server)
+        ollama.shutdown()
+
+def test_batch_rejects_bad_requests():
+    server = start_server()
+    try:
+        url = server_url(server) + '/query/batch'
+        for body in ({'queries': []}, {'queries': ["ok", 3]},
+                     {'queries': ["ok"], 'parallelism': 0}, {'queries': ["ok"], 'parallelism': "many"}):
+            response = requests.post(url, data=json.dumps(body), timeout=5)
+            assert response.status_code == 400, body
+            assert 'error' in response.json()
+    finally:
+        stop_server(server)
+
+def test_map_summaries_are_memoized_per_document(monkeypatch):
+    prompts = []
+
+    async def fake_call_llm_async(prompt, system_prompt=None, on_token=None, use_cache=True, model=None,
+                                  session=None, keep_context=True):
+        prompts.append((prompt, model))
+        if not prompt.startswith(workflow.SECTION_SUMMARY_PROMPT):
+            return "merged summary"
+        sections = prompt.split("\n\n")[1:]
+        return "\n".join(f"{section.split()[0]} summary of {section.split()[1]}" for section in sections)
+
+    monkeypatch.setattr(workflow, 'call_llm_async', fake_call_llm_async)
+    monkeypatch.setattr(workflow, 'SUMMARY_MEMO', workflow.MemoryCache(max_entries=100, ttl=0))
+    # Room for two documents per map call
+    monkeypatch.setitem(workflow.CONFIG['summarize'], 'context_tokens', 1024 + 250)
+    monkeypatch.setitem(workflow.CONFIG['llm'], 'model', 'large')
+    monkeypatch.setitem(workflow.CONFIG['llm'], 'small_model', None)
+
+    def documents(*names):
+        return [{"id": name, "title": name, "content": f"{name} " + "text " * 80} for name in names]
+
+    def summarize(*names):
+        prompts.clear()
+        return workflow.ENGINE.run(workflow.map_reduce_summarize_query("summarize", documents(*names)))
+
+    result = summarize("alpha", "beta", "gamma")
+    assert result["response"] == "merged summary"
+    assert result["metadata"]["map_reduce"]["memoized_summaries"] == 0
+    assert len(prompts) == 3
+
+    # Batches differ from the first run, but only delta needs summarizing
+    result = summarize("beta", "delta", "alpha")
+    assert result["metadata"]["map_reduce"]["memoized_summaries"] == 2
+    map_prompts = [prompt for prompt, _ in prompts if prompt.startswith(workflow.SECTION_SUMMARY_PROMPT)]
+    assert len(map_prompts) == 1 and "[1] delta" in map_prompts[0] and "alpha" not in map_prompts[0]
+
+    # Summaries written by another model aren't reused
+    monkeypatch.setitem(workflow.CONFIG['llm'], 'model', 'other')
+    result = summarize("alpha", "beta")
+    assert result["metadata"]["map_reduce"]["memoized_summaries"] == 0
+    assert all(model == 'other' for prompt, model in prompts if prompt.startswith(workflow.SECTION_SUMMARY_PROMPT))
+
+def test_sessions_only_continue_with_issued_ids(monkeypatch):
+    ollama = start_stub_ollama(latency=0.01, token_rate=1000, response_tokens=4)
+    monkeypatch.setitem(workflow.CONFIG['llm'], 'base_url', server_url(ollama))
+    server = start_server()
+    try:
+        url = server_url(server) + '/query'
+        started = requests.post(url, json={'query': "hello there", 'session': True}, timeout=30)
+        assert started.status_code == 200
+        session_id = started.json()['metadata']['session']['id']
+
+        continued = requests.post(url, json={'query': "and then?", 'session_id': session_id}, timeout=30)
+        assert continued.status_code == 200
+        assert continued.json()['metadata']['session']['id'] == session_id
+
+        unknown = requests.post(url, json={'query': "hi", 'session_id': "chosen-by-client"}, timeout=30)
+        assert unknown.status_code == 404
+        assert workflow.SESSIONS.get("chosen-by-client") is None
+    finally:
+        stop_server(server)
+        ollama.shutdown()